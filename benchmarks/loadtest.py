@@ -0,0 +1,420 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Load-test harness replaying JSONL request records against the API.
+
+Each line of the records file describes one request:
+
+    {"method": "POST", "path": "/api/v1/audio",
+     "data": {"source_lang": "en"}, "files": {"file": {"synthetic_bytes": 1048576}}}
+
+Supported keys are `method`, `path`, `params`, `data` (form fields), `json`,
+`headers` and `files`, whose values are either a path to a local file or
+`{"synthetic_bytes": N, "filename": "..."}`. Synthetic files get a random prefix on
+every request, so they are not served by the result cache. Records are replayed
+round-robin.
+
+The app runs either in-process through an ASGI transport, with its lifespan and a
+stand-in engine replacing `ExampleService`, or is reached over HTTP with `--url`.
+
+Two load models are available:
+    - closed loop (`--concurrency N`): N clients send requests back to back.
+    - open loop (`--rate R`): requests are started at R per second, whatever the
+      response times. The queueing delay is the lag between the scheduled and the
+      actual start of a request.
+
+Usage:
+    PYTHONPATH=src python benchmarks/loadtest.py benchmarks/requests.example.jsonl \
+        --concurrency 16 --requests 500 --output before.json
+    PYTHONPATH=src python benchmarks/loadtest.py benchmarks/requests.example.jsonl \
+        --rate 50 --duration 30 --url http://localhost:5001 --output after.json
+    python benchmarks/loadtest.py --compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+from contextlib import AsyncExitStack
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+
+@dataclass
+class Sample:
+    """Timing and outcome of one request."""
+
+    scheduled_at: float
+    started_at: float
+    finished_at: float
+    status: int
+    error: Optional[str] = None
+
+    @property
+    def latency(self) -> float:
+        """Time between the start of the request and the end of the response."""
+        return self.finished_at - self.started_at
+
+    @property
+    def queueing_delay(self) -> float:
+        """Time between the scheduled and the actual start of the request."""
+        return self.started_at - self.scheduled_at
+
+
+class StubService:
+    """Stand-in for the inference engine, with a configurable latency."""
+
+    def __init__(self, base_latency: float, per_item_latency: float) -> None:
+        """
+        Initialize the stub.
+
+        Args:
+            base_latency (float): Fixed latency of a batch, in seconds.
+            per_item_latency (float): Additional latency per input of a batch.
+        """
+        self.base_latency = base_latency
+        self.per_item_latency = per_item_latency
+
+    async def process_batch(self, batch: List[Tuple[Any, Any]]) -> List[Any]:
+        """Return an empty result for each input after the simulated latency."""
+        from my_project.models import Example
+
+        await asyncio.sleep(self.base_latency + self.per_item_latency * len(batch))
+
+        return [
+            Example(utterances=[], audio_duration=0.0, **data.model_dump())
+            for _, data in batch
+        ]
+
+
+def load_records(path: str) -> List[Dict[str, Any]]:
+    """Load and validate the request records."""
+    records = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            if "path" not in record:
+                raise ValueError(f"{path}:{line_number}: the record has no `path`.")
+            records.append(record)
+
+    if not records:
+        raise ValueError(f"{path} has no request records.")
+
+    return records
+
+
+def _build_files(files: Dict[str, Any]) -> Dict[str, Tuple[str, bytes, bool]]:
+    """Load the files of a record as (filename, content, synthetic) tuples."""
+    built = {}
+    for field, spec in files.items():
+        if isinstance(spec, str):
+            with open(spec, "rb") as f:
+                built[field] = (os.path.basename(spec), f.read(), False)
+        else:
+            built[field] = (
+                spec.get("filename", "audio.wav"),
+                os.urandom(spec["synthetic_bytes"]),
+                True,
+            )
+
+    return built
+
+
+def _request_files(files: Dict[str, Tuple[str, bytes, bool]]) -> Dict[str, tuple]:
+    """Salt the synthetic files, so each request has a distinct content to process."""
+    return {
+        field: (filename, os.urandom(16) + content if synthetic else content)
+        for field, (filename, content, synthetic) in files.items()
+    }
+
+
+def _build_requests(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn the records into `httpx.AsyncClient.request` keyword arguments."""
+    requests = []
+    for record in records:
+        kwargs = {
+            "method": record.get("method", "GET"),
+            "url": record["path"],
+            "params": record.get("params"),
+            "data": record.get("data"),
+            "json": record.get("json"),
+            "headers": record.get("headers"),
+        }
+        if record.get("files"):
+            kwargs["files"] = _build_files(record["files"])
+        requests.append(kwargs)
+
+    return requests
+
+
+async def _send(
+    client: httpx.AsyncClient, request: Dict[str, Any], scheduled_at: float
+) -> Sample:
+    if "files" in request:
+        request = {**request, "files": _request_files(request["files"])}
+
+    started_at = time.perf_counter()
+    try:
+        response = await client.request(**request)
+        status, error = response.status_code, None
+        if status >= 400:
+            error = f"HTTP {status}"
+    except Exception as e:
+        status, error = 0, type(e).__name__
+
+    return Sample(scheduled_at, started_at, time.perf_counter(), status, error)
+
+
+async def run_closed_loop(
+    client: httpx.AsyncClient,
+    requests: List[Dict[str, Any]],
+    concurrency: int,
+    total: int,
+) -> List[Sample]:
+    """Send `total` requests from `concurrency` clients sending back to back."""
+    cycle = itertools.cycle(requests)
+    remaining = itertools.count()
+    samples: List[Sample] = []
+
+    async def _client() -> None:
+        while next(remaining) < total:
+            samples.append(await _send(client, next(cycle), time.perf_counter()))
+
+    await asyncio.gather(*(_client() for _ in range(concurrency)))
+
+    return samples
+
+
+async def run_open_loop(
+    client: httpx.AsyncClient,
+    requests: List[Dict[str, Any]],
+    rate: float,
+    duration: float,
+    poisson: bool,
+) -> List[Sample]:
+    """Start requests at a fixed (or Poisson) arrival rate for `duration` seconds."""
+    cycle = itertools.cycle(requests)
+    tasks = []
+    start = time.perf_counter()
+    scheduled_at = start
+
+    while scheduled_at < start + duration:
+        delay = scheduled_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(_send(client, next(cycle), scheduled_at)))
+        scheduled_at += random.expovariate(rate) if poisson else 1 / rate
+
+    return list(await asyncio.gather(*tasks))
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, round(percentile / 100 * len(values)) - 1))
+
+    return values[rank]
+
+
+def summarize(samples: List[Sample]) -> Dict[str, Any]:
+    """Compute the throughput, latency, queueing delay and error statistics."""
+    if not samples:
+        return {"requests": 0}
+
+    latencies = sorted(sample.latency for sample in samples)
+    delays = sorted(sample.queueing_delay for sample in samples)
+    elapsed = max(s.finished_at for s in samples) - min(s.started_at for s in samples)
+    errors = [sample for sample in samples if sample.error is not None]
+
+    return {
+        "requests": len(samples),
+        "elapsed": elapsed,
+        "throughput": len(samples) / elapsed if elapsed > 0 else 0.0,
+        "latency": {
+            "mean": sum(latencies) / len(latencies),
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "max": latencies[-1],
+        },
+        "queueing_delay": {
+            "mean": sum(delays) / len(delays),
+            "p50": _percentile(delays, 50),
+            "p99": _percentile(delays, 99),
+            "max": delays[-1],
+        },
+        "error_rate": len(errors) / len(samples),
+        "errors": {
+            error: sum(1 for sample in errors if sample.error == error)
+            for error in sorted({sample.error for sample in errors})
+        },
+    }
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    """Print a run summary."""
+    if not summary["requests"]:
+        print("No request was sent.")
+        return
+
+    latency, delay = summary["latency"], summary["queueing_delay"]
+    print(f"requests      {summary['requests']} in {summary['elapsed']:.2f} secs")
+    print(f"throughput    {summary['throughput']:.2f} req/s")
+    print(
+        "latency (ms)  "
+        + "  ".join(f"{name} {value * 1000:.2f}" for name, value in latency.items())
+    )
+    print(
+        "queueing (ms) "
+        + "  ".join(f"{name} {value * 1000:.2f}" for name, value in delay.items())
+    )
+    print(f"error rate    {summary['error_rate']:.2%} {summary['errors'] or ''}")
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """Print the relative change of the main statistics between two runs."""
+    with open(before_path) as f:
+        before = json.load(f)["summary"]
+    with open(after_path) as f:
+        after = json.load(f)["summary"]
+
+    rows = [("throughput", before["throughput"], after["throughput"])]
+    rows += [
+        (f"latency {name}", before["latency"][name], after["latency"][name])
+        for name in ("p50", "p95", "p99", "max")
+    ]
+    rows += [
+        (
+            f"queueing {name}",
+            before["queueing_delay"][name],
+            after["queueing_delay"][name],
+        )
+        for name in ("p50", "p99")
+    ]
+    rows.append(("error rate", before["error_rate"], after["error_rate"]))
+
+    print(f"{'':<16}{'before':>14}{'after':>14}{'change':>12}")
+    for name, old, new in rows:
+        change = f"{(new - old) / old:+.1%}" if old else "n/a"
+        print(f"{name:<16}{old:>14.4f}{new:>14.4f}{change:>12}")
+
+
+async def _in_process_client(
+    stack: AsyncExitStack, args: argparse.Namespace
+) -> httpx.AsyncClient:
+    """Start the app with its lifespan and the stand-in engine, and return a client."""
+    from my_project import dependencies
+    from my_project.main import app
+
+    await stack.enter_async_context(app.router.lifespan_context(app))
+    dependencies.batching_engine.batch_fn = StubService(
+        args.stub_latency, args.stub_per_item_latency
+    ).process_batch
+
+    transport = httpx.ASGITransport(app=app)
+
+    return await stack.enter_async_context(
+        httpx.AsyncClient(transport=transport, base_url="http://loadtest")
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run the load test and save the results."""
+    requests = _build_requests(load_records(args.records))
+
+    async with AsyncExitStack() as stack:
+        if args.url:
+            client = await stack.enter_async_context(
+                httpx.AsyncClient(
+                    base_url=args.url,
+                    timeout=args.timeout,
+                    limits=httpx.Limits(max_connections=None),
+                )
+            )
+        else:
+            client = await _in_process_client(stack, args)
+
+        if args.rate:
+            samples = await run_open_loop(
+                client, requests, args.rate, args.duration, args.poisson
+            )
+        else:
+            samples = await run_closed_loop(
+                client, requests, args.concurrency, args.requests
+            )
+
+    summary = summarize(samples)
+    print_summary(summary)
+
+    if args.output:
+        config = {
+            key: value
+            for key, value in vars(args).items()
+            if key not in {"compare", "output"}
+        }
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "config": config,
+                    "summary": summary,
+                    "samples": (
+                        [asdict(sample) for sample in samples]
+                        if args.save_samples
+                        else []
+                    ),
+                },
+                f,
+                indent=2,
+            )
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("records", nargs="?", help="JSONL file of request records.")
+    parser.add_argument("--url", help="Base url of a running server, or in-process.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Closed-loop users.")
+    parser.add_argument("--requests", type=int, default=200, help="Closed-loop total.")
+    parser.add_argument("--rate", type=float, help="Open-loop arrival rate, in req/s.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Open-loop secs.")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals.")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    parser.add_argument("--stub-per-item-latency", type=float, default=0.005)
+    parser.add_argument("--output", help="JSON file to save the results to.")
+    parser.add_argument("--save-samples", action="store_true")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif not args.records:
+        parser.error("the records file is required unless --compare is used")
+    else:
+        asyncio.run(main(args))
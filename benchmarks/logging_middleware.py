@@ -0,0 +1,169 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Benchmark of the per-request overhead of the logging middleware.
+
+Compares a bare application with the legacy `BaseHTTPMiddleware` implementation and
+the current pure ASGI `LoggingMiddleware`, on a logged POST route and an excluded
+`/healthz` route. Requests are driven directly through the ASGI interface, so the
+numbers only include the middleware and routing work.
+
+Usage:
+    PYTHONPATH=src python benchmarks/logging_middleware.py --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Dict
+
+from loguru import logger
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from starlette.types import ASGIApp
+
+from my_project.logging import LoggingMiddleware
+
+
+class LegacyLoggingMiddleware(BaseHTTPMiddleware):
+    """The `BaseHTTPMiddleware` implementation the pure ASGI middleware replaced."""
+
+    async def dispatch(
+        self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
+    ) -> Response:
+        """Dispatch a request and log it, along with the response."""
+        start_time = time.time()
+        tracing_id = uuid.uuid4()
+
+        if request.method == "POST":
+            logger.info(f"Task [{tracing_id}] | {request.method} {request.url}")
+        else:
+            logger.info(f"{request.method} {request.url}")
+
+        response = await call_next(request)
+
+        process_time = time.time() - start_time
+        logger.info(
+            f"Task [{tracing_id}] | Status: {response.status_code}, Time:"
+            f" {process_time:.4f} secs"
+        )
+
+        return response
+
+
+async def _endpoint(request: Request) -> JSONResponse:
+    return JSONResponse({"status": "ok"})
+
+
+def _build_app() -> Starlette:
+    return Starlette(
+        routes=[
+            Route("/healthz", _endpoint, methods=["GET"]),
+            Route("/api/v1/audio", _endpoint, methods=["POST"]),
+        ]
+    )
+
+
+async def _call(app: ASGIApp, method: str, path: str) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("localhost", 5001),
+    }
+
+    request_sent = False
+    response_done = asyncio.Event()
+
+    async def receive() -> dict:
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            response_done.set()
+
+    await app(scope, receive, send)
+
+
+async def _measure(app: ASGIApp, method: str, path: str, requests: int) -> float:
+    for _ in range(min(requests, 1000)):
+        await _call(app, method, path)
+
+    start_time = time.perf_counter()
+    for _ in range(requests):
+        await _call(app, method, path)
+
+    return (time.perf_counter() - start_time) / requests * 1e6
+
+
+async def main(requests: int) -> None:
+    """Run the benchmark and print the mean time per request, in microseconds."""
+    apps: Dict[str, ASGIApp] = {
+        "no middleware": _build_app(),
+        "BaseHTTPMiddleware": LegacyLoggingMiddleware(_build_app()),
+        "pure ASGI": LoggingMiddleware(
+            _build_app(), debug_mode=False, exclude_paths=["/healthz"]
+        ),
+    }
+    # Keep the log formatting cost, but drop the output
+    logger.remove()
+    logger.add(lambda _: None, level="INFO")
+
+    results = {}
+    for name, app in apps.items():
+        results[name] = {
+            route: await _measure(app, method, route, requests)
+            for method, route in (("POST", "/api/v1/audio"), ("GET", "/healthz"))
+        }
+
+    baseline = results["no middleware"]
+    print(f"{'':<20}{'POST /api/v1/audio':>24}{'GET /healthz':>24}")
+    for name, timings in results.items():
+        row = "".join(
+            f"{timings[route]:>10.1f} us (+{timings[route] - baseline[route]:>6.1f})"
+            for route in ("/api/v1/audio", "/healthz")
+        )
+        print(f"{name:<20}{row}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests))
@@ -0,0 +1,161 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Benchmark of the serialization of large transcripts.
+
+Compares, on `ExampleResponse` objects with an increasing number of utterances, the
+previous and current ways to build and encode:
+
+- the response of the sync endpoint: previously a new validated `ExampleResponse`,
+  then the FastAPI `response_model` serialization and `json.dumps`; now a
+  constructed `ExampleResponse` rendered by `FastJSONResponse`.
+- the body of the S3 objects: previously `model_dump` encoded incrementally by
+  `json.JSONEncoder`; now `serialization.dumps`.
+
+Reports the mean time and the peak memory allocated by each path.
+
+Usage:
+    PYTHONPATH=src python benchmarks/serialization.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple, Union
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from my_project.models import Example, ExampleResponse
+from my_project.serialization import FastJSONResponse, dumps
+
+RESPONSE_FIELD = create_response_field(
+    "Response_inference_with_audio", Union[ExampleResponse, str]
+)
+
+
+def _example(size: int) -> Example:
+    """Build a result with `size` utterances of about 80 characters."""
+    return Example(
+        utterances=[
+            f"Utterance {i} of the transcript, with about as many words as a real one."
+            for i in range(size)
+        ],
+        audio_duration=size * 4.0,
+        offset_start=None,
+        offset_end=None,
+        num_speakers=2,
+        diarization=True,
+        source_lang="en",
+        timestamps="s",
+        vocab=None,
+        word_timestamps=False,
+        internal_vad=False,
+        repetition_penalty=1.2,
+        compression_ratio_threshold=2.4,
+        log_prob_threshold=-1.0,
+        no_speech_threshold=0.6,
+        condition_on_previous_text=True,
+    )
+
+
+def legacy_response(result: Example) -> bytes:
+    """Build and encode the response like the endpoint and FastAPI previously did."""
+    response = ExampleResponse(**result.model_dump(), multi_channel=False)
+    content = asyncio.run(
+        serialize_response(field=RESPONSE_FIELD, response_content=response)
+    )
+
+    return JSONResponse(content).body
+
+
+def current_response(result: Example) -> bytes:
+    """Build and encode the response like the endpoint now does."""
+    response = ExampleResponse.model_construct(**dict(result), multi_channel=False)
+
+    return FastJSONResponse(response).body
+
+
+def legacy_s3_body(result: Example) -> bytes:
+    """Encode an S3 object like the S3 service previously did."""
+    encoder = json.JSONEncoder()
+    buffer = bytearray()
+    for chunk in encoder.iterencode(result.model_dump(mode="json")):
+        buffer += chunk.encode("UTF-8")
+
+    return bytes(buffer)
+
+
+def current_s3_body(result: Example) -> bytes:
+    """Encode an S3 object like the S3 service now does."""
+    return dumps(result)
+
+
+def _measure(func: Callable[[Example], bytes], result: Example, repeat: int) -> Tuple:
+    """Return the mean time in seconds and the peak allocation in bytes of a path."""
+    func(result)
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        func(result)
+    elapsed = (time.perf_counter() - start_time) / repeat
+
+    tracemalloc.start()
+    func(result)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main(sizes: List[int], repeat: int) -> None:
+    """Run the benchmark and print the results."""
+    paths: Dict[str, Tuple[Callable, Callable]] = {
+        "sync response": (legacy_response, current_response),
+        "S3 body": (legacy_s3_body, current_s3_body),
+    }
+
+    print(f"{'':<14}{'utterances':>11}{'JSON size':>12}{'previous':>24}{'current':>24}")
+    for name, (legacy, current) in paths.items():
+        for size in sizes:
+            result = _example(size)
+            if json.loads(legacy(result)) != json.loads(current(result)):
+                raise AssertionError(f"The {name} paths encode different documents.")
+
+            row = "".join(
+                f"{elapsed * 1000:>10.1f} ms {peak / 2**20:>7.1f} MiB"
+                for elapsed, peak in (
+                    _measure(legacy, result, repeat),
+                    _measure(current, result, repeat),
+                )
+            )
+            print(f"{name:<14}{size:>11}{len(current(result)) / 2**20:>8.1f} MiB{row}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    main(args.sizes, args.repeat)
@@ -0,0 +1,236 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Benchmark of the cold start of the API.
+
+Measures, in fresh interpreters:
+
+- the import time of `my_project.main`, with the modules that dominate it, as
+  reported by `python -X importtime`.
+- the peak resident memory of the interpreter once `my_project.main` is imported.
+- the time to the first successful request: from the launch of a uvicorn server
+  to the first 200 response of `/readyz`, which includes the lifespan startup and
+  the warmup.
+
+Also checks that the heavy optional SDKs are not imported at startup, since they are
+loaded on first use. Exits with a non-zero status when a budget is exceeded, so it
+guards against regressions in CI. The default budgets leave room for slow CI runners.
+
+Usage:
+    PYTHONPATH=src python benchmarks/startup.py --import-budget-ms 500 \
+        --rss-budget-mb 100 --ready-budget-ms 2000
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess  # noqa: S404
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Tuple
+
+# Modules that must be imported lazily, on first use
+LAZY_MODULES = ("boto3", "botocore", "svix", "aiohttp")
+
+
+def _env(tmp_dir: str) -> Dict[str, str]:
+    """Environment of the measured processes, with their state in a temp dir."""
+    return {
+        **os.environ,
+        "JOB_STORE_PATH": os.path.join(tmp_dir, "jobs.db"),
+        "RESULT_CACHE_DIR": "",
+    }
+
+
+def measure_import(env: Dict[str, str]) -> Tuple[float, Dict[str, float]]:
+    """
+    Import `my_project.main` with `-X importtime`.
+
+    Returns:
+        Tuple[float, Dict[str, float]]: The total import time and the cumulative
+            time of each module, in milliseconds.
+    """
+    process = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", "import my_project.main"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    cumulative: Dict[str, float] = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, value, name = line.split("|")
+        cumulative[name.strip()] = int(value) / 1000
+
+    return cumulative["my_project.main"], cumulative
+
+
+def inspect_imported(env: Dict[str, str]) -> Tuple[List[str], float]:
+    """
+    Import `my_project.main` and inspect the interpreter.
+
+    Returns:
+        Tuple[List[str], float]: The lazy modules that were imported, and the peak
+            resident memory of the interpreter, in MiB.
+    """
+    code = (
+        "import resource, sys, my_project.main;"
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss);"
+        f"print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    process = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    max_rss, imported = process.stdout.split("\n", 1)
+
+    # The peak resident memory is in bytes on macOS, and in KiB elsewhere
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+    return imported.split(), int(max_rss) / scale
+
+
+def _free_port() -> int:
+    """Return a free TCP port on the loopback interface."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(env: Dict[str, str], timeout: float) -> float:
+    """
+    Launch a uvicorn server and poll `/readyz` until it succeeds.
+
+    Returns:
+        float: The time to the first successful request, in milliseconds.
+    """
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/readyz"
+
+    start_time = time.perf_counter()
+    process = subprocess.Popen(  # noqa: S603
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "my_project.main:app",
+            "--host=127.0.0.1",
+            f"--port={port}",
+            "--log-level=warning",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        while time.perf_counter() - start_time < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"The server exited with code {process.returncode}.")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:  # noqa: S310
+                    if response.status == 200:
+                        return (time.perf_counter() - start_time) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+
+        raise TimeoutError(f"The server did not answer within {timeout} secs.")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(args: argparse.Namespace) -> int:
+    """Run the benchmark and return the exit status."""
+    failures = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = _env(tmp_dir)
+
+        import_times, cumulative = [], {}
+        for _ in range(args.repeat):
+            total, cumulative = measure_import(env)
+            import_times.append(total)
+
+        import_time = statistics.median(import_times)
+        print(f"import my_project.main: {import_time:.1f} ms (median of {args.repeat})")
+        top_modules = sorted(
+            (item for item in cumulative.items() if "." not in item[0]),
+            key=lambda item: item[1],
+            reverse=True,
+        )[: args.top]
+        for name, elapsed in top_modules:
+            print(f"  {name:<30}{elapsed:>10.1f} ms")
+
+        imported, rss = inspect_imported(env)
+        print(f"peak memory after import: {rss:.1f} MiB")
+        if imported:
+            failures.append(f"modules imported at startup: {', '.join(imported)}")
+
+        ready_times = [
+            measure_first_request(env, args.timeout) for _ in range(args.repeat)
+        ]
+        ready_time = statistics.median(ready_times)
+        print(f"time to first request: {ready_time:.1f} ms (median of {args.repeat})")
+
+    if args.import_budget_ms and import_time > args.import_budget_ms:
+        failures.append(
+            f"import time {import_time:.1f} ms > budget {args.import_budget_ms} ms"
+        )
+    if args.rss_budget_mb and rss > args.rss_budget_mb:
+        failures.append(f"peak memory {rss:.1f} MiB > budget {args.rss_budget_mb} MiB")
+    if args.ready_budget_ms and ready_time > args.ready_budget_ms:
+        failures.append(
+            f"time to first request {ready_time:.1f} ms > budget"
+            f" {args.ready_budget_ms} ms"
+        )
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Top-level modules shown.")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--import-budget-ms", type=float, default=1000, help="0 to disable."
+    )
+    parser.add_argument(
+        "--rss-budget-mb", type=float, default=150, help="0 to disable."
+    )
+    parser.add_argument(
+        "--ready-budget-ms", type=float, default=5000, help="0 to disable."
+    )
+
+    sys.exit(main(parser.parse_args()))
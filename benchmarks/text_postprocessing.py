@@ -0,0 +1,156 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Benchmark of the utterance text post-processing.
+
+Compares the time to format a transcript with the previous per-utterance functions,
+the current batch function, and the batch function offloaded to the CPU executor,
+which also measures the event loop time left to the other requests. The outputs of
+the previous and current functions are compared in `tests/test_utils.py`.
+
+Usage:
+    PYTHONPATH=src python benchmarks/text_postprocessing.py --sizes 100 1000
+"""
+
+import argparse
+import asyncio
+import random
+import re
+import time
+from typing import List, Optional
+
+from my_project.executors import cpu_executor
+from my_project.utils import format_utterances
+
+WORDS = (
+    "so i think i mean the model ... is , like , okay ? yes ! well : hmm ; i'm fine ."
+    " it's i.e. hi"
+).split(" ")
+
+
+def legacy_is_empty_string(text: str):
+    """The previous implementation of `is_empty_string`."""
+    text = text.replace(".", "")
+    text = re.sub(r"\s+", "", text)
+    if text.strip():
+        return False
+    return True
+
+
+def legacy_format_punct(text: str):
+    """The previous implementation of `format_punct`."""
+    text = text.strip()
+
+    if text[0].islower():
+        text = text[0].upper() + text[1:]
+    if text[-1] not in [".", "?", "!", ":", ";", ","]:
+        text += "."
+
+    text = text.replace("...", "")
+    text = text.replace(" ?", "?")
+    text = text.replace(" !", "!")
+    text = text.replace(" .", ".")
+    text = text.replace(" ,", ",")
+    text = text.replace(" :", ":")
+    text = text.replace(" ;", ";")
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\bi\b", "I", text)
+
+    return text.strip()
+
+
+def legacy_format_utterances(texts: List[str]) -> List[Optional[str]]:
+    """Format a transcript one utterance at a time with the previous functions."""
+    return [
+        None if legacy_is_empty_string(text) else legacy_format_punct(text)
+        for text in texts
+    ]
+
+
+def _transcript(size: int, rng: random.Random) -> List[str]:
+    """Generate a transcript of utterances of 5 to 40 words."""
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        for _ in range(size)
+    ]
+
+
+async def _measure_offloaded(texts: List[str], repeat: int) -> tuple:
+    """Return the mean wall time of the offloaded batch and the longest loop stall."""
+    max_stall = 0.0
+    running = True
+
+    async def _ticker() -> None:
+        nonlocal max_stall
+        while running:
+            tick = time.perf_counter()
+            await asyncio.sleep(0)
+            max_stall = max(max_stall, time.perf_counter() - tick)
+
+    ticker = asyncio.create_task(_ticker())
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        await cpu_executor.run(format_utterances, texts)
+    elapsed = (time.perf_counter() - start_time) / repeat
+    running = False
+    await ticker
+
+    return elapsed, max_stall
+
+
+async def benchmark(sizes: List[int], repeat: int, seed: int) -> None:
+    """Print the time to format transcripts of several sizes, in milliseconds."""
+    rng = random.Random(seed)
+    cpu_executor.start()
+    # Spawn the worker processes before measuring
+    await cpu_executor.run(format_utterances, ["warmup"])
+
+    print(
+        f"{'utterances':>10}{'legacy':>12}{'batch':>12}{'offloaded':>12}{'stall':>12}"
+    )
+    for size in sizes:
+        texts = _transcript(size, rng)
+
+        timings = []
+        for func in (legacy_format_utterances, format_utterances):
+            start_time = time.perf_counter()
+            for _ in range(repeat):
+                func(texts)
+            timings.append((time.perf_counter() - start_time) / repeat)
+
+        offloaded, stall = await _measure_offloaded(texts, repeat)
+        print(
+            f"{size:>10}"
+            + "".join(f"{t * 1000:>9.2f} ms" for t in (*timings, offloaded, stall))
+        )
+
+    cpu_executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000, 20000]
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(benchmark(args.sizes, args.repeat, args.seed))
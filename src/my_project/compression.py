@@ -0,0 +1,203 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Content-Encoding negotiation and streaming compression of the responses."""
+
+import zlib
+from typing import Callable, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from my_project.executors import io_executor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# Body chunks above this size are compressed in the I/O executor, zlib and zstandard
+# release the GIL while compressing
+OFFLOAD_SIZE = 256 * 1024
+
+
+class Compressor:
+    """Streaming compressor of one response body."""
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk and flush it, so the client can decode it right away."""
+        raise NotImplementedError
+
+    def finish(self, data: bytes) -> bytes:
+        """Compress the last chunk and end the stream."""
+        raise NotImplementedError
+
+
+class GzipCompressor(Compressor):
+    """Streaming gzip compressor."""
+
+    def __init__(self) -> None:
+        """Initialize the compressor."""
+        self._compressor = zlib.compressobj(
+            GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+        )
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk and flush it, so the client can decode it right away."""
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self, data: bytes) -> bytes:
+        """Compress the last chunk and end the stream."""
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class ZstdCompressor(Compressor):
+    """Streaming zstd compressor."""
+
+    def __init__(self) -> None:
+        """Initialize the compressor."""
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk and flush it, so the client can decode it right away."""
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self, data: bytes) -> bytes:
+        """Compress the last chunk and end the stream."""
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+# Supported encodings, by order of preference. zstd requires the optional
+# `zstandard` package
+COMPRESSORS: Dict[str, Callable[[], Compressor]] = {
+    **({"zstd": ZstdCompressor} if zstandard is not None else {}),
+    "gzip": GzipCompressor,
+}
+
+
+def select_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Select the preferred supported encoding accepted by the client.
+
+    Args:
+        accept_encoding (str): The Accept-Encoding header of the request.
+
+    Returns:
+        Optional[str]: The encoding, None if the body must not be compressed.
+    """
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+
+    for encoding in COMPRESSORS:
+        if encoding in accepted:
+            return encoding
+
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing the responses with the encoding the client accepts.
+
+    Bodies are compressed as they are sent, and each chunk is flushed so the streamed
+    responses keep their latency. Small single-message bodies and responses that are
+    already encoded are sent as is.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            app (ASGIApp): The ASGI application.
+            minimum_size (int): Minimum size in bytes of the bodies to compress.
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Compress the response if the client accepts a supported encoding."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        compressor: Optional[Compressor] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, compressor
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if "content-encoding" not in headers and (
+                    more_body or len(body) >= self.minimum_size
+                ):
+                    compressor = COMPRESSORS[encoding]()
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    del headers["Content-Length"]
+
+            if compressor is not None:
+                step = compressor.compress if more_body else compressor.finish
+                if len(body) > OFFLOAD_SIZE:
+                    body = await io_executor.run(step, body)
+                else:
+                    body = step(body)
+                message = {**message, "body": body}
+
+            if start_message is not None:
+                # The length of a single-message body is known once compressed
+                if compressor is not None and not more_body:
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+                start_message = None
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -19,7 +19,9 @@
 # and limitations under the License.
 """Configuration module."""
 
+import re
 from os import getenv
+from typing import Dict, List
 
 from dotenv import load_dotenv
 from loguru import logger
@@ -28,6 +30,9 @@ from pydantic.dataclasses import dataclass
 
 from my_project import __version__
 
+# A rate limit, as `count/seconds`
+RATE_LIMIT_PATTERN = re.compile(r"[1-9]\d*/(?=[\d.]*[1-9])\d+(\.\d+)?")
+
 
 @dataclass
 class Settings:
@@ -39,20 +44,84 @@ class Settings:
     description: str
     api_prefix: str
     debug: bool
+    # Logging configuration
+    log_exclude_paths: List[str]
+    log_sample_rate: float
+    # Server configuration
+    workers: int
+    worker_heartbeat_timeout: float
+    worker_startup_timeout: float
+    # Executors configuration
+    io_executor_workers: int
+    cpu_executor_workers: int
+    subprocess_executor_workers: int
+    # Post-processing configuration
+    postprocess_offload_threshold: int
+    # Warmup configuration
+    warmup_batch_sizes: List[int]
+    warmup_languages: List[str]
+    warmup_max_rounds: int
+    warmup_tolerance: float
+    warmup_audio_path: str
+    readiness_max_saturation: float
+    # Compression configuration
+    compression_min_size: int
+    s3_content_encoding: str
+    # Streaming configuration
+    stream_max_sessions: int
+    stream_max_pending_chunks: int
     # API authentication configuration
     username: str
     password: str
     openssl_key: str
     openssl_algorithm: str
     access_token_expire_minutes: int
+    token_cache_size: int
+    # Batching configuration
+    batch_max_size: int
+    batch_max_wait_ms: float
+    # Chunking configuration
+    chunk_duration: float
+    chunk_overlap: float
+    # Multi-channel configuration
+    multi_channel_silence_threshold_db: float
+    multi_channel_min_silence: float
+    # Upload configuration
+    upload_chunk_size: int
+    max_upload_size_mb: int
+    zero_copy_uploads: bool
+    # Result cache configuration
+    result_cache_size: int
+    result_cache_dir: str
+    result_cache_max_disk_mb: int
+    # Job queue configuration
+    job_queue_capacity: int
+    job_queue_workers: int
+    # Rate limiting configuration
+    rate_limit_client: str
+    rate_limit_routes: Dict[str, str]
+    rate_limit_backend: str
+    # Tenant scheduling configuration
+    tenant_weights: Dict[str, float]
+    tenant_max_concurrency: Dict[str, int]
+    tenant_max_queued: int
+    # Job store configuration
+    job_store_path: str
+    job_store_flush_interval_ms: float
     # AWS configuration
     aws_access_key_id: str
     aws_secret_access_key: str
     aws_storage_bucket_name: str
     aws_region_name: str
+    s3_max_concurrency: int
+    s3_multipart_threshold_mb: int
+    s3_part_size_mb: int
     # Svix configuration
     svix_api_key: str
     svix_app_id: str
+    svix_max_concurrency: int
+    svix_max_retries: int
+    svix_retry_base_delay: float
 
     @field_validator("project_name")
     def project_name_must_not_be_none(cls, value: str):  # noqa: B902, N805
@@ -94,6 +163,58 @@ class Settings:
 
         return value
 
+    @field_validator("log_exclude_paths", mode="before")
+    def log_exclude_paths_must_be_a_list(cls, value: str):  # noqa: B902, N805
+        """Split the comma-separated list of paths excluded from the logs."""
+        if isinstance(value, str):
+            return [path.strip() for path in value.split(",") if path.strip()]
+
+        return value
+
+    @field_validator("log_sample_rate")
+    def log_sample_rate_must_be_valid(cls, value: float):  # noqa: B902, N805
+        """Check that the log sample rate is valid."""
+        if not 0 <= value <= 1:
+            raise ValueError(
+                "log_sample_rate must be between 0 and 1, please verify the `.env`"
+                " file."
+            )
+
+        return value
+
+    @field_validator("workers")
+    def workers_must_be_valid(cls, value: int):  # noqa: B902, N805
+        """Check that the number of workers is valid."""
+        if value <= 0:
+            raise ValueError("workers must be positive, please verify the `.env` file.")
+
+        return value
+
+    @field_validator("worker_heartbeat_timeout", "worker_startup_timeout")
+    def worker_timeouts_must_be_valid(cls, value: float):  # noqa: B902, N805
+        """Check that the worker timeouts are valid."""
+        if value <= 0:
+            raise ValueError(
+                "worker_heartbeat_timeout and worker_startup_timeout must be positive,"
+                " please verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator(
+        "io_executor_workers", "cpu_executor_workers", "subprocess_executor_workers"
+    )
+    def executor_workers_must_be_valid(cls, value: int):  # noqa: B902, N805
+        """Check that the sizes of the executors are valid."""
+        if value <= 0:
+            raise ValueError(
+                "io_executor_workers, cpu_executor_workers and"
+                " subprocess_executor_workers must be positive, please verify the"
+                " `.env` file."
+            )
+
+        return value
+
     @field_validator("openssl_algorithm")
     def openssl_algorithm_must_be_valid(cls, value: str):  # noqa: B902, N805
         """Check that the OpenSSL algorithm is valid."""
@@ -116,6 +237,252 @@ class Settings:
 
         return value
 
+    @field_validator("batch_max_size")
+    def batch_max_size_must_be_valid(cls, value: int):  # noqa: B902, N805
+        """Check that the maximum batch size is valid."""
+        if value <= 0:
+            raise ValueError(
+                "batch_max_size must be positive, please verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("batch_max_wait_ms")
+    def batch_max_wait_ms_must_be_valid(cls, value: float):  # noqa: B902, N805
+        """Check that the maximum batch wait time is valid."""
+        if value < 0:
+            raise ValueError(
+                "batch_max_wait_ms must be positive or zero, please verify the `.env`"
+                " file."
+            )
+
+        return value
+
+    @field_validator("chunk_duration", "chunk_overlap")
+    def chunk_durations_must_be_valid(cls, value: float):  # noqa: B902, N805
+        """Check that the chunk duration and overlap are valid."""
+        if value < 0:
+            raise ValueError(
+                "chunk_duration and chunk_overlap must be positive or zero, please"
+                " verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("multi_channel_silence_threshold_db")
+    def multi_channel_silence_threshold_must_be_valid(  # noqa: B902, N805
+        cls, value: float
+    ):
+        """Check that the silence threshold is valid."""
+        if value >= 0:
+            raise ValueError(
+                "multi_channel_silence_threshold_db must be negative, in dB relative"
+                " to full scale, please verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("multi_channel_min_silence")
+    def multi_channel_min_silence_must_be_valid(cls, value: float):  # noqa: B902, N805
+        """Check that the minimum silence duration is valid."""
+        if value < 0:
+            raise ValueError(
+                "multi_channel_min_silence must be positive or zero, please verify the"
+                " `.env` file."
+            )
+
+        return value
+
+    @field_validator("job_queue_capacity", "job_queue_workers")
+    def job_queue_sizes_must_be_valid(cls, value: int):  # noqa: B902, N805
+        """Check that the job queue capacity and number of workers are valid."""
+        if value <= 0:
+            raise ValueError(
+                "job_queue_capacity and job_queue_workers must be positive, please"
+                " verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("stream_max_sessions", "stream_max_pending_chunks")
+    def stream_limits_must_be_valid(cls, value: int):  # noqa: B902, N805
+        """Check that the streaming limits are valid."""
+        if value <= 0:
+            raise ValueError(
+                "stream_max_sessions and stream_max_pending_chunks must be positive,"
+                " please verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("upload_chunk_size")
+    def upload_chunk_size_must_be_valid(cls, value: int):  # noqa: B902, N805
+        """Check that the upload chunk size is valid."""
+        if value <= 0:
+            raise ValueError(
+                "upload_chunk_size must be positive, please verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("rate_limit_client")
+    def rate_limit_client_must_be_valid(cls, value: str):  # noqa: B902, N805
+        """Check that the client rate limit is empty or a valid limit."""
+        if value and not RATE_LIMIT_PATTERN.fullmatch(value):
+            raise ValueError(
+                "rate_limit_client must be empty or a `count/seconds` limit, e.g."
+                " `120/60`, please verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("rate_limit_routes", mode="before")
+    def rate_limit_routes_must_be_a_mapping(cls, value: str):  # noqa: B902, N805
+        """Split the comma-separated list of `path=count/seconds` pairs."""
+        if isinstance(value, str):
+            pairs = [pair.split("=", 1) for pair in value.split(",") if pair.strip()]
+            if any(
+                len(pair) != 2 or not RATE_LIMIT_PATTERN.fullmatch(pair[1].strip())
+                for pair in pairs
+            ):
+                raise ValueError(
+                    "rate_limit_routes must be comma-separated `path=count/seconds`"
+                    " pairs, please verify the `.env` file."
+                )
+
+            return {path.strip(): limit.strip() for path, limit in pairs}
+
+        return value
+
+    @field_validator("rate_limit_backend")
+    def rate_limit_backend_must_be_valid(cls, value: str):  # noqa: B902, N805
+        """Check that the rate limit backend is valid."""
+        if value not in {"memory", "shared"}:
+            raise ValueError(
+                "rate_limit_backend must be `memory` or `shared`, please verify the"
+                " `.env` file."
+            )
+
+        return value
+
+    @field_validator("tenant_weights", "tenant_max_concurrency", mode="before")
+    def tenant_limits_must_be_a_mapping(cls, value: str):  # noqa: B902, N805
+        """Split the comma-separated list of `tenant=value` pairs."""
+        if isinstance(value, str):
+            pairs = [pair.split("=", 1) for pair in value.split(",") if pair.strip()]
+            if any(len(pair) != 2 for pair in pairs):
+                raise ValueError(
+                    "tenant_weights and tenant_max_concurrency must be comma-separated"
+                    " `tenant=value` pairs, please verify the `.env` file."
+                )
+
+            return {tenant.strip(): limit.strip() for tenant, limit in pairs}
+
+        return value
+
+    @field_validator("tenant_weights")
+    def tenant_weights_must_be_valid(cls, value: Dict[str, float]):  # noqa: B902, N805
+        """Check that the tenant weights are valid."""
+        if any(weight <= 0 for weight in value.values()):
+            raise ValueError(
+                "tenant_weights must be positive, please verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("tenant_max_concurrency", "tenant_max_queued")
+    def tenant_caps_must_be_valid(cls, value):  # noqa: B902, N805
+        """Check that the tenant caps are valid."""
+        caps = value.values() if isinstance(value, dict) else [value]
+        if any(cap < 0 for cap in caps):
+            raise ValueError(
+                "tenant_max_concurrency and tenant_max_queued must be positive or 0,"
+                " please verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("warmup_batch_sizes", mode="before")
+    def warmup_batch_sizes_must_be_a_list(cls, value: str):  # noqa: B902, N805
+        """Split the comma-separated list of warmup batch sizes."""
+        if isinstance(value, str):
+            return [int(size) for size in value.split(",") if size.strip()]
+
+        return value
+
+    @field_validator("warmup_batch_sizes")
+    def warmup_batch_sizes_must_be_valid(cls, value: List[int]):  # noqa: B902, N805
+        """Check that the warmup batch sizes are valid."""
+        if not value or any(size <= 0 for size in value):
+            raise ValueError(
+                "warmup_batch_sizes must be a non-empty list of positive integers,"
+                " please verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("warmup_languages", mode="before")
+    def warmup_languages_must_be_a_list(cls, value: str):  # noqa: B902, N805
+        """Split the comma-separated list of warmup languages."""
+        if isinstance(value, str):
+            return [lang.strip() for lang in value.split(",") if lang.strip()]
+
+        return value
+
+    @field_validator("warmup_languages")
+    def warmup_languages_must_not_be_empty(cls, value: List[str]):  # noqa: B902, N805
+        """Check that at least one warmup language is set."""
+        if not value:
+            raise ValueError(
+                "warmup_languages must not be empty, please verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("warmup_max_rounds")
+    def warmup_max_rounds_must_be_valid(cls, value: int):  # noqa: B902, N805
+        """Check that the maximum number of warmup rounds is valid."""
+        if value < 0:
+            raise ValueError(
+                "warmup_max_rounds must be positive or 0, please verify the `.env`"
+                " file."
+            )
+
+        return value
+
+    @field_validator("readiness_max_saturation")
+    def readiness_max_saturation_must_be_valid(cls, value: float):  # noqa: B902, N805
+        """Check that the readiness saturation threshold is valid."""
+        if not 0 < value <= 1:
+            raise ValueError(
+                "readiness_max_saturation must be between 0 (excluded) and 1, please"
+                " verify the `.env` file."
+            )
+
+        return value
+
+    @field_validator("s3_content_encoding")
+    def s3_content_encoding_must_be_valid(cls, value: str):  # noqa: B902, N805
+        """Check that the S3 content encoding is valid."""
+        if value not in {"", "gzip", "zstd"}:
+            raise ValueError(
+                "s3_content_encoding must be empty, `gzip` or `zstd`, please verify"
+                " the `.env` file."
+            )
+
+        return value
+
+    @field_validator("s3_part_size_mb")
+    def s3_part_size_mb_must_be_valid(cls, value: int):  # noqa: B902, N805
+        """Check that the S3 multipart part size is valid."""
+        if value < 5:
+            raise ValueError(
+                "s3_part_size_mb must be at least 5, the minimum part size allowed by"
+                " S3, please verify the `.env` file."
+            )
+
+        return value
+
     def __post_init__(self):
         """Post initialization checks."""
         if self.debug is False:
@@ -153,13 +520,84 @@ settings = Settings(
     ),
     api_prefix=getenv("API_PREFIX", "/api/v1"),
     debug=getenv("DEBUG", True),
+    # Logging configuration
+    log_exclude_paths=getenv("LOG_EXCLUDE_PATHS", "/healthz,/readyz,/metrics"),
+    log_sample_rate=getenv("LOG_SAMPLE_RATE", 1.0),
+    # Server configuration
+    workers=getenv("WORKERS", 1),
+    worker_heartbeat_timeout=getenv("WORKER_HEARTBEAT_TIMEOUT", 30),
+    worker_startup_timeout=getenv("WORKER_STARTUP_TIMEOUT", 300),
+    # Executors configuration
+    io_executor_workers=getenv("IO_EXECUTOR_WORKERS", 16),
+    cpu_executor_workers=getenv("CPU_EXECUTOR_WORKERS", 2),
+    subprocess_executor_workers=getenv("SUBPROCESS_EXECUTOR_WORKERS", 4),
+    # Post-processing configuration
+    postprocess_offload_threshold=getenv("POSTPROCESS_OFFLOAD_THRESHOLD", 1000),
+    # Warmup configuration
+    warmup_batch_sizes=getenv("WARMUP_BATCH_SIZES", "1,4,8"),
+    warmup_languages=getenv("WARMUP_LANGUAGES", "en"),
+    warmup_max_rounds=getenv("WARMUP_MAX_ROUNDS", 5),
+    warmup_tolerance=getenv("WARMUP_TOLERANCE", 0.1),
+    warmup_audio_path=getenv("WARMUP_AUDIO_PATH", ""),
+    readiness_max_saturation=getenv("READINESS_MAX_SATURATION", 0.9),
+    # Compression configuration
+    compression_min_size=getenv("COMPRESSION_MIN_SIZE", 1024),
+    s3_content_encoding=getenv("S3_CONTENT_ENCODING", "gzip"),
+    # Streaming configuration
+    stream_max_sessions=getenv("STREAM_MAX_SESSIONS", 16),
+    stream_max_pending_chunks=getenv("STREAM_MAX_PENDING_CHUNKS", 16),
     # API authentication configuration
     username=getenv("USERNAME", "admin"),
     password=getenv("PASSWORD", "admin"),
     openssl_key=getenv("OPENSSL_KEY", "0123456789abcdefghijklmnopqrstuvwyz"),  # Change in prod
     openssl_algorithm=getenv("OPENSSL_ALGORITHM", "HS256"),
     access_token_expire_minutes=getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30),
+    token_cache_size=getenv("TOKEN_CACHE_SIZE", 1024),
+    # Batching configuration
+    batch_max_size=getenv("BATCH_MAX_SIZE", 8),
+    batch_max_wait_ms=getenv("BATCH_MAX_WAIT_MS", 20),
+    # Chunking configuration
+    chunk_duration=getenv("CHUNK_DURATION", 600),
+    chunk_overlap=getenv("CHUNK_OVERLAP", 5),
+    # Multi-channel configuration
+    multi_channel_silence_threshold_db=getenv(
+        "MULTI_CHANNEL_SILENCE_THRESHOLD_DB", -40
+    ),
+    multi_channel_min_silence=getenv("MULTI_CHANNEL_MIN_SILENCE", 0.5),
+    # Upload configuration
+    upload_chunk_size=getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024),
+    max_upload_size_mb=getenv("MAX_UPLOAD_SIZE_MB", 150),
+    zero_copy_uploads=getenv("ZERO_COPY_UPLOADS", False),
+    # Result cache configuration
+    result_cache_size=getenv("RESULT_CACHE_SIZE", 256),
+    result_cache_dir=getenv("RESULT_CACHE_DIR", ""),
+    result_cache_max_disk_mb=getenv("RESULT_CACHE_MAX_DISK_MB", 1024),
+    # Job queue configuration
+    job_queue_capacity=getenv("JOB_QUEUE_CAPACITY", 100),
+    job_queue_workers=getenv("JOB_QUEUE_WORKERS", 10),
+    # Rate limiting configuration
+    rate_limit_client=getenv("RATE_LIMIT_CLIENT", "600/60"),
+    rate_limit_routes=getenv("RATE_LIMIT_ROUTES", ""),
+    rate_limit_backend=getenv("RATE_LIMIT_BACKEND", "memory"),
+    # Tenant scheduling configuration
+    tenant_weights=getenv("TENANT_WEIGHTS", ""),
+    tenant_max_concurrency=getenv("TENANT_MAX_CONCURRENCY", ""),
+    tenant_max_queued=getenv("TENANT_MAX_QUEUED", 50),
+    # Job store configuration
+    job_store_path=getenv("JOB_STORE_PATH", "jobs.db"),
+    job_store_flush_interval_ms=getenv("JOB_STORE_FLUSH_INTERVAL_MS", 200),
+    # AWS configuration
+    aws_access_key_id=getenv("AWS_ACCESS_KEY_ID", ""),
+    aws_secret_access_key=getenv("AWS_SECRET_ACCESS_KEY", ""),
+    aws_storage_bucket_name=getenv("AWS_STORAGE_BUCKET_NAME", ""),
+    aws_region_name=getenv("AWS_REGION_NAME", ""),
+    s3_max_concurrency=getenv("S3_MAX_CONCURRENCY", 10),
+    s3_multipart_threshold_mb=getenv("S3_MULTIPART_THRESHOLD_MB", 16),
+    s3_part_size_mb=getenv("S3_PART_SIZE_MB", 8),
     # Svix configuration
     svix_api_key=getenv("SVIX_API_KEY", ""),
     svix_app_id=getenv("SVIX_APP_ID", ""),
+    svix_max_concurrency=getenv("SVIX_MAX_CONCURRENCY", 4),
+    svix_max_retries=getenv("SVIX_MAX_RETRIES", 5),
+    svix_retry_base_delay=getenv("SVIX_RETRY_BASE_DELAY", 0.5),
 )
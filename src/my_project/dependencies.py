@@ -20,21 +20,206 @@
 """Dependencies module."""
 
 import asyncio
+import statistics
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from loguru import logger
 
 from my_project.config import settings
+from my_project.engines.batching import BatchingEngine
+from my_project.engines.chunking import ChunkingStage
+from my_project.engines.decoder import AudioDecoder
+from my_project.engines.job_queue import JobQueue
+from my_project.engines.multi_channel import MultiChannelStage
+from my_project.engines.post_processing import PostProcessingStage
+from my_project.engines.result_cache import ResultCache
+from my_project.engines.warmup import WarmupRunner
+from my_project.executors import cpu_executor, io_executor, subprocess_executor
+from my_project.metrics import (
+    DECODER_SLOT_WAIT,
+    DECODER_SLOTS_IN_USE,
+    DECODER_SLOTS_WAITING,
+    DOWNLOAD_SLOT_WAIT,
+    DOWNLOAD_SLOTS_IN_USE,
+    DOWNLOAD_SLOTS_WAITING,
+    JOB_QUEUE_WAIT,
+    InstrumentedSemaphore,
+    registry,
+)
+from my_project.models import Example
+from my_project.rate_limit import (
+    Limit,
+    MemoryBucketStore,
+    RateLimiter,
+    SharedBucketStore,
+)
 from my_project.utils import retrieve_user_platform
 from my_project.services.example_service import ExampleService
+from my_project.services.job_store import SQLiteJobStore
+from my_project.services.s3_service import S3Service
+from my_project.services.webhook_service import WebhookService
+
+# Set by the pre-fork server once the master process warmed up the service and
+# recovered the job store, so that the forked workers skip both steps
+preloaded = False
 
 # Define the maximum number of files to pre-download
-download_limit = asyncio.Semaphore(10)
+download_limit = InstrumentedSemaphore(
+    10,
+    in_use=DOWNLOAD_SLOTS_IN_USE,
+    waiting=DOWNLOAD_SLOTS_WAITING,
+    wait_time=DOWNLOAD_SLOT_WAIT,
+)
+
+# Cap the concurrent ffmpeg processes, like the blocking ones of the subprocess executor
+decoder_limit = InstrumentedSemaphore(
+    settings.subprocess_executor_workers,
+    in_use=DECODER_SLOTS_IN_USE,
+    waiting=DECODER_SLOTS_WAITING,
+    wait_time=DECODER_SLOT_WAIT,
+)
+audio_decoder = AudioDecoder(decoder_limit)
 
 # Define the ASR service to use depending on the settings
 service = ExampleService()
 
+# Limit the request rate of each client. The shared buckets are created at import
+# time, so before the pre-fork server forks the workers
+rate_limiter = RateLimiter(
+    store=(
+        SharedBucketStore()
+        if settings.rate_limit_backend == "shared"
+        else MemoryBucketStore()
+    ),
+    client_limit=(
+        Limit.parse(settings.rate_limit_client) if settings.rate_limit_client else None
+    ),
+    route_limits={
+        path: Limit.parse(limit) for path, limit in settings.rate_limit_routes.items()
+    },
+)
+
+# Bring the service to steady-state latency before reporting ready
+warmup = WarmupRunner(
+    service,
+    batch_sizes=settings.warmup_batch_sizes,
+    languages=settings.warmup_languages,
+    max_rounds=settings.warmup_max_rounds,
+    tolerance=settings.warmup_tolerance,
+    audio_path=settings.warmup_audio_path,
+)
+registry.callback_gauge(
+    "warmup_done",
+    "Whether the warmup completed and the service can report ready.",
+    lambda: float(warmup.ready),
+    aggregate=min,
+)
+
+# Cap the number of concurrent WebSocket streaming sessions
+stream_session_limit = asyncio.Semaphore(settings.stream_max_sessions)
+
+# Group concurrent compatible requests in a single call to the service
+batching_engine = BatchingEngine(
+    service.process_batch,
+    max_batch_size=settings.batch_max_size,
+    max_wait_time=settings.batch_max_wait_ms / 1000,
+)
+registry.callback_gauge(
+    "batching_pending_inputs",
+    "Number of inputs waiting to be dispatched in a batch.",
+    lambda: batching_engine.pending,
+)
+
+# Split the long inputs in windows processed concurrently by the batching engine
+chunking_stage = ChunkingStage(
+    batching_engine.submit,
+    chunk_duration=settings.chunk_duration,
+    overlap=settings.chunk_overlap,
+)
+
+# Process the channels of multi-channel inputs concurrently, in speech segments
+multi_channel_stage = MultiChannelStage(
+    audio_decoder,
+    batching_engine.submit,
+    chunking_stage.process,
+    silence_threshold_db=settings.multi_channel_silence_threshold_db,
+    min_silence=settings.multi_channel_min_silence,
+)
+
+# Format the utterances of the complete results
+post_processing_stage = PostProcessingStage(multi_channel_stage.process)
+
+# Cache the results by input content and request parameters
+result_cache = ResultCache(
+    Example,
+    memory_size=settings.result_cache_size,
+    disk_path=settings.result_cache_dir or None,
+    disk_max_bytes=settings.result_cache_max_disk_mb * 1024 * 1024,
+)
+registry.callback_gauge(
+    "result_cache_hit_ratio",
+    "Fraction of the result lookups served without processing the input.",
+    lambda: result_cache.hit_ratio,
+    aggregate=statistics.fmean,
+)
+
+# Queue the async jobs, processed by a pool of workers owned by the lifespan
+job_queue = JobQueue(
+    capacity=settings.job_queue_capacity,
+    num_workers=settings.job_queue_workers,
+    tenant_weights=settings.tenant_weights,
+    tenant_max_concurrency=settings.tenant_max_concurrency,
+    tenant_capacity=settings.tenant_max_queued,
+    wait_time=JOB_QUEUE_WAIT,
+)
+registry.callback_gauge(
+    "job_queue_depth",
+    "Number of async jobs waiting for a worker.",
+    lambda: job_queue.depth,
+)
+registry.callback_gauge(
+    "job_queue_in_flight",
+    "Number of async jobs being processed.",
+    lambda: job_queue.in_flight,
+)
+registry.callback_gauge(
+    "tenant_queue_depth",
+    "Number of async jobs waiting for a worker, by active tenant.",
+    lambda: {(tenant,): depth for tenant, depth in job_queue.tenant_depths().items()},
+    labelnames=("tenant",),
+)
+registry.callback_gauge(
+    "tenant_jobs_in_flight",
+    "Number of async jobs being processed, by active tenant.",
+    lambda: {(tenant,): n for tenant, n in job_queue.tenant_in_flight().items()},
+    labelnames=("tenant",),
+)
+
+# Record the state and result of the async jobs
+job_store = SQLiteJobStore(
+    path=settings.job_store_path,
+    flush_interval=settings.job_store_flush_interval_ms / 1000,
+)
+
+# Deliver the results to S3 off the event loop, with a single pooled client
+s3_service = S3Service(
+    bucket=settings.aws_storage_bucket_name,
+    max_concurrency=settings.s3_max_concurrency,
+    multipart_threshold=settings.s3_multipart_threshold_mb * 1024 * 1024,
+    part_size=settings.s3_part_size_mb * 1024 * 1024,
+    content_encoding=settings.s3_content_encoding,
+)
+
+# Dispatch the job status updates to Svix from background workers
+webhook_service = WebhookService(
+    api_key=settings.svix_api_key,
+    app_id=settings.svix_app_id,
+    max_concurrency=settings.svix_max_concurrency,
+    max_retries=settings.svix_max_retries,
+    retry_base_delay=settings.svix_retry_base_delay,
+)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> None:
@@ -47,7 +232,34 @@ async def lifespan(app: FastAPI) -> None:
             " https://github.com/Wordcab/wordcab-transcribe/issues"
         )
 
-    logger.info("Warmup initialization...")
-    await service.inference_warmup()
+    io_executor.start()
+    cpu_executor.start()
+    subprocess_executor.start()
+
+    await job_store.start()
+    if not preloaded:
+        await job_store.recover()
+    await result_cache.start()
+    if settings.aws_storage_bucket_name:
+        s3_service.start()
+    webhook_service.start()
+
+    job_queue.start()
+
+    # The warmup runs in the background, `/readyz` fails until it is done
+    if not preloaded:
+        logger.info("Warmup initialization...")
+        warmup.start()
 
     yield  # This is where the execution of the application starts
+
+    await warmup.close()
+    await job_queue.close()
+    await batching_engine.close()
+    s3_service.close()
+    await webhook_service.close()
+    await job_store.close()
+
+    subprocess_executor.shutdown()
+    cpu_executor.shutdown()
+    io_executor.shutdown()
@@ -0,0 +1,226 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Dynamic micro-batching engine for the inference service."""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+from loguru import logger
+
+from my_project.models import ExampleRequest
+
+# Request parameters that must be identical for two inputs to share a batch.
+BATCH_KEY_FIELDS = (
+    "source_lang",
+    "timestamps",
+    "num_speakers",
+    "diarization",
+    "vocab",
+    "word_timestamps",
+    "internal_vad",
+    "repetition_penalty",
+    "compression_ratio_threshold",
+    "log_prob_threshold",
+    "no_speech_threshold",
+    "condition_on_previous_text",
+)
+
+BatchFunction = Callable[[List[Tuple[Any, ExampleRequest]]], Awaitable[List[Any]]]
+
+
+def batch_key(data: ExampleRequest) -> Hashable:
+    """
+    Compute the compatibility key of a request.
+
+    Args:
+        data (ExampleRequest): The request parameters.
+
+    Returns:
+        Hashable: A key that is equal for requests that can be batched together.
+    """
+    key = []
+    for field_name in BATCH_KEY_FIELDS:
+        value = getattr(data, field_name)
+        key.append(tuple(value) if isinstance(value, list) else value)
+
+    return tuple(key)
+
+
+class _PendingItem:
+    """An input waiting to be batched, along with the future of its caller."""
+
+    __slots__ = ("audio", "data", "future", "enqueued_at")
+
+    def __init__(
+        self, audio: Any, data: ExampleRequest, future: asyncio.Future
+    ) -> None:
+        """Initialize the pending item."""
+        self.audio = audio
+        self.data = data
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _BatchQueue:
+    """Pending items sharing the same compatibility key."""
+
+    __slots__ = ("items", "not_empty")
+
+    def __init__(self) -> None:
+        """Initialize the batch queue."""
+        self.items: List[_PendingItem] = []
+        self.not_empty = asyncio.Event()
+
+
+class BatchingEngine:
+    """
+    Gather concurrent requests with compatible parameters into batches.
+
+    When no batch is running, pending inputs are dispatched right away so that light
+    traffic does not pay any batching delay. While the backend is busy, inputs
+    accumulate until the batch is full or the oldest input waited `max_wait_time`.
+    """
+
+    def __init__(
+        self, batch_fn: BatchFunction, max_batch_size: int, max_wait_time: float
+    ) -> None:
+        """
+        Initialize the batching engine.
+
+        Args:
+            batch_fn (BatchFunction): Coroutine processing a list of (audio, data)
+                pairs and returning one result per pair, in the same order.
+            max_batch_size (int): Maximum number of inputs in a single batch.
+            max_wait_time (float): Maximum time in seconds an input can wait for
+                the batch to fill up.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+
+        self._queues: Dict[Hashable, _BatchQueue] = {}
+        self._workers: Dict[Hashable, asyncio.Task] = {}
+        self._in_flight = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of inputs waiting to be dispatched."""
+        return sum(len(queue.items) for queue in self._queues.values())
+
+    async def submit(self, audio: Any, data: ExampleRequest) -> Any:
+        """
+        Submit an input and wait for its result.
+
+        Args:
+            audio (Any): The input to process.
+            data (ExampleRequest): The request parameters.
+
+        Returns:
+            Any: The result returned by the batch function for this input.
+        """
+        key = batch_key(data)
+        future = asyncio.get_running_loop().create_future()
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _BatchQueue()
+
+        queue.items.append(_PendingItem(audio, data, future))
+        queue.not_empty.set()
+
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._run(key, queue))
+
+        return await future
+
+    async def close(self) -> None:
+        """Cancel the running batches and fail the pending inputs."""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        for queue in self._queues.values():
+            for item in queue.items:
+                if not item.future.done():
+                    item.future.set_exception(
+                        RuntimeError("The batching engine was shut down.")
+                    )
+        self._queues.clear()
+
+    async def _collect(self, queue: _BatchQueue) -> List[_PendingItem]:
+        """Wait for the batch to fill up, then pop it from the queue."""
+        if self._in_flight > 0:
+            deadline = queue.items[0].enqueued_at + self.max_wait_time
+
+            while len(queue.items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                queue.not_empty.clear()
+                try:
+                    await asyncio.wait_for(queue.not_empty.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+        batch = queue.items[: self.max_batch_size]
+        del queue.items[: self.max_batch_size]
+
+        return [item for item in batch if not item.future.done()]
+
+    async def _run(self, key: Hashable, queue: _BatchQueue) -> None:
+        """Dispatch the batches of one compatibility key until its queue is empty."""
+        try:
+            while queue.items:
+                batch = await self._collect(queue)
+                if not batch:
+                    continue
+
+                self._in_flight += 1
+                try:
+                    results = await self.batch_fn(
+                        [(item.audio, item.data) for item in batch]
+                    )
+                    if len(results) != len(batch):
+                        raise RuntimeError(
+                            f"Batch function returned {len(results)} results for"
+                            f" {len(batch)} inputs."
+                        )
+                except asyncio.CancelledError:
+                    for item in batch:
+                        item.future.cancel()
+                    raise
+                except Exception as e:
+                    logger.error(f"Batch of {len(batch)} inputs failed: {e}")
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_exception(e)
+                else:
+                    for item, result in zip(batch, results):
+                        if not item.future.done():
+                            item.future.set_result(result)
+                finally:
+                    self._in_flight -= 1
+        finally:
+            self._workers.pop(key, None)
+            if not queue.items:
+                self._queues.pop(key, None)
@@ -0,0 +1,255 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Chunked processing of long inputs, in overlapping windows processed concurrently."""
+
+import asyncio
+import re
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+from my_project.models import Example, ExampleRequest
+from my_project.services.example_service import ProcessException
+from my_project.utils import get_audio_duration
+
+ProcessFunction = Callable[
+    [str, ExampleRequest], Awaitable[Union[Example, ProcessException]]
+]
+
+# Number of utterances at the end of a window and at the start of the next one
+# searched for the words transcribed in their overlap
+MAX_OVERLAP_UTTERANCES = 8
+# Minimum number of words the two windows must share to be aligned
+MIN_OVERLAP_WORDS = 2
+# Number of words that may be garbled at each edge of the overlap, where the audio of
+# a window is cut
+EDGE_WORDS = 1
+
+_NON_WORD_PATTERN = re.compile(r"[^\w\s]")
+
+
+def split_windows(
+    start: float, end: float, chunk_duration: float, overlap: float
+) -> List[Tuple[float, float]]:
+    """
+    Split a time range in windows of `chunk_duration` seconds, plus an overlap.
+
+    Each window starts `chunk_duration` seconds after the previous one and lasts
+    `chunk_duration + overlap` seconds, except the last one which ends at `end`.
+
+    Args:
+        start (float): Start of the range, in seconds.
+        end (float): End of the range, in seconds.
+        chunk_duration (float): Duration between the starts of two windows.
+        overlap (float): Duration shared by two consecutive windows.
+
+    Returns:
+        List[Tuple[float, float]]: The (start, end) windows, in order.
+    """
+    windows = []
+    window_start = start
+
+    while True:
+        window_end = min(window_start + chunk_duration + overlap, end)
+        windows.append((window_start, window_end))
+        if window_end >= end:
+            return windows
+        window_start += chunk_duration
+
+
+def _words(utterances: Sequence[str], offset: int = 0) -> List[Tuple[int, int, str]]:
+    """
+    The (utterance index, word index, word) of each word of the utterances.
+
+    Words are compared in lowercase and without their punctuation.
+    """
+    return [
+        (offset + utterance_index, word_index, _NON_WORD_PATTERN.sub("", word))
+        for utterance_index, utterance in enumerate(utterances)
+        for word_index, word in enumerate(utterance.lower().split())
+    ]
+
+
+def _align(tail: List[str], head: List[str]) -> Optional[Tuple[int, int]]:
+    """
+    Find the longest run of words ending the tail and starting the head.
+
+    Up to `EDGE_WORDS` words are ignored at the end of the tail and at the start of
+    the head, where the windows cut the audio.
+
+    Returns:
+        Optional[Tuple[int, int]]: The end positions of the run in the tail and in the
+            head, None if they share less than `MIN_OVERLAP_WORDS` words.
+    """
+    for size in range(min(len(tail), len(head)), MIN_OVERLAP_WORDS - 1, -1):
+        for tail_trim in range(EDGE_WORDS + 1):
+            tail_end = len(tail) - tail_trim
+            if tail_end < size:
+                continue
+
+            for head_start in range(EDGE_WORDS + 1):
+                head_end = head_start + size
+                if head_end > len(head):
+                    continue
+
+                if tail[tail_end - size : tail_end] == head[head_start:head_end]:
+                    return tail_end, head_end
+
+    return None
+
+
+def merge_utterances(chunks: Sequence[List[str]]) -> List[str]:
+    """
+    Merge the utterances of consecutive overlapping windows, in order.
+
+    The words transcribed in the overlap of two windows are aligned, then kept once:
+    the words of the next window continue the utterances of the previous one, so an
+    utterance cut by the end of a window is completed by the next window. Windows
+    sharing no words, e.g. with silence in their overlap, are concatenated.
+
+    Args:
+        chunks (Sequence[List[str]]): The utterances of each window, in order.
+
+    Returns:
+        List[str]: The merged utterances.
+    """
+    merged: List[str] = []
+
+    for chunk in chunks:
+        tail_start = max(0, len(merged) - MAX_OVERLAP_UTTERANCES)
+        tail = _words(merged[tail_start:], offset=tail_start)
+        head = _words(chunk[:MAX_OVERLAP_UTTERANCES])
+
+        aligned = _align([word for *_, word in tail], [word for *_, word in head])
+        if aligned is None:
+            merged.extend(chunk)
+            continue
+        tail_end, head_end = aligned
+
+        # Drop the garbled words ending the previous window
+        if tail_end < len(tail):
+            utterance_index, word_index, _ = tail[tail_end]
+            kept = merged[utterance_index].split()[:word_index]
+            del merged[utterance_index:]
+            if kept:
+                merged.append(" ".join(kept))
+
+        # Continue with the words following the overlap
+        if head_end == len(head):
+            merged.extend(chunk[min(len(chunk), MAX_OVERLAP_UTTERANCES) :])
+            continue
+
+        utterance_index, word_index, _ = head[head_end]
+        if word_index > 0:
+            rest = " ".join(chunk[utterance_index].split()[word_index:])
+            if merged:
+                merged[-1] = f"{merged[-1]} {rest}"
+            else:
+                merged.append(rest)
+            utterance_index += 1
+        merged.extend(chunk[utterance_index:])
+
+    return merged
+
+
+class ChunkingStage:
+    """
+    Split long inputs in overlapping windows processed concurrently.
+
+    Windows are expressed with the `offset_start` and `offset_end` of the request, so
+    the audio is not copied. They are submitted at once, so that they are processed
+    by as many engine workers as available, and batched with each other. Inputs
+    shorter than a window, or whose duration cannot be probed, are processed whole.
+    """
+
+    def __init__(
+        self, process_fn: ProcessFunction, chunk_duration: float, overlap: float
+    ) -> None:
+        """
+        Initialize the chunking stage.
+
+        Args:
+            process_fn (ProcessFunction): Coroutine processing an input.
+            chunk_duration (float): Duration of the windows, in seconds. 0 disables
+                the chunking.
+            overlap (float): Duration shared by two consecutive windows, in seconds.
+        """
+        self.process_fn = process_fn
+        self.chunk_duration = chunk_duration
+        self.overlap = overlap
+
+    async def process(
+        self, audio: str, data: ExampleRequest
+    ) -> Union[Example, ProcessException]:
+        """
+        Process an input, in windows if it is long enough.
+
+        Args:
+            audio (str): Path of the audio to process.
+            data (ExampleRequest): The request parameters.
+
+        Returns:
+            Union[Example, ProcessException]: The merged result, or the first
+                exception raised by a window.
+        """
+        if self.chunk_duration <= 0:
+            return await self.process_fn(audio, data)
+
+        try:
+            duration = await get_audio_duration(audio)
+        except Exception as e:
+            logger.warning(f"Cannot probe the duration of {audio}, not chunked: {e}")
+            return await self.process_fn(audio, data)
+
+        start = data.offset_start or 0.0
+        end = duration if data.offset_end is None else min(data.offset_end, duration)
+        windows = split_windows(start, end, self.chunk_duration, self.overlap)
+        if len(windows) == 1:
+            return await self.process_fn(audio, data)
+
+        tasks = [
+            asyncio.ensure_future(
+                self.process_fn(
+                    audio,
+                    data.model_copy(
+                        update={"offset_start": window_start, "offset_end": window_end}
+                    ),
+                )
+            )
+            for window_start, window_end in windows
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        for result in results:
+            if isinstance(result, ProcessException):
+                return result
+
+        return results[0].model_copy(
+            update={
+                "utterances": merge_utterances([r.utterances for r in results]),
+                "audio_duration": duration,
+                "offset_start": data.offset_start,
+                "offset_end": data.offset_end,
+            }
+        )
@@ -0,0 +1,282 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Audio decoding with ffmpeg, streamed from its stdout without temporary files."""
+
+import asyncio
+import json
+import math
+import subprocess  # noqa: S404
+import wave
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, List, NamedTuple, Optional, Tuple
+
+from my_project.executors import io_executor
+
+if TYPE_CHECKING:
+    import numpy as np
+
+SAMPLE_RATE = 16000
+# Size in bytes of the reads from the stdout of ffmpeg
+READ_SIZE = 1 << 20
+# Duration in seconds of the buffer allocated when the duration cannot be probed
+DEFAULT_CAPACITY = 60.0
+# Bytes of a decoded sample, as little-endian float32
+SAMPLE_SIZE = 4
+
+
+class WavHeader(NamedTuple):
+    """The format of a WAV file, from its header."""
+
+    channels: int
+    sample_width: int
+    frame_rate: int
+    frames: int
+
+
+def _read_wav_header(source: str) -> Optional[WavHeader]:
+    """Read the header of a WAV file, None if the source is not a WAV file."""
+    try:
+        with wave.open(source, "rb") as f:
+            return WavHeader(
+                f.getnchannels(), f.getsampwidth(), f.getframerate(), f.getnframes()
+            )
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def _read_wav(
+    source: str, sample_rate: int, start: Optional[float], end: Optional[float]
+) -> Optional["np.ndarray"]:
+    """
+    Read the samples of a 16-bit WAV file already at the sample rate.
+
+    Returns:
+        Optional[np.ndarray]: The samples, of shape (frames, channels). None if the
+            file needs ffmpeg to be decoded.
+    """
+    import numpy as np
+
+    try:
+        with wave.open(source, "rb") as f:
+            if f.getsampwidth() != 2 or f.getframerate() != sample_rate:
+                return None
+
+            first = min(int((start or 0.0) * sample_rate), f.getnframes())
+            last = f.getnframes()
+            if end is not None:
+                last = max(first, min(last, int(end * sample_rate)))
+            f.setpos(first)
+            frames = np.frombuffer(f.readframes(last - first), dtype="<i2")
+            channels = f.getnchannels()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+    samples = frames.astype(np.float32)
+    samples /= 32768.0
+
+    return samples.reshape(-1, channels)
+
+
+class AudioDecoder:
+    """
+    Decode audio files and urls with ffmpeg, as float32 samples read from its stdout.
+
+    The samples are read in chunks, straight into a buffer preallocated from the
+    probed duration. The number of running decoders is capped by `limit`, and a
+    cancelled decoding kills its process.
+
+    WAV files are probed from their header, and 16-bit WAV files already at the
+    sample rate are read directly, without any process.
+    """
+
+    def __init__(
+        self, limit: asyncio.Semaphore, sample_rate: int = SAMPLE_RATE
+    ) -> None:
+        """
+        Initialize the decoder.
+
+        Args:
+            limit (asyncio.Semaphore): Semaphore capping the running ffmpeg and ffprobe
+                processes.
+            sample_rate (int): The sample rate of the decoded samples.
+        """
+        self.limit = limit
+        self.sample_rate = sample_rate
+
+    async def probe(self, source: str) -> Tuple[int, Optional[float]]:
+        """
+        Probe the number of channels and the duration of an audio file or url.
+
+        WAV files are probed from their header, other inputs with ffprobe.
+
+        Args:
+            source (str): Path or url of the audio.
+
+        Raises:
+            RuntimeError: If ffprobe failed.
+
+        Returns:
+            Tuple[int, Optional[float]]: The number of channels of the first audio
+                stream, and the duration in seconds if known.
+        """
+        header = await io_executor.run(_read_wav_header, source)
+        if header is not None:
+            return header.channels, header.frames / header.frame_rate
+
+        command = [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "a:0",
+            "-show_entries",
+            "stream=channels:format=duration",
+            "-of",
+            "json",
+            source,
+        ]
+        async with self._run(command, source) as process:
+            stdout = await process.stdout.read()
+
+        info = json.loads(stdout)
+        if not info.get("streams"):
+            raise RuntimeError(f"No audio stream in {source}.")
+        duration = info.get("format", {}).get("duration")
+
+        return (
+            int(info["streams"][0]["channels"]),
+            None if duration is None else float(duration),
+        )
+
+    async def decode(
+        self,
+        source: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> "np.ndarray":
+        """
+        Decode an audio file or url, in all its channels.
+
+        The samples are interleaved in a single buffer: each channel is a column, which
+        can be processed as a view without copying it.
+
+        Args:
+            source (str): Path or url of the audio.
+            start (Optional[float]): Start of the decoded range, in seconds.
+            end (Optional[float]): End of the decoded range, in seconds.
+
+        Raises:
+            RuntimeError: If ffprobe or ffmpeg failed.
+
+        Returns:
+            np.ndarray: The samples, of shape (frames, channels).
+        """
+        import numpy as np
+
+        samples = await io_executor.run(_read_wav, source, self.sample_rate, start, end)
+        if samples is not None:
+            return samples
+
+        channels, duration = await self.probe(source)
+        if duration is not None:
+            duration = min(duration, math.inf if end is None else end) - (start or 0.0)
+        frames = math.ceil(max(duration or DEFAULT_CAPACITY, 0.0) * self.sample_rate)
+
+        # One extra frame, so that a well estimated buffer never has to grow
+        buffer = np.empty((frames + 1) * channels, dtype=np.float32)
+        raw = buffer.view(np.uint8)
+        size = 0
+
+        async with self._run(
+            self._decode_command(source, channels, start, end), source
+        ) as process:
+            while chunk := await process.stdout.read(READ_SIZE):
+                if size + len(chunk) > len(raw):
+                    capacity = math.ceil((size + len(chunk)) / SAMPLE_SIZE)
+                    buffer = np.resize(buffer, max(len(buffer) * 3 // 2, capacity))
+                    raw = buffer.view(np.uint8)
+                raw[size : size + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+                size += len(chunk)
+
+        frames = size // (SAMPLE_SIZE * channels)
+        return buffer[: frames * channels].reshape(frames, channels)
+
+    def _decode_command(
+        self,
+        source: str,
+        channels: int,
+        start: Optional[float],
+        end: Optional[float],
+    ) -> List[str]:
+        """The ffmpeg command decoding a range of the audio to float32 samples."""
+        command = ["ffmpeg", "-nostdin", "-v", "error"]
+        # Input options, so ffmpeg seeks instead of decoding the skipped audio
+        if start:
+            command += ["-ss", str(start)]
+        if end is not None:
+            command += ["-to", str(end)]
+
+        return command + [
+            "-i",
+            source,
+            "-f",
+            "f32le",
+            "-acodec",
+            "pcm_f32le",
+            "-ac",
+            str(channels),
+            "-ar",
+            str(self.sample_rate),
+            "-",
+        ]
+
+    @asynccontextmanager
+    async def _run(
+        self, command: List[str], source: str
+    ) -> AsyncIterator[asyncio.subprocess.Process]:
+        """
+        Run a process holding a slot of the limit, and check its return code.
+
+        The process is killed if the block exits before it finished, e.g. when the
+        decoding is cancelled.
+        """
+        async with self.limit:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            # Drained concurrently, so that ffmpeg never blocks on a full stderr pipe
+            stderr = asyncio.ensure_future(process.stderr.read())
+            try:
+                yield process
+                returncode = await process.wait()
+                error = await stderr
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                stderr.cancel()
+
+        if returncode != 0:
+            raise RuntimeError(
+                f"{command[0]} failed on {source}: {error.decode().strip()}"
+            )
@@ -0,0 +1,197 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Weighted fair queuing of the work of several tenants."""
+
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Generic, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_TENANT = "default"
+# Key of the weights and concurrency caps applying to the tenants not listed
+ANY_TENANT = "*"
+
+
+class _TenantQueue(Generic[T]):
+    """Pending items of a tenant, with their virtual start tags."""
+
+    __slots__ = ("items", "weight", "max_concurrency", "finish_tag", "in_flight")
+
+    def __init__(self, weight: float, max_concurrency: int) -> None:
+        """Initialize the tenant queue."""
+        self.items: Deque[Tuple[float, T]] = deque()
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.finish_tag = 0.0
+        self.in_flight = 0
+
+    @property
+    def eligible(self) -> bool:
+        """Whether the tenant has pending items and is below its concurrency cap."""
+        return bool(self.items) and (
+            self.max_concurrency <= 0 or self.in_flight < self.max_concurrency
+        )
+
+
+class FairQueue(Generic[T]):
+    """
+    Queue serving the items of several tenants in weighted fair shares.
+
+    Implements start-time fair queuing. Each item gets a virtual start tag, the later
+    of the current virtual time and the finish tag of the previous item of its tenant,
+    which is its start tag plus `1 / weight`. The queue serves the eligible item with
+    the smallest start tag: while they are backlogged, a tenant of weight 2 is served
+    twice as often as a tenant of weight 1, and a tenant that was idle is served next
+    instead of waiting behind the backlog of the others. Tenants running as many items
+    as their concurrency cap are skipped until one of their items is done.
+
+    Like `asyncio.Queue`, every item returned by `get` must be marked as done with
+    `task_done`, which also releases its concurrency slot.
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        max_concurrency: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """
+        Initialize the fair queue.
+
+        Args:
+            weights (Optional[Dict[str, float]]): Weight of each tenant. The `*` key
+                sets the weight of the other tenants, 1 by default.
+            max_concurrency (Optional[Dict[str, int]]): Maximum number of items of
+                each tenant being processed at once. The `*` key sets the cap of the
+                other tenants, 0 for no cap.
+        """
+        self.weights = weights or {}
+        self.max_concurrency = max_concurrency or {}
+
+        self._tenants: Dict[str, _TenantQueue[T]] = {}
+        self._virtual_time = 0.0
+        self._size = 0
+        self._unfinished = 0
+        self._changed = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def qsize(self) -> int:
+        """Number of pending items, all tenants included."""
+        return self._size
+
+    def depth(self, tenant: str) -> int:
+        """Number of pending items of a tenant."""
+        queue = self._tenants.get(tenant)
+        return len(queue.items) if queue is not None else 0
+
+    def depths(self) -> Dict[str, int]:
+        """Number of pending items of each active tenant."""
+        return {tenant: len(queue.items) for tenant, queue in self._tenants.items()}
+
+    def in_flight(self) -> Dict[str, int]:
+        """Number of items being processed of each active tenant."""
+        return {tenant: queue.in_flight for tenant, queue in self._tenants.items()}
+
+    def put_nowait(self, tenant: str, item: T) -> None:
+        """
+        Queue an item of a tenant. Returns immediately.
+
+        Args:
+            tenant (str): The tenant the item belongs to.
+            item (T): The item.
+        """
+        queue = self._tenants.get(tenant)
+        if queue is None:
+            queue = self._tenants[tenant] = _TenantQueue(
+                weight=self.weights.get(tenant, self.weights.get(ANY_TENANT, 1.0)),
+                max_concurrency=self.max_concurrency.get(
+                    tenant, self.max_concurrency.get(ANY_TENANT, 0)
+                ),
+            )
+
+        start_tag = max(self._virtual_time, queue.finish_tag)
+        queue.finish_tag = start_tag + 1 / queue.weight
+        queue.items.append((start_tag, item))
+
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self._changed.set()
+
+    async def get(self) -> Tuple[str, T]:
+        """
+        Wait for the next item to serve.
+
+        Returns:
+            Tuple[str, T]: The tenant and the item.
+        """
+        while True:
+            tenant = self._select()
+            if tenant is not None:
+                break
+
+            self._changed.clear()
+            await self._changed.wait()
+
+        queue = self._tenants[tenant]
+        start_tag, item = queue.items.popleft()
+        queue.in_flight += 1
+        # The item of a tenant that was at its concurrency cap can be older than the
+        # last one served, and must not move the virtual time back
+        self._virtual_time = max(self._virtual_time, start_tag)
+        self._size -= 1
+
+        return tenant, item
+
+    def task_done(self, tenant: str) -> None:
+        """
+        Mark an item returned by `get` as done, and release its concurrency slot.
+
+        Args:
+            tenant (str): The tenant the item belongs to.
+        """
+        queue = self._tenants[tenant]
+        queue.in_flight -= 1
+        if not queue.items and queue.in_flight == 0:
+            del self._tenants[tenant]
+
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+        # A tenant at its concurrency cap may be eligible again
+        self._changed.set()
+
+    async def join(self) -> None:
+        """Wait until every queued item is done."""
+        await self._finished.wait()
+
+    def _select(self) -> Optional[str]:
+        """Return the eligible tenant whose next item has the smallest start tag."""
+        selected, selected_tag = None, 0.0
+        for tenant, queue in self._tenants.items():
+            if not queue.eligible:
+                continue
+
+            start_tag = queue.items[0][0]
+            if selected is None or start_tag < selected_tag:
+                selected, selected_tag = tenant, start_tag
+
+        return selected
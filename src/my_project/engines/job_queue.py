@@ -0,0 +1,308 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Bounded job queue with a supervised worker pool and admission control."""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from my_project.engines.fair_queue import DEFAULT_TENANT, FairQueue
+from my_project.metrics import Histogram
+
+Job = Callable[[], Awaitable[None]]
+
+# Retry-After returned before any job finished, when the drain rate is unknown
+DEFAULT_RETRY_AFTER = 5
+MAX_RETRY_AFTER = 300
+# Delay before restarting a dead worker, doubled for each recent restart
+RESTART_BASE_DELAY = 0.1
+RESTART_MAX_DELAY = 30.0
+
+
+class QueueFullError(Exception):
+    """Raised when the queue cannot accept more work."""
+
+    def __init__(self, retry_after: int) -> None:
+        """Initialize the exception."""
+        self.retry_after = retry_after
+        super().__init__(
+            f"The server is overloaded, please retry in {retry_after} seconds."
+        )
+
+
+class JobQueue:
+    """
+    Bounded queue of background jobs processed by a fixed pool of workers.
+
+    Workers are started in the lifespan and are not tied to any request. A worker
+    that dies unexpectedly is restarted after an exponential backoff, unless the
+    workers already died `max_restarts` times within `restart_window` seconds. When
+    the queue is full, submissions are rejected with a retry delay estimated from
+    the observed drain rate.
+
+    Jobs are served in weighted fair shares between the tenants that submitted them,
+    so that the bulk submissions of one tenant do not delay the jobs of the others.
+    A tenant can also be capped in running and in queued jobs.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        num_workers: int,
+        rate_window: int = 50,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        tenant_max_concurrency: Optional[Dict[str, int]] = None,
+        tenant_capacity: int = 0,
+        wait_time: Optional[Histogram] = None,
+        max_restarts: int = 10,
+        restart_window: float = 60.0,
+    ) -> None:
+        """
+        Initialize the job queue.
+
+        Args:
+            capacity (int): Maximum number of queued jobs and admitted sync requests.
+            num_workers (int): Number of workers processing the jobs.
+            rate_window (int): Number of recent completions used to estimate the
+                drain rate.
+            tenant_weights (Optional[Dict[str, float]]): Fair share weight of each
+                tenant, see `FairQueue`.
+            tenant_max_concurrency (Optional[Dict[str, int]]): Maximum number of
+                running jobs of each tenant, see `FairQueue`.
+            tenant_capacity (int): Maximum number of queued jobs of a single tenant,
+                0 for no limit besides the capacity.
+            wait_time (Optional[Histogram]): Histogram of the time the jobs waited
+                for a worker, by tenant.
+            max_restarts (int): Maximum number of worker restarts within
+                `restart_window`, beyond which the dead workers are not restarted.
+            restart_window (float): Duration in seconds over which the restarts are
+                counted.
+        """
+        self.capacity = capacity
+        self.num_workers = num_workers
+        self.tenant_capacity = tenant_capacity
+        self.wait_time = wait_time
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+
+        self._queue: "FairQueue[Job]" = FairQueue(
+            tenant_weights, tenant_max_concurrency
+        )
+        self._workers: List[asyncio.Task] = []
+        self._completions: Deque[float] = deque(maxlen=rate_window)
+        self._restarts: Deque[float] = deque()
+        self._in_flight = 0
+        self._admitted = 0
+        self._closing = False
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    def tenant_depths(self) -> Dict[str, int]:
+        """Number of jobs waiting for a worker, by tenant."""
+        return self._queue.depths()
+
+    def tenant_in_flight(self) -> Dict[str, int]:
+        """Number of jobs being processed, by tenant."""
+        return self._queue.in_flight()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of jobs being processed."""
+        return self._in_flight
+
+    @property
+    def admitted(self) -> int:
+        """Number of sync requests being processed."""
+        return self._admitted
+
+    @property
+    def full(self) -> bool:
+        """Whether new work would exceed the capacity."""
+        return self.depth + self._admitted >= self.capacity
+
+    @property
+    def saturation(self) -> float:
+        """Fraction of the capacity used by the queued jobs and admitted requests."""
+        return (self.depth + self._admitted) / self.capacity
+
+    @property
+    def closing(self) -> bool:
+        """Whether the queue stopped accepting work."""
+        return self._closing
+
+    @property
+    def drain_rate(self) -> Optional[float]:
+        """Observed number of completions per second, None if unknown."""
+        if len(self._completions) < 2:
+            return None
+
+        elapsed = self._completions[-1] - self._completions[0]
+        if elapsed <= 0:
+            return None
+
+        return (len(self._completions) - 1) / elapsed
+
+    def retry_after(self) -> int:
+        """Estimate in seconds of the time needed to drain the current backlog."""
+        rate = self.drain_rate
+        if rate is None:
+            return DEFAULT_RETRY_AFTER
+
+        backlog = self.depth + self._admitted + 1
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(backlog / rate)))
+
+    def start(self) -> None:
+        """Start the workers."""
+        self._closing = False
+        self._workers = [self._spawn_worker() for _ in range(self.num_workers)]
+
+    async def close(self, timeout: float = 30.0) -> None:
+        """
+        Stop accepting jobs, wait for the queued ones, then stop the workers.
+
+        Args:
+            timeout (float): Maximum time in seconds to wait for the queue to drain.
+        """
+        self._closing = True
+
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"{self.depth + self._in_flight} jobs were dropped on shutdown."
+                )
+
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def check_admission(self, tenant: Optional[str] = None) -> None:
+        """
+        Check that the queue can accept more work.
+
+        Args:
+            tenant (Optional[str]): The tenant submitting a job, to check its own
+                capacity. None for the sync requests.
+
+        Raises:
+            QueueFullError: If the queue or the tenant share is full, or if the queue
+                is shutting down.
+        """
+        if self._closing or self.full:
+            raise QueueFullError(self.retry_after())
+
+        if (
+            tenant is not None
+            and self.tenant_capacity > 0
+            and self._queue.depth(tenant) >= self.tenant_capacity
+        ):
+            raise QueueFullError(self.retry_after())
+
+    def submit(self, job: Job, tenant: str = DEFAULT_TENANT) -> None:
+        """
+        Queue a job. Returns immediately.
+
+        Args:
+            job (Job): Coroutine function processing the job. Its exceptions are logged.
+            tenant (str): The tenant submitting the job.
+
+        Raises:
+            QueueFullError: If the queue or the tenant share is full, or if the queue
+                is shutting down.
+        """
+        self.check_admission(tenant)
+        self._queue.put_nowait(tenant, (job, time.monotonic()))
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        Count a sync request against the capacity of the queue while it runs.
+
+        Raises:
+            QueueFullError: If the queue is full or shutting down.
+        """
+        self.check_admission()
+        self._admitted += 1
+        try:
+            yield
+        finally:
+            self._admitted -= 1
+            self._completions.append(time.monotonic())
+
+    def _spawn_worker(self, delay: float = 0.0) -> asyncio.Task:
+        worker = asyncio.create_task(self._worker(delay))
+        worker.add_done_callback(self._supervise)
+
+        return worker
+
+    def _supervise(self, worker: asyncio.Task) -> None:
+        """Restart a worker that died, with a backoff, unless the queue is closing."""
+        if worker.cancelled() or self._closing or worker not in self._workers:
+            return
+
+        now = time.monotonic()
+        self._restarts.append(now)
+        while now - self._restarts[0] > self.restart_window:
+            self._restarts.popleft()
+
+        restarts = len(self._restarts)
+        if restarts > self.max_restarts:
+            logger.critical(
+                f"Job queue worker died: {worker.exception()!r}, not restarted after"
+                f" {restarts - 1} restarts in {self.restart_window} secs."
+            )
+            self._workers.remove(worker)
+            return
+
+        delay = min(RESTART_MAX_DELAY, RESTART_BASE_DELAY * 2 ** (restarts - 1))
+        logger.error(
+            f"Job queue worker died: {worker.exception()!r}, restarting it in"
+            f" {delay:.1f} secs."
+        )
+        self._workers[self._workers.index(worker)] = self._spawn_worker(delay)
+
+    async def _worker(self, delay: float = 0.0) -> None:
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        while True:
+            tenant, (job, queued_at) = await self._queue.get()
+            if self.wait_time is not None:
+                self.wait_time.observe(time.monotonic() - queued_at, tenant)
+
+            self._in_flight += 1
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Job failed: {e}")
+            finally:
+                self._in_flight -= 1
+                self._completions.append(time.monotonic())
+                self._queue.task_done(tenant)
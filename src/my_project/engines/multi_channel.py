@@ -0,0 +1,252 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Multi-channel processing, each channel in speech segments processed concurrently."""
+
+import asyncio
+import heapq
+import math
+from operator import itemgetter
+from typing import TYPE_CHECKING, Iterator, List, Tuple, Union
+
+from loguru import logger
+
+from my_project.engines.chunking import ProcessFunction
+from my_project.engines.decoder import SAMPLE_RATE, AudioDecoder
+from my_project.executors import io_executor
+from my_project.models import Example, ExampleRequest
+from my_project.services.example_service import ProcessException
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Duration of the frames whose energy is compared to the silence threshold
+FRAME_DURATION = 0.03
+# Speech segments shorter than this are noise, like clicks
+MIN_SPEECH_DURATION = 0.1
+
+
+def speech_segments(
+    samples: "np.ndarray",
+    silence_threshold_db: float,
+    min_silence: float,
+    sample_rate: int = SAMPLE_RATE,
+) -> List[Tuple[int, int]]:
+    """
+    Find the speech segments of a channel, from the energy of its frames.
+
+    The samples are only read, so a strided view of an interleaved buffer works as
+    well as a contiguous array.
+
+    Args:
+        samples (np.ndarray): The float samples of the channel.
+        silence_threshold_db (float): Level in dB relative to full scale under which a
+            frame is silence.
+        min_silence (float): Duration in seconds of the silence separating two
+            segments. Segments separated by less are merged.
+        sample_rate (int): The sample rate of the samples.
+
+    Returns:
+        List[Tuple[int, int]]: The (start, end) sample indices of the segments.
+    """
+    import numpy as np
+
+    frame_size = int(sample_rate * FRAME_DURATION)
+    num_frames = len(samples) // frame_size
+    frames = samples[: num_frames * frame_size].reshape(num_frames, frame_size)
+
+    # Mean square of each frame, without allocating the squared samples
+    energy = np.einsum("ij,ij->i", frames, frames) / frame_size
+    voiced = energy > 10 ** (silence_threshold_db / 10)
+
+    edges = np.flatnonzero(np.diff(voiced.astype(np.int8), prepend=0, append=0))
+    max_gap = math.ceil(min_silence / FRAME_DURATION)
+    min_frames = math.ceil(MIN_SPEECH_DURATION / FRAME_DURATION)
+
+    segments: List[List[int]] = []
+    for start, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+        if segments and start - segments[-1][1] < max_gap:
+            segments[-1][1] = end
+        else:
+            segments.append([start, end])
+
+    return [
+        (start * frame_size, min(end * frame_size, len(samples)))
+        for start, end in segments
+        if end - start >= min_frames
+    ]
+
+
+def _channel_utterances(
+    channel: int, segments: List[Tuple[float, List[str]]]
+) -> Iterator[Tuple[float, int, str]]:
+    """The start time, channel and text of each utterance of a channel."""
+    for start, utterances in segments:
+        for utterance in utterances:
+            yield start, channel, utterance
+
+
+def interleave_utterances(
+    channels: List[List[Tuple[float, List[str]]]],
+) -> Iterator[Tuple[float, int, str]]:
+    """
+    Interleave the utterances of every channel by start time.
+
+    Args:
+        channels (List[List[Tuple[float, List[str]]]]): For each channel, the start
+            time and utterances of its segments, in order.
+
+    Yields:
+        Tuple[float, int, str]: The start time, channel and text of each utterance.
+    """
+    streams = [
+        _channel_utterances(channel, segments)
+        for channel, segments in enumerate(channels)
+    ]
+
+    # Each channel is already in order, so a k-way merge is enough
+    yield from heapq.merge(*streams, key=itemgetter(0))
+
+
+class MultiChannelStage:
+    """
+    Process each channel of multi-channel inputs separately, then interleave them.
+
+    The input is decoded once, in memory, into a buffer of interleaved samples, and
+    each channel is a view of its column. Channels are split in speech segments,
+    which are all submitted at once, so that an input with several channels takes
+    about as long as a single one. The utterances are then merged by segment start
+    time, with their channel as speaker.
+
+    Other inputs, and inputs that cannot be decoded, go through `single_channel_fn`.
+    """
+
+    def __init__(
+        self,
+        decoder: AudioDecoder,
+        process_fn: ProcessFunction,
+        single_channel_fn: ProcessFunction,
+        silence_threshold_db: float,
+        min_silence: float,
+    ) -> None:
+        """
+        Initialize the multi-channel stage.
+
+        Args:
+            decoder (AudioDecoder): The decoder of the inputs.
+            process_fn (ProcessFunction): Coroutine processing the samples of a
+                speech segment.
+            single_channel_fn (ProcessFunction): Coroutine processing the inputs not
+                processed by channel.
+            silence_threshold_db (float): Level in dB relative to full scale under
+                which the audio is silence.
+            min_silence (float): Duration in seconds of the silence separating two
+                speech segments.
+        """
+        self.decoder = decoder
+        self.process_fn = process_fn
+        self.single_channel_fn = single_channel_fn
+        self.silence_threshold_db = silence_threshold_db
+        self.min_silence = min_silence
+
+    def _speech_segments(self, buffer: "np.ndarray") -> List[List[Tuple[int, int]]]:
+        """Find the speech segments of each channel of a buffer."""
+        return [
+            speech_segments(
+                buffer[:, channel],
+                self.silence_threshold_db,
+                self.min_silence,
+                self.decoder.sample_rate,
+            )
+            for channel in range(buffer.shape[1])
+        ]
+
+    async def process(
+        self, audio: str, data: ExampleRequest
+    ) -> Union[Example, ProcessException]:
+        """
+        Process an input, by channel if requested.
+
+        Args:
+            audio (str): Path of the audio to process.
+            data (ExampleRequest): The request parameters.
+
+        Returns:
+            Union[Example, ProcessException]: The interleaved result, or the first
+                exception raised by a segment.
+        """
+        if not data.multi_channel:
+            return await self.single_channel_fn(audio, data)
+
+        try:
+            buffer = await self.decoder.decode(
+                audio, start=data.offset_start, end=data.offset_end
+            )
+        except Exception as e:
+            logger.warning(f"Cannot decode {audio}, not processed by channel: {e}")
+            return await self.single_channel_fn(audio, data)
+
+        sample_rate = self.decoder.sample_rate
+        start = data.offset_start or 0.0
+
+        # NumPy releases the GIL, so the segmentation runs in a thread
+        segments = await io_executor.run(self._speech_segments, buffer)
+
+        segment_data = data.model_copy(
+            update={"offset_start": None, "offset_end": None, "multi_channel": False}
+        )
+        tasks = [
+            [
+                asyncio.ensure_future(
+                    self.process_fn(
+                        buffer[segment_start:segment_end, channel], segment_data
+                    )
+                )
+                for segment_start, segment_end in channel_segments
+            ]
+            for channel, channel_segments in enumerate(segments)
+        ]
+        flat_tasks = [task for channel_tasks in tasks for task in channel_tasks]
+        try:
+            await asyncio.gather(*flat_tasks)
+        finally:
+            for task in flat_tasks:
+                task.cancel()
+
+        for task in flat_tasks:
+            if isinstance(task.result(), ProcessException):
+                return task.result()
+
+        channels = [
+            [
+                (start + segment_start / sample_rate, task.result().utterances)
+                for (segment_start, _), task in zip(channel_segments, channel_tasks)
+            ]
+            for channel_segments, channel_tasks in zip(segments, tasks)
+        ]
+        utterances = list(interleave_utterances(channels))
+
+        return Example(
+            **{
+                **data.model_dump(),
+                "utterances": [text for _, _, text in utterances],
+                "speakers": [channel for _, channel, _ in utterances],
+                "audio_duration": start + len(buffer) / sample_rate,
+            }
+        )
@@ -0,0 +1,85 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Formatting of the utterances of the results, once they are complete."""
+
+from typing import Union
+
+from my_project.engines.chunking import ProcessFunction
+from my_project.models import Example, ExampleRequest
+from my_project.services.example_service import ProcessException
+from my_project.utils import async_format_utterances
+
+
+class PostProcessingStage:
+    """
+    Format the utterances of the results of another stage.
+
+    The utterances of a result are formatted in a single batch, once the windows and
+    channels of the input are merged, so that the merge still compares the words as
+    the service transcribed them. Empty utterances are dropped, with their speaker.
+    """
+
+    def __init__(self, process_fn: ProcessFunction) -> None:
+        """
+        Initialize the post-processing stage.
+
+        Args:
+            process_fn (ProcessFunction): Coroutine processing an input.
+        """
+        self.process_fn = process_fn
+
+    async def process(
+        self, audio: str, data: ExampleRequest
+    ) -> Union[Example, ProcessException]:
+        """
+        Process an input, then format the utterances of its result.
+
+        Args:
+            audio (str): Path of the audio to process.
+            data (ExampleRequest): The request parameters.
+
+        Returns:
+            Union[Example, ProcessException]: The formatted result, or the exception
+                raised by the processing.
+        """
+        result = await self.process_fn(audio, data)
+        if isinstance(result, ProcessException):
+            return result
+
+        return await format_result(result)
+
+
+async def format_result(result: Example) -> Example:
+    """
+    Format the utterances of a result, dropping the empty ones.
+
+    Args:
+        result (Example): The result to format.
+
+    Returns:
+        Example: A copy of the result with the formatted utterances.
+    """
+    texts = await async_format_utterances(result.utterances)
+    kept = [index for index, text in enumerate(texts) if text is not None]
+    update = {"utterances": [texts[index] for index in kept]}
+    if result.speakers is not None:
+        update["speakers"] = [result.speakers[index] for index in kept]
+
+    return result.model_copy(update=update)
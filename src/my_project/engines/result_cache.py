@@ -0,0 +1,310 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Content-addressed result cache with in-flight request coalescing."""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Generic, Optional, Type, TypeVar
+
+from loguru import logger
+from pydantic import BaseModel
+
+from my_project.executors import io_executor
+from my_project.models import ExampleRequest
+from my_project.serialization import dumps
+
+ResultT = TypeVar("ResultT", bound=BaseModel)
+
+# Request fields that do not change the result, left out of the cache key
+IGNORED_FIELDS = {"job_name", "task_token"}
+
+
+class ResultCache(Generic[ResultT]):
+    """
+    Two-tier cache of the results, keyed by the input digest and request parameters.
+
+    The memory tier is a per-process LRU. The disk tier is a size-bounded directory
+    of JSON files written atomically, so every worker of the host can share it.
+    Identical concurrent lookups are coalesced: only the first one computes the
+    result, the others wait for it.
+    """
+
+    def __init__(
+        self,
+        model: Type[ResultT],
+        memory_size: int,
+        disk_path: Optional[str] = None,
+        disk_max_bytes: int = 0,
+    ) -> None:
+        """
+        Initialize the result cache.
+
+        Args:
+            model (Type[ResultT]): The result model, only its instances are cached.
+            memory_size (int): Maximum number of results in memory, 0 disables it.
+            disk_path (Optional[str]): Directory of the disk tier, None disables it.
+            disk_max_bytes (int): Maximum size in bytes of the disk tier.
+        """
+        self.model = model
+        self.memory_size = memory_size
+        self.disk_path = Path(disk_path) if disk_path else None
+        self.disk_max_bytes = disk_max_bytes
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self._memory: "OrderedDict[str, ResultT]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # The disk writes run concurrently in the I/O executor threads
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """Fraction of the lookups served without computing the result."""
+        hits = self.memory_hits + self.disk_hits + self.coalesced
+        total = hits + self.misses
+
+        return hits / total if total else 0.0
+
+    @staticmethod
+    def make_key(digest: str, data: ExampleRequest) -> str:
+        """
+        Compute the cache key of an input.
+
+        Args:
+            digest (str): Digest of the input bytes, or any stable identifier of the
+                input content like an url and its ETag.
+            data (ExampleRequest): The request parameters.
+
+        Returns:
+            str: The cache key.
+        """
+        params = json.dumps(
+            data.model_dump(mode="json", exclude=IGNORED_FIELDS), sort_keys=True
+        )
+
+        return hashlib.sha256(f"{digest}\n{params}".encode()).hexdigest()
+
+    async def start(self) -> None:
+        """Create the disk tier directory and measure its size."""
+        if self.disk_path is not None:
+            await io_executor.run(self._disk_scan)
+
+    async def get(self, key: str) -> Optional[ResultT]:
+        """
+        Get a result from the cache, without computing it.
+
+        Args:
+            key (str): The cache key, see `make_key`.
+
+        Returns:
+            Optional[ResultT]: The result, None if it is not cached.
+        """
+        result = self._memory_get(key)
+        if result is not None:
+            self.memory_hits += 1
+            return result
+
+        result = await self._disk_get(key)
+        if result is not None:
+            self.disk_hits += 1
+            self._memory_set(key, result)
+        else:
+            self.misses += 1
+
+        return result
+
+    async def put(self, key: str, result: ResultT) -> None:
+        """
+        Store a result computed outside of `get_or_compute`.
+
+        Args:
+            key (str): The cache key, see `make_key`.
+            result (ResultT): The result, ignored if it is not an instance of the model.
+        """
+        if isinstance(result, self.model):
+            await self._disk_set(key, result)
+            self._memory_set(key, result)
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[ResultT]]
+    ) -> ResultT:
+        """
+        Get a result from the cache, or compute it once for all concurrent callers.
+
+        Args:
+            key (str): The cache key, see `make_key`.
+            compute (Callable[[], Awaitable[ResultT]]): Coroutine function computing
+                the result. Results that are not instances of the model, like
+                exceptions returned by the service, are passed through uncached.
+
+        Returns:
+            ResultT: The result.
+        """
+        result = self._memory_get(key)
+        if result is not None:
+            self.memory_hits += 1
+            return result
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                # The computation was cancelled with its caller, not this waiter
+                if in_flight.cancelled():
+                    return await self.get_or_compute(key, compute)
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._disk_get(key)
+            if result is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                result = await compute()
+                if isinstance(result, self.model):
+                    await self._disk_set(key, result)
+
+            if isinstance(result, self.model):
+                self._memory_set(key, result)
+
+            future.set_result(result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Avoid the "exception was never retrieved" warning without waiters
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+        return result
+
+    def _memory_get(self, key: str) -> Optional[ResultT]:
+        result = self._memory.get(key)
+        if result is not None:
+            self._memory.move_to_end(key)
+
+        return result
+
+    def _memory_set(self, key: str, result: ResultT) -> None:
+        if self.memory_size <= 0:
+            return
+
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _disk_file(self, key: str) -> Path:
+        return self.disk_path / key[:2] / f"{key}.json"
+
+    async def _disk_get(self, key: str) -> Optional[ResultT]:
+        if self.disk_path is None:
+            return None
+
+        try:
+            payload = await io_executor.run(self._disk_read, key)
+        except Exception as e:
+            logger.warning(f"Failed to read the cached result {key}: {e}")
+            return None
+
+        return self.model.model_validate_json(payload) if payload else None
+
+    async def _disk_set(self, key: str, result: ResultT) -> None:
+        if self.disk_path is None:
+            return
+
+        try:
+            await io_executor.run(self._disk_write, key, dumps(result))
+        except Exception as e:
+            logger.warning(f"Failed to write the cached result {key}: {e}")
+
+    def _disk_read(self, key: str) -> Optional[bytes]:
+        path = self._disk_file(key)
+        try:
+            payload = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        # The modification time orders the entries for the eviction
+        os.utime(path)
+
+        return payload
+
+    def _disk_write(self, key: str, payload: bytes) -> None:
+        path = self._disk_file(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write then rename, so other workers never read a partial file. The temporary
+        # name is unique per thread, since the same key can be written concurrently
+        tmp_path = path.with_name(
+            f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, path)
+
+        with self._disk_lock:
+            self._disk_bytes += len(payload)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._disk_scan(evict=True)
+
+    def _disk_scan(self, evict: bool = False) -> None:
+        """
+        Measure the disk tier and evict the least recently used files if needed.
+
+        Runs under the disk lock, except at startup before any write.
+        """
+        self.disk_path.mkdir(parents=True, exist_ok=True)
+
+        entries = []
+        for path in self.disk_path.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+
+        if evict and total > self.disk_max_bytes:
+            # Evict down to 90% of the limit, so eviction does not run on every write
+            target = int(self.disk_max_bytes * 0.9)
+            for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+                if total <= target:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+        self._disk_bytes = total
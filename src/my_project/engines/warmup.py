@@ -0,0 +1,214 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Warmup pipeline bringing the service to steady-state latency before it is ready."""
+
+import array
+import asyncio
+import math
+import os
+import tempfile
+import time
+import wave
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from my_project.models import ExampleRequest
+from my_project.services.example_service import ExampleService, ProcessException
+
+SAMPLE_RATE = 16000
+# Round-to-round latency changes below this many seconds are considered noise
+MIN_LATENCY_DELTA = 0.005
+
+
+class WarmupState(str, Enum):
+    """State of the warmup pipeline."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+def write_synthetic_audio(path: str, duration: float = 1.0) -> None:
+    """
+    Write a mono 16 kHz WAV file of a 440 Hz tone.
+
+    Args:
+        path (str): The file to write.
+        duration (float): The duration of the audio, in seconds.
+    """
+    samples = array.array(
+        "h",
+        (
+            int(8000 * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE))
+            for i in range(int(SAMPLE_RATE * duration))
+        ),
+    )
+
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+
+
+class WarmupRunner:
+    """
+    Run synthetic requests through the service until its latency is steady.
+
+    The engine-specific `inference_warmup` hook runs first. Then every combination of
+    the configured languages and batch sizes is processed, round after round, until
+    the latency of each combination changes by less than the tolerance between two
+    rounds, or the maximum number of rounds is reached.
+    """
+
+    def __init__(
+        self,
+        service: ExampleService,
+        batch_sizes: List[int],
+        languages: List[str],
+        max_rounds: int,
+        tolerance: float,
+        audio_path: str = "",
+    ) -> None:
+        """
+        Initialize the warmup runner.
+
+        Args:
+            service (ExampleService): The service to warm up.
+            batch_sizes (List[int]): The batch sizes to run.
+            languages (List[str]): The source languages to run.
+            max_rounds (int): Maximum number of rounds of synthetic batches. 0 to
+                only run the `inference_warmup` hook.
+            tolerance (float): Relative latency change between two rounds below
+                which the latency is considered steady.
+            audio_path (str): Sample audio file to process. A synthetic tone is
+                used if empty.
+        """
+        self.service = service
+        self.batch_sizes = batch_sizes
+        self.languages = languages
+        self.max_rounds = max_rounds
+        self.tolerance = tolerance
+        self.audio_path = audio_path
+
+        self.state = WarmupState.PENDING
+        self.rounds = 0
+        self.duration: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether the warmup completed."""
+        return self.state == WarmupState.DONE
+
+    def status(self) -> dict:
+        """Summary of the warmup, reported by the readiness probe."""
+        return {
+            "state": self.state.value,
+            "rounds": self.rounds,
+            "duration": self.duration,
+        }
+
+    def start(self) -> None:
+        """Run the warmup in the background."""
+        self._task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        """Cancel the warmup if it is still running."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run(self) -> None:
+        """Run the warmup. Failures are logged and leave the service not ready."""
+        self.state = WarmupState.RUNNING
+        self.rounds = 0
+        start_time = time.monotonic()
+
+        try:
+            await self.service.inference_warmup()
+            if self.max_rounds > 0:
+                await self._run_rounds()
+        except asyncio.CancelledError:
+            self.state = WarmupState.PENDING
+            raise
+        except Exception as e:
+            self.state = WarmupState.FAILED
+            logger.error(f"Warmup failed after {self.rounds} rounds: {e}")
+            return
+
+        self.duration = time.monotonic() - start_time
+        self.state = WarmupState.DONE
+        logger.info(
+            f"Warmup done in {self.duration:.2f} secs and {self.rounds} rounds."
+        )
+
+    async def _run_rounds(self) -> None:
+        """Process the synthetic batches until the latency is steady."""
+        audio_path = self.audio_path
+        if not audio_path:
+            fd, audio_path = tempfile.mkstemp(suffix=".wav")
+            os.close(fd)
+            write_synthetic_audio(audio_path)
+
+        try:
+            previous: Dict[Tuple[str, int], float] = {}
+            for _ in range(self.max_rounds):
+                latencies = await self._run_round(audio_path)
+                self.rounds += 1
+
+                if previous and all(
+                    abs(latency - previous[key])
+                    <= max(self.tolerance * previous[key], MIN_LATENCY_DELTA)
+                    for key, latency in latencies.items()
+                ):
+                    return
+                previous = latencies
+
+            logger.warning(f"Warmup latency still changing after {self.rounds} rounds.")
+        finally:
+            if not self.audio_path:
+                os.remove(audio_path)
+
+    async def _run_round(self, audio_path: str) -> Dict[Tuple[str, int], float]:
+        """Process one batch per language and batch size, and return their latency."""
+        latencies = {}
+        for language in self.languages:
+            for batch_size in self.batch_sizes:
+                data = ExampleRequest(source_lang=language, batch_size=batch_size)
+
+                start_time = time.perf_counter()
+                results = await self.service.process_batch(
+                    [(audio_path, data)] * batch_size
+                )
+                latencies[(language, batch_size)] = time.perf_counter() - start_time
+
+                for result in results:
+                    if isinstance(result, ProcessException):
+                        raise RuntimeError(
+                            f"{result.source.value} error on a batch of {batch_size}"
+                            f" `{language}` inputs: {result.message}"
+                        )
+
+        return latencies
@@ -0,0 +1,172 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Named executors running the blocking work off the event loop."""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from my_project.config import settings
+from my_project.metrics import (
+    EXECUTOR_QUEUE_DEPTH,
+    EXECUTOR_TASK_DURATION,
+    EXECUTOR_UTILIZATION,
+)
+
+
+class InstrumentedExecutor:
+    """
+    A named, fixed-size pool reporting its queue depth and utilization.
+
+    Each category of blocking work gets its own pool, so that a burst of one category
+    (e.g. hundreds of file deletions) cannot starve another one (e.g. the decoders).
+    The pool is created by `start`, called in the application lifespan, or lazily on
+    the first submitted task.
+    """
+
+    def __init__(
+        self, name: str, factory: Callable[[int], Executor], max_workers: int
+    ) -> None:
+        """
+        Initialize the executor.
+
+        Args:
+            name (str): The name of the executor, used as metrics label.
+            factory (Callable[[int], Executor]): Creates the pool, given its size.
+            max_workers (int): The number of workers of the pool.
+        """
+        self.name = name
+        self.factory = factory
+        self.max_workers = max_workers
+
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Number of submitted tasks not finished yet."""
+        return self._pending
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of tasks waiting for a free worker."""
+        return max(0, self._pending - self.max_workers)
+
+    @property
+    def utilization(self) -> float:
+        """Fraction of the workers running a task."""
+        return min(self._pending, self.max_workers) / self.max_workers
+
+    def start(self) -> None:
+        """Create the pool."""
+        if self._executor is None:
+            self._executor = self.factory(self.max_workers)
+            self._report()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Cancel the queued tasks and shut the pool down.
+
+        Args:
+            wait (bool): Whether to wait for the running tasks to finish.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a function in the pool and wait for its result.
+
+        The task keeps counting as pending until it actually finishes, even if the
+        caller is cancelled in the meantime.
+
+        Args:
+            func (Callable): The function to run. Must be picklable for a process pool.
+            *args (Any): The positional arguments of the function.
+            **kwargs (Any): The keyword arguments of the function.
+
+        Returns:
+            Any: The result of the function.
+        """
+        if self._executor is None:
+            self.start()
+
+        submitted_at = time.perf_counter()
+        future = self._executor.submit(func, *args, **kwargs)
+        with self._lock:
+            self._pending += 1
+            self._report()
+
+        def _done(_: Future) -> None:
+            with self._lock:
+                self._pending -= 1
+                self._report()
+                EXECUTOR_TASK_DURATION.observe(
+                    time.perf_counter() - submitted_at, self.name
+                )
+
+        future.add_done_callback(_done)
+
+        return await asyncio.wrap_future(future)
+
+    def _report(self) -> None:
+        """Update the gauges of the executor."""
+        EXECUTOR_QUEUE_DEPTH.set(self.queue_depth, self.name)
+        EXECUTOR_UTILIZATION.set(self.utilization, self.name)
+
+
+def _thread_pool(name: str) -> Callable[[int], Executor]:
+    """Return a factory of thread pools with named threads."""
+    return lambda max_workers: ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix=name
+    )
+
+
+def _process_pool(max_workers: int) -> Executor:
+    """
+    Create a process pool.
+
+    The workers are spawned rather than forked, since the pool is created in a
+    process already running threads (the event loop, the other pools).
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+# Blocking file system and network calls: file deletions, hashing, boto3
+io_executor = InstrumentedExecutor(
+    "io", _thread_pool("io"), max_workers=settings.io_executor_workers
+)
+# CPU-bound pure Python work, which would hold the GIL in a thread
+cpu_executor = InstrumentedExecutor(
+    "cpu", _process_pool, max_workers=settings.cpu_executor_workers
+)
+# Blocking waits on external processes like ffmpeg, which also bounds their number
+subprocess_executor = InstrumentedExecutor(
+    "subprocess",
+    _thread_pool("subprocess"),
+    max_workers=settings.subprocess_executor_workers,
+)
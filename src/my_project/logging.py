@@ -21,25 +21,42 @@
 """Logging module to add a logging middleware to the Wordcab Transcribe API."""
 
 import asyncio
+import random
 import sys
 import time
 import uuid
 from functools import partial
-from typing import Any, Awaitable, Callable, Tuple
+from typing import Any, Callable, Iterable, Optional, Tuple
 
 from loguru import logger
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from my_project.executors import InstrumentedExecutor, io_executor
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware to log requests, responses, errors and execution time."""
 
-    def __init__(self, app: ASGIApp, debug_mode: bool) -> None:
-        """Initialize the middleware."""
-        super().__init__(app)
+class LoggingMiddleware:
+    """Pure ASGI middleware to log requests, responses, errors and execution time."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        debug_mode: bool,
+        exclude_paths: Iterable[str] = (),
+        sample_rate: float = 1.0,
+    ) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The ASGI application to wrap.
+            debug_mode: The debug setting for logging purposes.
+            exclude_paths: Paths that are never logged, e.g. the health probes.
+            sample_rate: Fraction of the other requests to log, between 0 and 1.
+        """
+        self.app = app
+        self.exclude_paths = frozenset(exclude_paths)
+        self.sample_rate = sample_rate
+
         logger.remove()
         logger.add(
             sys.stdout,
@@ -48,36 +65,52 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             ),  # Avoid logging debug messages in prod
         )
 
-    async def dispatch(
-        self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
-    ) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """
         Dispatch a request and log it, along with the response and any errors.
 
         Args:
-            request: The request to dispatch.
-            call_next: The next middleware to call.
-
-        Returns:
-            The response from the next middleware.
+            scope: The connection scope.
+            receive: The receive channel.
+            send: The send channel.
         """
-        start_time = time.time()
+        skipped = scope["type"] != "http" or scope["path"] in self.exclude_paths
+        if not skipped and self.sample_rate < 1.0:
+            skipped = random.random() >= self.sample_rate  # noqa: S311
+        if skipped:
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
         tracing_id = uuid.uuid4()
+        method = scope["method"]
+        path = scope["path"]
+        if scope.get("query_string"):
+            path = f"{path}?{scope['query_string'].decode('latin-1')}"
 
-        if request.method == "POST":
-            logger.info(f"Task [{tracing_id}] | {request.method} {request.url}")
+        if method == "POST":
+            logger.info("Task [{}] | {} {}", tracing_id, method, path)
         else:
-            logger.info(f"{request.method} {request.url}")
-
-        response = await call_next(request)
-
-        process_time = time.time() - start_time
-        logger.info(
-            f"Task [{tracing_id}] | Status: {response.status_code}, Time:"
-            f" {process_time:.4f} secs"
-        )
-
-        return response
+            logger.info("{} {}", method, path)
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            process_time = time.perf_counter() - start_time
+            logger.info(
+                "Task [{}] | Status: {}, Time: {:.4f} secs",
+                tracing_id,
+                status_code,
+                process_time,
+            )
 
 
 def time_and_tell(
@@ -105,7 +138,10 @@ def time_and_tell(
 
 
 async def time_and_tell_async(
-    func: Callable, func_name: str, debug_mode: bool
+    func: Callable,
+    func_name: str,
+    debug_mode: bool,
+    executor: Optional[InstrumentedExecutor] = None,
 ) -> Tuple[Any, float]:
     """
     This decorator logs the execution time of an async function only if the debug setting is True.
@@ -114,6 +150,7 @@ async def time_and_tell_async(
         func: The function to call in the wrapper.
         func_name: The name of the function for logging purposes.
         debug_mode: The debug setting for logging purposes.
+        executor: The executor running a sync function. Defaults to the I/O executor.
 
     Returns:
         The appropriate wrapper for the function.
@@ -123,13 +160,11 @@ async def time_and_tell_async(
     if asyncio.iscoroutinefunction(func) or asyncio.iscoroutine(func):
         result = await func
     else:
-        loop = asyncio.get_event_loop()
+        executor = executor or io_executor
         if isinstance(func, partial):
-            result = await loop.run_in_executor(
-                None, func.func, *func.args, **func.keywords
-            )
+            result = await executor.run(func.func, *func.args, **func.keywords)
         else:
-            result = await loop.run_in_executor(None, func)
+            result = await executor.run(func)
 
     process_time = time.time() - start_time
 
@@ -20,18 +20,29 @@
 
 """Main API module of the Wordcab Transcribe."""
 
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, Request
 from fastapi import status as http_status
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 
+from my_project.compression import CompressionMiddleware
 from my_project.config import settings
-from my_project.dependencies import lifespan
+from my_project.dependencies import job_queue, lifespan, rate_limiter, warmup
+from my_project.engines.job_queue import QueueFullError
+from my_project.engines.warmup import WarmupState
 from my_project.logging import LoggingMiddleware
-from my_project.router.authentication import get_current_user
+from my_project.metrics import RATE_LIMIT_REJECTIONS, MetricsMiddleware, registry
+from my_project.rate_limit import RateLimitMiddleware
+from my_project.router.authentication import (
+    get_current_user,
+    get_current_user_ws,
+    get_rate_limit_key,
+)
 from my_project.router.v1.endpoints import (
     api_router,
     auth_router,
+    stream_router,
 )
+from my_project.serialization import FastJSONResponse
 
 # Main application instance creation
 app = FastAPI(
@@ -40,10 +51,42 @@ app = FastAPI(
     openapi_url=f"{settings.api_prefix}/openapi.json",
     debug=settings.debug,
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
+# Add rate limiting middleware, the innermost one so that the rejections are logged
+# and measured, but still checked before any request body is read
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=rate_limiter,
+    identify=get_rate_limit_key,
+    path_prefix=settings.api_prefix,
+    rejections=RATE_LIMIT_REJECTIONS,
+)
 # Add logging middleware
-app.add_middleware(LoggingMiddleware, debug_mode=settings.debug)
+app.add_middleware(
+    LoggingMiddleware,
+    debug_mode=settings.debug,
+    exclude_paths=settings.log_exclude_paths,
+    sample_rate=settings.log_sample_rate,
+)
+# Add metrics middleware
+app.add_middleware(MetricsMiddleware)
+# Add compression middleware, added last so it is the outermost one
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_size)
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_exception_handler(
+    request: Request, exc: QueueFullError
+) -> JSONResponse:
+    """Reject the requests above the capacity with a Retry-After header."""
+    return JSONResponse(
+        status_code=http_status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 
 # Include the appropriate routers based on the settings
 if settings.debug is False:
@@ -51,8 +94,15 @@ if settings.debug is False:
     app.include_router(
         api_router, prefix=settings.api_prefix, dependencies=[Depends(get_current_user)]
     )
+    # WebSockets cannot use the OAuth2 scheme, which needs an HTTP request
+    app.include_router(
+        stream_router,
+        prefix=f"{settings.api_prefix}/stream",
+        dependencies=[Depends(get_current_user_ws)],
+    )
 else:
     app.include_router(api_router, prefix=settings.api_prefix)
+    app.include_router(stream_router, prefix=f"{settings.api_prefix}/stream")
 
 
 @app.get("/", tags=["status"])
@@ -89,3 +139,56 @@ async def home() -> HTMLResponse:
 async def health() -> dict:
     """Health check endpoint. Important for Kubernetes liveness probe."""
     return {"status": "ok"}
+
+
+@app.get("/readyz", status_code=http_status.HTTP_200_OK, tags=["status"])
+async def readiness() -> JSONResponse:
+    """
+    Readiness check endpoint. Important for Kubernetes readiness probe.
+
+    The service is ready once the warmup is done, and as long as the job queue is
+    below the saturation threshold. Otherwise a 503 status is returned, so that the
+    traffic is routed to the other pods.
+    """
+    saturation = job_queue.saturation
+    if warmup.state == WarmupState.FAILED:
+        status = "warmup_failed"
+    elif not warmup.ready:
+        status = "warming_up"
+    elif job_queue.closing:
+        status = "shutting_down"
+    elif saturation >= settings.readiness_max_saturation:
+        status = "saturated"
+    else:
+        status = "ready"
+
+    return FastJSONResponse(
+        content={
+            "status": status,
+            "warmup": warmup.status(),
+            "queue": {
+                "depth": job_queue.depth,
+                "in_flight": job_queue.in_flight,
+                "admitted": job_queue.admitted,
+                "capacity": job_queue.capacity,
+                "saturation": round(saturation, 3),
+            },
+        },
+        status_code=(
+            http_status.HTTP_200_OK
+            if status == "ready"
+            else http_status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+    )
+
+
+@app.get("/metrics", status_code=http_status.HTTP_200_OK, tags=["status"])
+async def metrics() -> PlainTextResponse:
+    """
+    Metrics endpoint in the Prometheus text format. Used for autoscaling.
+
+    Under the pre-fork server, the metrics are aggregated across the workers.
+    """
+    return PlainTextResponse(
+        content=registry.render(), media_type="text/plain; version=0.0.4"
+    )
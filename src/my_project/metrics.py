@@ -0,0 +1,603 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Metrics module exposing the operational signals in the Prometheus text format."""
+
+import asyncio
+import glob
+import json
+import os
+import statistics
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+    300.0,
+)  # fmt: skip
+
+
+def _escape(value: str) -> str:
+    """Escape a label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str]) -> str:
+    """Format a label set, e.g. `{route="/healthz",method="GET"}`."""
+    if not labelnames:
+        return ""
+
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(labelnames, values)
+    )
+
+    return f"{{{pairs}}}"
+
+
+class _Metric:
+    """Base class of the metrics, holding one value per label set."""
+
+    type_name = ""
+    # Whether the values of a worker are still reported once it exited
+    cumulative = False
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        """Initialize the metric."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def values(self) -> Dict[tuple, Any]:
+        """Return a copy of the value of each label set."""
+        return dict(self._values)
+
+    def samples(
+        self, values: Optional[Dict[tuple, Any]] = None
+    ) -> Iterator[Tuple[str, str, float]]:
+        """Yield the (name, labels, value) samples of the metric, or of `values`."""
+        for labels, value in (self.values() if values is None else values).items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+    def merge(self, values: List[Any]) -> Any:
+        """Merge the values of a label set reported by several workers."""
+        return sum(values)
+
+    def render(self, values: Optional[Dict[tuple, Any]] = None) -> List[str]:
+        """Render the metric, or the given values of it, in the Prometheus format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(
+            f"{name}{labels} {value}" for name, labels, value in self.samples(values)
+        )
+
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    type_name = "counter"
+    cumulative = True
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        """Initialize the counter."""
+        super().__init__(name, documentation, labelnames)
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the counter of every label set."""
+        self._values: Dict[tuple, float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        """Increment the counter of a label set."""
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        aggregate: Callable[[Iterable[float]], float] = sum,
+    ) -> None:
+        """Initialize the gauge."""
+        super().__init__(name, documentation, labelnames)
+        self.aggregate = aggregate
+        self._values: Dict[tuple, float] = {} if self.labelnames else {(): 0.0}
+
+    def set(self, value: float, *labels: str) -> None:
+        """Set the gauge of a label set."""
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        """Increment the gauge of a label set."""
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        """Decrement the gauge of a label set."""
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+    @contextmanager
+    def track(self, *labels: str) -> Iterator[None]:
+        """Increment the gauge for the duration of the block."""
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+    def merge(self, values: List[float]) -> float:
+        """Merge the values of a label set reported by several workers."""
+        return self.aggregate(values)
+
+
+class CallbackGauge(_Metric):
+    """
+    Gauge whose value is computed by a callback at scrape time.
+
+    With label names, the callback returns the value of each label set that currently
+    exists, so that the series of the label sets that went away are not reported.
+    """
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Union[float, Dict[tuple, float]]],
+        labelnames: Sequence[str] = (),
+        aggregate: Callable[[Iterable[float]], float] = sum,
+    ) -> None:
+        """Initialize the callback gauge."""
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.aggregate = aggregate
+
+    def values(self) -> Dict[tuple, float]:
+        """Compute the value of each label set."""
+        if not self.labelnames:
+            return {(): float(self.callback())}
+
+        return {labels: float(value) for labels, value in self.callback().items()}
+
+    def merge(self, values: List[float]) -> float:
+        """Merge the values of a label set reported by several workers."""
+        return self.aggregate(values)
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets."""
+
+    type_name = "histogram"
+    cumulative = True
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """Initialize the histogram."""
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the observations of every label set."""
+        # Per label set: one count per bucket plus the +Inf bucket, then the sum
+        self._values: Dict[tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record an observation for a label set."""
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the duration of the block, in seconds."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, *labels)
+
+    def merge(self, values: List[List[float]]) -> List[float]:
+        """Merge the bucket counts and sums reported by several workers."""
+        return [sum(column) for column in zip(*values)]
+
+    def samples(
+        self, values: Optional[Dict[tuple, List[float]]] = None
+    ) -> Iterator[Tuple[str, str, float]]:
+        """Yield the cumulative bucket, sum and count samples of the histogram."""
+        labelnames = self.labelnames + ("le",)
+
+        for labels, counts in (self.values() if values is None else values).items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(labelnames, labels + (le,)),
+                    cumulative,
+                )
+
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum", label_str, counts[-1]
+            yield f"{self.name}_count", label_str, cumulative
+
+
+class MetricsRegistry:
+    """
+    Registry of the metrics of the worker process.
+
+    Metrics are plain per-process values updated from the event loop, without locks.
+    Callback gauges are only evaluated when the registry is scraped or written.
+
+    Once shared through a directory, each forked worker writes its values to its own
+    file there, and a scrape merges the files of all the workers: counters and
+    histograms are summed, and gauges are combined by their `aggregate` function.
+    The files of the exited workers only keep their counters and histograms, so that
+    these do not go back.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the registry."""
+        self._metrics: Dict[str, _Metric] = {}
+        self.directory: Optional[str] = None
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Register a metric, its name must be unique."""
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric `{metric.name}` is already registered.")
+        self._metrics[metric.name] = metric
+
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        """Create and register a counter."""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        aggregate: Callable[[Iterable[float]], float] = sum,
+    ) -> Gauge:
+        """Create and register a gauge."""
+        return self.register(Gauge(name, documentation, labelnames, aggregate))
+
+    def callback_gauge(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Union[float, Dict[tuple, float]]],
+        labelnames: Sequence[str] = (),
+        aggregate: Callable[[Iterable[float]], float] = sum,
+    ) -> CallbackGauge:
+        """Create and register a gauge computed at scrape time."""
+        return self.register(
+            CallbackGauge(name, documentation, callback, labelnames, aggregate)
+        )
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """Create and register a histogram."""
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def share(self, directory: str) -> None:
+        """
+        Aggregate the metrics of the workers forked from now on.
+
+        Args:
+            directory (str): The directory where the workers write their values.
+        """
+        self.directory = directory
+
+    def reset(self) -> None:
+        """
+        Reset the counters and histograms inherited from the master by a worker.
+
+        Otherwise the values recorded before the fork would be counted once per
+        worker. Gauges are kept, since they describe the current state.
+        """
+        for metric in self._metrics.values():
+            if metric.cumulative:
+                metric.reset()
+
+    def write(self) -> None:
+        """Write the values of this worker to the shared directory."""
+        if self.directory is None:
+            return
+
+        values = {
+            name: [[list(labels), value] for labels, value in metric.values().items()]
+            for name, metric in self._metrics.items()
+        }
+        self._write(os.getpid(), values)
+
+    def retire(self, pid: int) -> None:
+        """
+        Drop the gauges of an exited worker from the shared directory.
+
+        Args:
+            pid (int): The process id of the exited worker.
+        """
+        if self.directory is None:
+            return
+
+        try:
+            with open(os.path.join(self.directory, f"{pid}.json")) as f:
+                values = json.load(f)
+        except FileNotFoundError:
+            return
+
+        self._write(
+            pid,
+            {
+                name: metric_values
+                for name, metric_values in values.items()
+                if name in self._metrics and self._metrics[name].cumulative
+            },
+        )
+
+    def render(self) -> str:
+        """Render all the metrics in the Prometheus text format."""
+        merged: Dict[str, Dict[tuple, Any]] = {}
+        if self.directory is not None:
+            self.write()
+            merged = self._merged()
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render(merged.get(metric.name)))
+
+        return "\n".join(lines) + "\n"
+
+    def _write(self, pid: int, values: Dict[str, list]) -> None:
+        """Replace the file of a worker, readers see either the old or new one."""
+        path = os.path.join(self.directory, f"{pid}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(values, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _merged(self) -> Dict[str, Dict[tuple, Any]]:
+        """Merge the values written by all the workers, by metric and label set."""
+        reported: Dict[str, Dict[tuple, list]] = {name: {} for name in self._metrics}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            with open(path) as f:
+                for name, values in json.load(f).items():
+                    if name not in reported:
+                        continue
+                    for labels, value in values:
+                        reported[name].setdefault(tuple(labels), []).append(value)
+
+        return {
+            name: {
+                labels: self._metrics[name].merge(values)
+                for labels, values in label_values.items()
+            }
+            for name, label_values in reported.items()
+        }
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total",
+    "Number of HTTP requests by route, method and status code.",
+    ("route", "method", "status"),
+)
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds",
+    "Latency of the HTTP requests by route and method.",
+    ("route", "method"),
+)
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight",
+    "Number of HTTP requests being processed.",
+)
+DOWNLOAD_SLOTS_IN_USE = registry.gauge(
+    "download_slots_in_use",
+    "Number of acquired `download_limit` slots.",
+)
+DOWNLOAD_SLOTS_WAITING = registry.gauge(
+    "download_slots_waiting",
+    "Number of jobs waiting for a `download_limit` slot.",
+)
+DOWNLOAD_SLOT_WAIT = registry.histogram(
+    "download_slot_wait_seconds",
+    "Time spent waiting for a `download_limit` slot.",
+)
+DECODER_SLOTS_IN_USE = registry.gauge(
+    "decoder_slots_in_use",
+    "Number of running ffmpeg and ffprobe processes of the audio decoder.",
+)
+DECODER_SLOTS_WAITING = registry.gauge(
+    "decoder_slots_waiting",
+    "Number of decodings waiting for a `decoder_limit` slot.",
+)
+DECODER_SLOT_WAIT = registry.histogram(
+    "decoder_slot_wait_seconds",
+    "Time spent waiting for a `decoder_limit` slot.",
+)
+BACKGROUND_JOBS = registry.gauge(
+    "background_jobs",
+    "Number of accepted background jobs not finished yet.",
+)
+JOB_STAGE_DURATION = registry.histogram(
+    "job_stage_duration_seconds",
+    "Duration of each stage of the background jobs.",
+    ("stage",),
+)
+STREAM_SESSIONS = registry.gauge(
+    "stream_sessions",
+    "Number of open WebSocket streaming sessions.",
+)
+EXECUTOR_QUEUE_DEPTH = registry.gauge(
+    "executor_queue_depth",
+    "Number of tasks waiting for a free worker, by executor.",
+    ("executor",),
+)
+EXECUTOR_UTILIZATION = registry.gauge(
+    "executor_utilization",
+    "Fraction of the workers running a task, by executor.",
+    ("executor",),
+    aggregate=statistics.fmean,
+)
+EXECUTOR_TASK_DURATION = registry.histogram(
+    "executor_task_duration_seconds",
+    "Time from the submission to the completion of the tasks, by executor.",
+    ("executor",),
+)
+RATE_LIMIT_REJECTIONS = registry.counter(
+    "rate_limit_rejections_total",
+    "Number of requests rejected by the rate limits, by bucket.",
+    ("bucket",),
+)
+JOB_QUEUE_WAIT = registry.histogram(
+    "job_queue_wait_seconds",
+    "Time the async jobs waited for a worker, by tenant.",
+    ("tenant",),
+)
+TOKEN_CACHE_LOOKUPS = registry.counter(
+    "token_cache_lookups_total",
+    "Number of access tokens looked up in the token cache, by result: hit or miss.",
+    ("result",),
+)
+TOKEN_CACHE_EVICTIONS = registry.counter(
+    "token_cache_evictions_total",
+    "Number of access tokens evicted from the full token cache.",
+)
+
+
+class InstrumentedSemaphore(asyncio.Semaphore):
+    """Semaphore reporting its occupancy, its waiters and the time spent waiting."""
+
+    def __init__(
+        self, value: int, in_use: Gauge, waiting: Gauge, wait_time: Histogram
+    ) -> None:
+        """
+        Initialize the semaphore.
+
+        Args:
+            value (int): The number of slots.
+            in_use (Gauge): Gauge of the acquired slots.
+            waiting (Gauge): Gauge of the tasks waiting for a slot.
+            wait_time (Histogram): Histogram of the time spent waiting for a slot.
+        """
+        super().__init__(value)
+        self.in_use = in_use
+        self.waiting = waiting
+        self.wait_time = wait_time
+
+    async def acquire(self) -> bool:
+        """Acquire a slot, recording the time spent waiting for it."""
+        start_time = time.perf_counter()
+        with self.waiting.track():
+            await super().acquire()
+        self.wait_time.observe(time.perf_counter() - start_time)
+        self.in_use.inc()
+
+        return True
+
+    def release(self) -> None:
+        """Release a slot."""
+        self.in_use.dec()
+        super().release()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording the latency, status and in-flight requests."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Initialize the middleware."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Dispatch a request and record its metrics."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+
+            # The router stores the matched route in the scope, use its path template
+            # to keep the cardinality bounded.
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start_time, route_path, method
+            )
+            HTTP_REQUESTS.inc(route_path, method, str(status_code))
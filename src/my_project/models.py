@@ -42,6 +42,7 @@ class Example(BaseModel):
     log_prob_threshold: float
     no_speech_threshold: float
     condition_on_previous_text: bool
+    speakers: Union[List[int], None] = None
 
 
 
@@ -54,6 +55,7 @@ class ExampleBaseRequest(BaseModel):
     diarization: bool = False
     batch_size: int = 1
     source_lang: str = "en"
+    timestamps: str = "s"
     vocab: Union[List[str], None] = None
     word_timestamps: bool = False
     internal_vad: bool = False
@@ -158,6 +160,7 @@ class ExampleBaseResponse(BaseModel):
     log_prob_threshold: float
     no_speech_threshold: float
     condition_on_previous_text: bool
+    speakers: Union[List[int], None] = None
     job_name: Optional[str] = None
     task_token: Optional[str] = None
 
@@ -215,3 +218,23 @@ class ExampleResponse(ExampleBaseResponse):
                 "multi_channel": False,
             }
         }
+
+
+class Token(BaseModel):
+    """Token model for authentication."""
+
+    access_token: str
+    token_type: str
+
+
+class TokenData(BaseModel):
+    """TokenData model for authentication."""
+
+    username: Optional[str] = None
+
+
+class StreamingUtterance(BaseModel):
+    """Utterance pushed to a streaming client."""
+
+    text: str
+    final: bool
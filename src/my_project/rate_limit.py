@@ -0,0 +1,387 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Token-bucket rate limiting of the API, enforced at the edge of the application."""
+
+import hashlib
+import math
+import multiprocessing
+import time
+from collections import OrderedDict
+from multiprocessing.sharedctypes import RawArray
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from my_project.metrics import Counter
+
+
+class Limit(NamedTuple):
+    """A bucket of `capacity` tokens, refilled at `capacity` tokens per `period`."""
+
+    capacity: int
+    period: float
+
+    @property
+    def refill_rate(self) -> float:
+        """Number of tokens added per second."""
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        """
+        Parse a limit written as `count/period`, e.g. `120/60` for 120 a minute.
+
+        Args:
+            value (str): The limit.
+
+        Returns:
+            Limit: The parsed limit.
+        """
+        capacity, _, period = value.partition("/")
+        return cls(int(capacity), float(period))
+
+
+class RateLimitResult(NamedTuple):
+    """Outcome of taking a token from a bucket."""
+
+    allowed: bool
+    limit: Limit
+    remaining: int
+    # Seconds until the bucket is full again
+    reset_after: float
+    # Seconds until a token is available, 0 if the request is allowed
+    retry_after: float
+
+    def headers(self) -> Dict[str, str]:
+        """The `RateLimit-*` headers describing the bucket."""
+        headers = {
+            "RateLimit-Limit": str(self.limit.capacity),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset_after)),
+            "RateLimit-Policy": f"{self.limit.capacity};w={self.limit.period:g}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+
+        return headers
+
+
+def _take(
+    tokens: float, updated_at: float, limit: Limit, now: float
+) -> Tuple[float, RateLimitResult]:
+    """
+    Refill a bucket for the time elapsed since its last update, then take a token.
+
+    Returns:
+        Tuple[float, RateLimitResult]: The tokens left in the bucket, and the result.
+    """
+    tokens = min(limit.capacity, tokens + (now - updated_at) * limit.refill_rate)
+
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+
+    return tokens, RateLimitResult(
+        allowed=allowed,
+        limit=limit,
+        remaining=int(tokens),
+        reset_after=(limit.capacity - tokens) / limit.refill_rate,
+        retry_after=0.0 if allowed else (1 - tokens) / limit.refill_rate,
+    )
+
+
+class BucketStore:
+    """Storage of the token buckets, refilled lazily when a token is taken."""
+
+    def take(self, key: str, limit: Limit, now: float) -> RateLimitResult:
+        """
+        Take a token from the bucket of a key.
+
+        Args:
+            key (str): The key of the bucket.
+            limit (Limit): The limit of the bucket.
+            now (float): The current time, from `time.monotonic`.
+
+        Returns:
+            RateLimitResult: Whether a token was available, and the bucket state.
+        """
+        raise NotImplementedError
+
+    def refund(self, key: str, limit: Limit) -> None:
+        """
+        Give back a token taken from the bucket of a key.
+
+        Args:
+            key (str): The key of the bucket.
+            limit (Limit): The limit of the bucket.
+        """
+        raise NotImplementedError
+
+
+class MemoryBucketStore(BucketStore):
+    """
+    Buckets in the memory of the worker process.
+
+    The least recently used buckets are dropped above `max_keys`, which resets them
+    to full, so the memory stays bounded whatever the number of clients.
+    """
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            max_keys (int): Maximum number of buckets kept.
+        """
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def take(self, key: str, limit: Limit, now: float) -> RateLimitResult:
+        """Take a token from the bucket of a key."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [limit.capacity, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        bucket[0], result = _take(bucket[0], bucket[1], limit, now)
+        bucket[1] = now
+
+        return result
+
+    def refund(self, key: str, limit: Limit) -> None:
+        """Give back a token taken from the bucket of a key."""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(limit.capacity, bucket[0] + 1)
+
+
+class SharedBucketStore(BucketStore):
+    """
+    Buckets in shared memory, so the limits hold across the pre-forked workers.
+
+    Must be created before the workers are forked. Buckets live in a fixed table of
+    slots indexed by a hash of their key: a key whose slot is taken by another key
+    replaces it with a full bucket, like an eviction of `MemoryBucketStore`.
+    """
+
+    def __init__(self, slots: int = 65536) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            slots (int): Number of buckets in the table.
+        """
+        self.slots = slots
+        # Tokens and last update of each slot, and the fingerprint of its key
+        self._state = RawArray("d", 2 * slots)
+        self._fingerprints = RawArray("Q", slots)
+        self._lock = multiprocessing.Lock()
+
+    def take(self, key: str, limit: Limit, now: float) -> RateLimitResult:
+        """Take a token from the bucket of a key."""
+        fingerprint, slot = self._slot(key)
+
+        with self._lock:
+            if self._fingerprints[slot] != fingerprint:
+                self._fingerprints[slot] = fingerprint
+                self._state[2 * slot] = limit.capacity
+                self._state[2 * slot + 1] = now
+
+            tokens, result = _take(
+                self._state[2 * slot], self._state[2 * slot + 1], limit, now
+            )
+            self._state[2 * slot] = tokens
+            self._state[2 * slot + 1] = now
+
+        return result
+
+    def refund(self, key: str, limit: Limit) -> None:
+        """Give back a token taken from the bucket of a key."""
+        fingerprint, slot = self._slot(key)
+
+        with self._lock:
+            # Unless another key replaced the bucket in the meantime
+            if self._fingerprints[slot] == fingerprint:
+                self._state[2 * slot] = min(limit.capacity, self._state[2 * slot] + 1)
+
+    def _slot(self, key: str) -> Tuple[int, int]:
+        """The fingerprint of a key, and the slot of its bucket."""
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        fingerprint = int.from_bytes(digest, "little") or 1
+
+        return fingerprint, fingerprint % self.slots
+
+
+class RateLimiter:
+    """
+    Per-client and per-route token buckets.
+
+    Every request of a client takes a token from the bucket of the client, and from
+    the bucket of the client for the route when the route has its own limit. Buckets
+    are refilled lazily on access, so a check is O(1) and no timer is needed.
+    """
+
+    def __init__(
+        self,
+        store: BucketStore,
+        client_limit: Optional[Limit],
+        route_limits: Optional[Dict[str, Limit]] = None,
+    ) -> None:
+        """
+        Initialize the rate limiter.
+
+        Args:
+            store (BucketStore): The storage of the buckets.
+            client_limit (Optional[Limit]): The limit of each client, all routes
+                included. None for no limit.
+            route_limits (Optional[Dict[str, Limit]]): The limit of each client on
+                some routes, by exact path.
+        """
+        self.store = store
+        self.client_limit = client_limit
+        self.route_limits = route_limits or {}
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any limit is set."""
+        return self.client_limit is not None or bool(self.route_limits)
+
+    def check(self, client: str, path: str) -> Optional[Tuple[str, RateLimitResult]]:
+        """
+        Take a token for a request of a client, from every bucket or from none.
+
+        Args:
+            client (str): The key identifying the client.
+            path (str): The path of the request.
+
+        Returns:
+            Optional[Tuple[str, RateLimitResult]]: The name of the most restrictive
+                bucket, `route` or `client`, and its result. The first rejecting
+                bucket if the request is rejected. None if no limit applies.
+        """
+        now = time.monotonic()
+        checked = None
+
+        route_key = f"{client}\n{path}"
+        route_limit = self.route_limits.get(path)
+        if route_limit is not None:
+            result = self.store.take(route_key, route_limit, now)
+            if not result.allowed:
+                return "route", result
+            checked = ("route", result)
+
+        if self.client_limit is not None:
+            result = self.store.take(client, self.client_limit, now)
+            if not result.allowed:
+                # A rejected request must not drain the budget of the route
+                if checked is not None:
+                    self.store.refund(route_key, route_limit)
+                return "client", result
+            if checked is None or result.remaining < checked[1].remaining:
+                checked = ("client", result)
+
+        return checked
+
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI middleware rejecting the requests above the rate limits.
+
+    Requests are checked before the body is read, so that rejected requests cost
+    neither the parsing of a form, nor the spooling of an upload, nor any inference.
+    Rejected requests get a 429 status, and every limited response the `RateLimit-*`
+    headers of its most restrictive bucket.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limiter: RateLimiter,
+        identify: Callable[[Scope], str],
+        path_prefix: str = "",
+        rejections: Optional[Counter] = None,
+    ) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            app (ASGIApp): The ASGI application.
+            limiter (RateLimiter): The rate limiter.
+            identify (Callable[[Scope], str]): Function returning the key of the
+                client of a request.
+            path_prefix (str): Only the paths starting with this prefix are limited.
+            rejections (Optional[Counter]): Counter of the rejected requests, by
+                bucket.
+        """
+        self.app = app
+        self.limiter = limiter
+        self.identify = identify
+        self.path_prefix = path_prefix
+        self.rejections = rejections
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Check the rate limits of the request."""
+        if (
+            scope["type"] != "http"
+            or not self.limiter.enabled
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        checked = self.limiter.check(self.identify(scope), scope["path"])
+        if checked is None:
+            await self.app(scope, receive, send)
+            return
+
+        bucket, result = checked
+        headers = result.headers()
+
+        if not result.allowed:
+            if self.rejections is not None:
+                self.rejections.inc(bucket)
+
+            response = JSONResponse(
+                status_code=429,
+                content={
+                    "detail": (
+                        "Too many requests, please retry in"
+                        f" {headers['Retry-After']} seconds."
+                    )
+                },
+                headers=headers,
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message_headers = MutableHeaders(scope=message)
+                for name, value in headers.items():
+                    message_headers[name] = value
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -19,17 +19,38 @@
 # and limitations under the License.
 """Authentication dependency for production."""
 
+import hashlib
+import re
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Union
-
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional, Tuple, Union
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Request,
+    WebSocket,
+    WebSocketException,
+)
 from fastapi import status as http_status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from loguru import logger
-
-from wordcab_transcribe.config import settings
-from wordcab_transcribe.models import Token, TokenData
+from starlette.datastructures import Headers
+from starlette.types import Scope
+
+from my_project.config import settings
+from my_project.engines.fair_queue import DEFAULT_TENANT
+from my_project.metrics import (
+    TOKEN_CACHE_EVICTIONS,
+    TOKEN_CACHE_LOOKUPS,
+    Counter,
+    registry,
+)
+from my_project.models import Token, TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.api_prefix}/auth")
 
@@ -39,9 +60,106 @@ credentials_exception = HTTPException(
     headers={"WWW-Authenticate": "Bearer"},
 )
 
+# Tenant ids are used as metric labels, keep them short and printable
+TENANT_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
 router = APIRouter()
 
 
+class TokenCache:
+    """Bounded LRU cache of the verified access tokens and their subject."""
+
+    def __init__(
+        self,
+        max_size: int,
+        lookups: Optional[Counter] = None,
+        evictions: Optional[Counter] = None,
+    ) -> None:
+        """
+        Initialize the token cache.
+
+        Args:
+            max_size (int): Maximum number of tokens to keep, 0 disables the cache.
+            lookups (Optional[Counter]): Counter of the lookups, by result: `hit` or
+                `miss`.
+            evictions (Optional[Counter]): Counter of the tokens evicted to stay
+                within `max_size`.
+        """
+        self.max_size = max_size
+        self.lookups = lookups
+        self.evictions = evictions
+
+        self._entries: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        """Number of cached tokens."""
+        return len(self._entries)
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        """Digest of the token, so the raw tokens are not kept in memory."""
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[str]:
+        """
+        Get the subject of a verified token, if it is cached and not expired.
+
+        Args:
+            token (str): The access token.
+
+        Returns:
+            Optional[str]: The subject of the token, or None on a cache miss.
+        """
+        key = self._key(token)
+        entry = self._entries.get(key)
+
+        if entry is not None and entry[1] <= time.time():
+            del self._entries[key]
+            entry = None
+
+        if self.lookups is not None:
+            self.lookups.inc("miss" if entry is None else "hit")
+        if entry is None:
+            return None
+
+        self._entries.move_to_end(key)
+
+        return entry[0]
+
+    def set(self, token: str, username: str, expires_at: float) -> None:
+        """
+        Cache the subject of a verified token until its expiration.
+
+        Args:
+            token (str): The access token.
+            username (str): The subject of the token.
+            expires_at (float): The expiration of the token, as a UNIX timestamp.
+        """
+        if self.max_size <= 0:
+            return
+
+        key = self._key(token)
+        self._entries[key] = (username, expires_at)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            if self.evictions is not None:
+                self.evictions.inc()
+
+
+token_cache = TokenCache(
+    max_size=settings.token_cache_size,
+    lookups=TOKEN_CACHE_LOOKUPS,
+    evictions=TOKEN_CACHE_EVICTIONS,
+)
+registry.callback_gauge(
+    "token_cache_size",
+    "Number of verified access tokens in the token cache.",
+    lambda: len(token_cache),
+)
+
+
 def _get_username() -> str:
     return settings.username
 
@@ -73,13 +191,17 @@ def create_access_token(
 
 
 async def get_current_user(
+    request: Request,
     token: str = Depends(oauth2_scheme),  # noqa: B008
     credentials: str = Depends(_get_username),  # noqa: B008
 ) -> str:
     """
     Get current user dependency function for authentication. Not meant to be used with Cortex endpoint.
 
+    The username is also stored in the request state, as the tenant of the request.
+
     Args:
+        request (Request): The request.
         token (str): Access token. Depends(oauth2_scheme).
         credentials (str): Username. Depends(_get_username).
 
@@ -89,21 +211,149 @@ async def get_current_user(
     Returns:
         str: Username.
     """
+    username = verify_token(token, credentials)
+    request.state.principal = username
+
+    return username
+
+
+async def get_tenant(
+    request: Request,
+    x_tenant_id: Optional[str] = Header(None),  # noqa: B008
+) -> str:
+    """
+    Get the tenant of a request, used to share the job queue fairly between tenants.
+
+    When the authentication is enabled, the tenant is the authenticated user: a
+    header chosen by the client would let it rotate tenants to get around the share
+    and the limits of its own. Otherwise, the `X-Tenant-ID` header, set by a trusted
+    gateway submitting jobs on behalf of its customers, is used.
+
+    Args:
+        request (Request): The request.
+        x_tenant_id (Optional[str]): The `X-Tenant-ID` header.
+
+    Raises:
+        HTTPException: If the tenant id is invalid.
+
+    Returns:
+        str: The tenant id.
+    """
+    principal = getattr(request.state, "principal", None)
+    if principal is not None:
+        return principal
+
+    if x_tenant_id is not None:
+        if not TENANT_PATTERN.fullmatch(x_tenant_id):
+            raise HTTPException(
+                status_code=http_status.HTTP_400_BAD_REQUEST,
+                detail=(
+                    "Invalid X-Tenant-ID header, expected 1 to 64 letters, digits,"
+                    " dots, dashes or underscores."
+                ),
+            )
+
+        return x_tenant_id
+
+    return DEFAULT_TENANT
+
+
+async def get_current_user_ws(
+    websocket: WebSocket,
+    credentials: str = Depends(_get_username),  # noqa: B008
+) -> str:
+    """
+    Get current user dependency function for the WebSocket endpoints.
+
+    The token is read from the `Authorization: Bearer` header or, since browsers
+    cannot set headers on WebSockets, from the `token` query parameter.
+
+    Args:
+        websocket (WebSocket): The WebSocket connection.
+        credentials (str): Username. Depends(_get_username).
+
+    Raises:
+        WebSocketException: If the credentials are not valid.
+
+    Returns:
+        str: Username.
+    """
+    scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        token = websocket.query_params.get("token", "")
+
     try:
-        payload = jwt.decode(
-            token, settings.openssl_key, algorithms=[settings.openssl_algorithm]
-        )
-        username: str = payload.get("sub")
+        return verify_token(token, credentials)
+    except HTTPException as e:
+        raise WebSocketException(
+            code=http_status.WS_1008_POLICY_VIOLATION, reason=e.detail
+        ) from e
+
+
+def get_rate_limit_key(scope: Scope) -> str:
+    """
+    Get the key identifying the client of a request, for the rate limits.
+
+    Runs before the authentication dependency, from the raw ASGI scope. Requests with
+    a valid access token are identified by their user only: headers chosen by the
+    client, like `X-Tenant-ID`, would let it get a fresh bucket per request. Other
+    requests are identified by their client address, so an invalid token cannot be
+    used to get a fresh bucket either.
+
+    Args:
+        scope (Scope): The ASGI scope of the request.
+
+    Returns:
+        str: The key of the client.
+    """
+    headers = Headers(scope=scope)
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+
+    if scheme.lower() == "bearer" and token:
+        try:
+            return f"user:{verify_token(token, settings.username)}"
+        except HTTPException:
+            pass
+
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def verify_token(token: str, credentials: str) -> str:
+    """
+    Verify an access token, using the token cache.
+
+    Args:
+        token (str): Access token.
+        credentials (str): The expected username.
+
+    Raises:
+        credentials_exception: If the credentials are not valid.
+
+    Returns:
+        str: Username.
+    """
+    username = token_cache.get(token)
+
+    if username is None:
+        try:
+            payload = jwt.decode(
+                token, settings.openssl_key, algorithms=[settings.openssl_algorithm]
+            )
+            username: str = payload.get("sub")
+
+            if username is None:
+                raise credentials_exception
 
-        if username is None:
-            raise credentials_exception
+            token_data = TokenData(username=username)
 
-        token_data = TokenData(username=username)
+        except JWTError as e:
+            raise credentials_exception from e
 
-    except JWTError as e:
-        raise credentials_exception from e
+        if payload.get("exp") is not None:
+            token_cache.set(token, token_data.username, payload["exp"])
 
-    if token_data.username != credentials:
+    if username != credentials:
         raise credentials_exception
 
     return username
@@ -18,68 +18,106 @@
 # See the License for the specific language governing permissions
 # and limitations under the License.
 """Audio url endpoint for the Wordcab Transcribe API."""
-import json
-import asyncio
 import shortuuid
+from pathlib import Path
 from typing import Optional
+from urllib.parse import urlparse
 
 from loguru import logger
 from fastapi import status as http_status
-from fastapi import APIRouter, BackgroundTasks
-
-from my_project.config import settings
-from my_project.dependencies import service, download_limit
+from fastapi import APIRouter, Depends
+
+from my_project.dependencies import (
+    download_limit,
+    io_executor,
+    job_queue,
+    job_store,
+    post_processing_stage,
+    result_cache,
+    s3_service,
+    webhook_service,
+)
+from my_project.engines.job_queue import QueueFullError
+from my_project.metrics import BACKGROUND_JOBS, JOB_STAGE_DURATION
 from my_project.models import ExampleRequest, ExampleResponse
+from my_project.router.authentication import get_tenant
+from my_project.serialization import dumps
+from my_project.services.example_service import ProcessException
 from my_project.utils import (
-    get_s3_client,
-    upload_file,
-    send_update_with_svix,
+    delete_file,
+    download_file_locally,
+    file_digest,
+    get_url_etag,
 )
 
 router = APIRouter()
 
-s3_client = get_s3_client()
-
 
 @router.post("", status_code=http_status.HTTP_202_ACCEPTED)
 async def inference_with_audio_url(
-    background_tasks: BackgroundTasks,
     url: str,
     send_to_s3: bool = False,
     send_to_svix: bool = False,
     data: Optional[ExampleRequest] = None,
+    tenant: str = Depends(get_tenant),  # noqa: B008
 ) -> dict:
-    """Inference endpoint with audio url."""
+    """Inference endpoint with audio url. Jobs are queued fairly between tenants."""
     uuid = f"audio_url_{shortuuid.ShortUUID().random(length=32)}"
     data = ExampleRequest() if data is None else ExampleRequest(**data.dict())
 
+    async def download_and_process():
+        filename = f"{uuid}{Path(urlparse(url).path).suffix}"
+        with JOB_STAGE_DURATION.time("download"):
+            await download_file_locally(url, filename)
+
+        try:
+            key = result_cache.make_key(await file_digest(filename), data)
+            with JOB_STAGE_DURATION.time("inference"):
+                return await result_cache.get_or_compute(
+                    key, lambda: post_processing_stage.process(filename, data)
+                )
+        finally:
+            await io_executor.run(delete_file, filename)
+
     async def process_audio():
         try:
             async with download_limit:
-                # fill in
-
-                # background_tasks.add_task(function, param=param)
-
-                task = asyncio.create_task(
-                    service.process_input()
+                await job_store.mark_processing(uuid)
+
+                # With an ETag, a cached result avoids even the download
+                etag = await get_url_etag(url)
+                if etag is not None:
+                    result = await result_cache.get_or_compute(
+                        result_cache.make_key(f"{url}\n{etag}", data),
+                        download_and_process,
+                    )
+                else:
+                    result = await download_and_process()
+
+                if isinstance(result, ProcessException):
+                    raise Exception(result.message)
+
+                # The result was validated by the service, only add the job fields
+                result = ExampleResponse.model_construct(
+                    **dict(result),
+                    multi_channel=data.multi_channel,
+                    job_name=data.job_name,
+                    task_token=data.task_token,
                 )
-
-                result = await task
-                result = ExampleResponse()
+                # Encoded once for both the job store and S3
+                payload = dumps(result)
+                await job_store.mark_finished(uuid, payload)
 
                 if send_to_s3:
-                    upload_file(
-                        s3_client,
-                        file=bytes(json.dumps(result.model_dump()).encode("UTF-8")),
-                        bucket=settings.aws_storage_bucket_name,
-                        object_name=f"responses/{data.task_token}_{data.job_name}.json",
-                    )
-
-                # background_tasks.add_task(function, param=param)
+                    with JOB_STAGE_DURATION.time("s3_upload"):
+                        await s3_service.upload_json(
+                            payload,
+                            object_name=f"responses/{data.task_token}_{data.job_name}.json",
+                        )
 
                 if send_to_svix:
-                    await send_update_with_svix(
-                        data.job_name,
+                    webhook_service.send(
+                        uuid,
                         "finished",
                         {
                             "job_name": data.job_name,
@@ -89,6 +127,7 @@ async def inference_with_audio_url(
         except Exception as e:
             error_message = f"Error during transcription: {e}"
             logger.error(error_message)
+            await job_store.mark_error(uuid, error_message)
 
             if send_to_svix:
                 error_payload = {
@@ -97,11 +136,22 @@ async def inference_with_audio_url(
                     "task_token": data.task_token,
                 }
 
-                await send_update_with_svix(data.job_name, "error", error_payload)
-
-    # Add the process_audio function to background tasks
-    background_tasks.add_task(process_audio)
-
-    # Return the job name and task token immediately
-    return {"job_name": data.job_name, "task_token": data.task_token}
+                webhook_service.send(uuid, "error", error_payload)
+        finally:
+            BACKGROUND_JOBS.dec()
+
+    # Queue the process_audio function, rejected with a Retry-After if the queue or the
+    # share of the tenant is full. The job is written to the store first, so that it
+    # is recovered if the worker dies once its id is returned
+    job_queue.check_admission(tenant)
+    await job_store.create(uuid, job_name=data.job_name, task_token=data.task_token)
+    try:
+        job_queue.submit(process_audio, tenant=tenant)
+    except QueueFullError:
+        await job_store.mark_error(uuid, "The job queue is full.")
+        raise
+    BACKGROUND_JOBS.inc()
+
+    # Return the job id, job name and task token immediately
+    return {"job_id": uuid, "job_name": data.job_name, "task_token": data.task_token}
 
@@ -0,0 +1,39 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Routers of the API endpoints."""
+
+from fastapi import APIRouter
+
+from my_project.router.authentication import router as auth_router  # noqa: F401
+from my_project.router.v1.async_endpoint import router as async_router
+from my_project.router.v1.jobs_endpoint import router as jobs_router
+from my_project.router.v1.stream_endpoint import router as stream_router  # noqa: F401
+from my_project.router.v1.sync_endpoint import router as sync_router
+
+api_router = APIRouter()
+
+routers = (
+    (async_router, "/audio-url", "async"),
+    (sync_router, "/audio", "sync"),
+    (jobs_router, "/jobs", "jobs"),
+)
+
+for router, prefix, tags in routers:
+    api_router.include_router(router, prefix=prefix, tags=[tags])
@@ -0,0 +1,72 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Jobs endpoints to poll the status and fetch the result of the async jobs."""
+
+import orjson
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi import status as http_status
+
+from my_project.dependencies import job_store
+from my_project.serialization import FastJSONResponse, negotiate_response_class
+from my_project.services.job_store import Job, JobStatus
+
+router = APIRouter()
+
+
+@router.get("/{job_id}", response_model=Job, status_code=http_status.HTTP_200_OK)
+async def get_job(job_id: str) -> Job:
+    """Get the status and timing of a job."""
+    job = await job_store.get(job_id)
+
+    if job is None:
+        raise HTTPException(
+            status_code=http_status.HTTP_404_NOT_FOUND,
+            detail=f"Job {job_id} not found.",
+        )
+
+    return job
+
+
+@router.get("/{job_id}/result", status_code=http_status.HTTP_200_OK)
+async def get_job_result(job_id: str, request: Request) -> Response:
+    """Get the result of a finished job, as JSON or MessagePack."""
+    job = await job_store.get(job_id)
+
+    if job is None:
+        raise HTTPException(
+            status_code=http_status.HTTP_404_NOT_FOUND,
+            detail=f"Job {job_id} not found.",
+        )
+    if job.status != JobStatus.finished:
+        raise HTTPException(
+            status_code=http_status.HTTP_409_CONFLICT,
+            detail=f"Job {job_id} has no result, its status is `{job.status.value}`.",
+        )
+
+    result = await job_store.get_result(job_id)
+
+    # The result is stored as JSON, only MessagePack clients need a conversion
+    response_class = negotiate_response_class(request.headers.get("accept", ""))
+    if response_class is FastJSONResponse:
+        return Response(
+            content=result, media_type="application/json", headers={"Vary": "Accept"}
+        )
+
+    return response_class(orjson.loads(result), headers={"Vary": "Accept"})
@@ -0,0 +1,225 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""WebSocket streaming endpoint."""
+
+import asyncio
+import json
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import status as http_status
+from loguru import logger
+from pydantic import ValidationError
+from starlette.websockets import WebSocketState
+
+from my_project.config import settings
+from my_project.dependencies import service, stream_session_limit
+from my_project.metrics import STREAM_SESSIONS
+from my_project.models import ExampleRequest
+from my_project.services.example_service import StreamingSession
+
+router = APIRouter()
+
+
+class ProtocolError(Exception):
+    """Raised when the client sends an unexpected message."""
+
+
+async def receive_message(websocket: WebSocket) -> Tuple[Optional[bytes], dict]:
+    """
+    Receive the next message of the client.
+
+    Args:
+        websocket (WebSocket): The WebSocket connection.
+
+    Raises:
+        WebSocketDisconnect: If the client disconnected.
+        ProtocolError: If a text message is not a JSON object.
+
+    Returns:
+        Tuple[Optional[bytes], dict]: The audio of a binary message, or the content of
+            a text message.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+
+    if message.get("bytes") is not None:
+        return message["bytes"], {}
+
+    try:
+        content = json.loads(message.get("text") or "")
+    except ValueError as e:
+        raise ProtocolError("Text messages must be JSON objects.") from e
+    if not isinstance(content, dict):
+        raise ProtocolError("Text messages must be JSON objects.")
+
+    return None, content
+
+
+async def receive_audio(
+    websocket: WebSocket,
+    chunks: "asyncio.Queue[Optional[bytes]]",
+    first_message: Optional[Tuple[Optional[bytes], dict]] = None,
+) -> None:
+    """
+    Queue the audio frames of the client until the `end` message.
+
+    The queue is bounded: while it is full, the socket is not read, so the client is
+    slowed down by the TCP flow control instead of growing the server memory.
+
+    Args:
+        websocket (WebSocket): The WebSocket connection.
+        chunks (asyncio.Queue[Optional[bytes]]): The queue of audio chunks, ended by
+            None.
+        first_message (Optional[Tuple[Optional[bytes], dict]]): A message already
+            received, to handle before reading the socket.
+    """
+    while True:
+        if first_message is not None:
+            (chunk, content), first_message = first_message, None
+        else:
+            chunk, content = await receive_message(websocket)
+
+        if chunk is not None:
+            await chunks.put(chunk)
+        elif content.get("type") == "end":
+            await chunks.put(None)
+            return
+        else:
+            raise ProtocolError("Expected audio frames or an `end` message.")
+
+
+async def process_audio(
+    websocket: WebSocket,
+    session: StreamingSession,
+    chunks: "asyncio.Queue[Optional[bytes]]",
+) -> None:
+    """
+    Feed the queued audio to the session and push the utterances back.
+
+    Args:
+        websocket (WebSocket): The WebSocket connection.
+        session (StreamingSession): The streaming session of the service.
+        chunks (asyncio.Queue[Optional[bytes]]): The queue of audio chunks, ended by
+            None.
+    """
+    while True:
+        chunk = await chunks.get()
+        if chunk is None:
+            utterances = await session.finish()
+        else:
+            utterances = await session.feed(chunk)
+
+        for utterance in utterances:
+            await websocket.send_json(
+                {
+                    "type": "final" if utterance.final else "partial",
+                    "text": utterance.text,
+                }
+            )
+
+        if chunk is None:
+            return
+
+
+async def run_session(websocket: WebSocket) -> None:
+    """
+    Run a streaming session, from the first message to the end of the stream.
+
+    Args:
+        websocket (WebSocket): The accepted WebSocket connection.
+    """
+    first_message = await receive_message(websocket)
+    chunk, content = first_message
+    if chunk is None and content.get("type") == "config":
+        content.pop("type")
+        data = ExampleRequest(**content)
+        first_message = None
+    else:
+        data = ExampleRequest()
+
+    session = service.create_session(data)
+    chunks: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(
+        maxsize=settings.stream_max_pending_chunks
+    )
+
+    receiver = asyncio.create_task(receive_audio(websocket, chunks, first_message))
+    processor = asyncio.create_task(process_audio(websocket, session, chunks))
+    try:
+        await asyncio.wait((receiver, processor), return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in (receiver, processor):
+            task.cancel()
+        await asyncio.gather(receiver, processor, return_exceptions=True)
+
+    for task in (receiver, processor):
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+
+    await websocket.send_json({"type": "end"})
+
+
+async def close(websocket: WebSocket, code: int, reason: str = "") -> None:
+    """Close the connection, unless the client already closed it."""
+    if websocket.client_state == WebSocketState.CONNECTED:
+        await websocket.close(code=code, reason=reason)
+
+
+@router.websocket("")
+async def stream(websocket: WebSocket) -> None:
+    """
+    Streaming endpoint with audio frames.
+
+    The client may first send a `{"type": "config", ...}` text message with the
+    request parameters, then sends the audio as binary frames, then an
+    `{"type": "end"}` message. The server pushes `{"type": "partial" | "final",
+    "text": ...}` messages as the audio is processed, and `{"type": "end"}` once the
+    last utterances are sent.
+    """
+    await websocket.accept()
+
+    if stream_session_limit.locked():
+        await websocket.close(
+            code=http_status.WS_1013_TRY_AGAIN_LATER,
+            reason="Too many streaming sessions, please retry later.",
+        )
+        return
+
+    async with stream_session_limit:
+        with STREAM_SESSIONS.track():
+            try:
+                await run_session(websocket)
+            except WebSocketDisconnect:
+                logger.debug("Streaming client disconnected.")
+                return
+            except (ProtocolError, ValidationError) as e:
+                await close(
+                    websocket, http_status.WS_1008_POLICY_VIOLATION, str(e)[:120]
+                )
+                return
+            except Exception as e:
+                logger.error(f"Streaming session failed: {e}")
+                await close(
+                    websocket, http_status.WS_1011_INTERNAL_ERROR, "Processing failed."
+                )
+                return
+
+            await close(websocket, http_status.WS_1000_NORMAL_CLOSURE)
@@ -19,25 +19,205 @@
 # and limitations under the License.
 """Sync endpoint."""
 
-import asyncio
-from typing import List, Union
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple, Union
 
+import shortuuid
 from loguru import logger
 from fastapi import status as http_status
-from fastapi import APIRouter, BackgroundTasks, File, Form, HTTPException, UploadFile
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    File,
+    Form,
+    HTTPException,
+    Request,
+    UploadFile,
+)
+from fastapi.responses import StreamingResponse
 
-from my_project.dependencies import service
+from my_project.config import settings
+from my_project.dependencies import (
+    io_executor,
+    job_queue,
+    post_processing_stage,
+    result_cache,
+    service,
+)
 from my_project.models import ExampleRequest, ExampleResponse
+from my_project.serialization import dumps, negotiate_response_class
 from my_project.services.example_service import ProcessException
-from my_project.utils import *
+from my_project.utils import (
+    UploadTooLargeError,
+    delete_file,
+    file_digest,
+    format_utterances,
+    get_spooled_file_path,
+    save_file_locally,
+)
 
 router = APIRouter()
 
+# Media types of the streaming mode, selected with the Accept header
+STREAMING_MEDIA_TYPES = ("application/x-ndjson", "text/event-stream")
+
+
+def get_streaming_media_type(accept: str) -> Optional[str]:
+    """
+    Select the streaming media type requested by the client, if any.
+
+    Args:
+        accept (str): The Accept header of the request.
+
+    Returns:
+        Optional[str]: The streaming media type, None for a regular JSON response.
+    """
+    for media_type in STREAMING_MEDIA_TYPES:
+        if media_type in accept:
+            return media_type
+
+    return None
+
+
+def format_event(media_type: str, event: str, data: dict) -> bytes:
+    """
+    Format an event as an NDJSON line or a server-sent event.
+
+    Args:
+        media_type (str): The streaming media type.
+        event (str): The event name: `utterance`, `result` or `error`.
+        data (dict): The event payload.
+
+    Returns:
+        bytes: The formatted event.
+    """
+    if media_type == "text/event-stream":
+        return b"event: %s\ndata: %s\n\n" % (event.encode(), dumps(data))
+
+    return dumps({"event": event, "data": data}) + b"\n"
+
+
+async def stream_events(
+    audio: str, data: ExampleRequest, key: str
+) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Yield the utterances of an input as the service produces them, then the result.
+
+    Cached results are replayed. Streamed inputs bypass the batching engine, since
+    a batch only returns once all its inputs are processed, and the chunking stage.
+    Their utterances are formatted one at a time, like the utterances of the
+    results. Since they are not processed by the same stages, the streamed results
+    are not cached.
+
+    Multi-channel inputs are processed by the stages like the regular requests, then
+    replayed: their utterances are interleaved by start time, so none is known to
+    come next before every channel is processed.
+
+    Args:
+        audio (str): Path of the audio to process.
+        data (ExampleRequest): The request parameters.
+        key (str): The result cache key of the input.
+
+    Yields:
+        Tuple[str, dict]: The event names and payloads.
+    """
+    result = await result_cache.get(key)
+
+    if result is None and data.multi_channel:
+        result = await result_cache.get_or_compute(
+            key, lambda: post_processing_stage.process(audio, data)
+        )
+        if isinstance(result, ProcessException):
+            logger.error(result.message)
+            yield "error", {"detail": f"Process failed: {result.message}"}
+            return
+
+    if result is None:
+        index = 0
+        async for item in service.stream_input(audio, data):
+            if isinstance(item, str):
+                text = format_utterances([item])[0]
+                if text is not None:
+                    yield "utterance", {"index": index, "text": text}
+                    index += 1
+            elif isinstance(item, ProcessException):
+                logger.error(item.message)
+                yield "error", {"detail": f"Process failed: {item.message}"}
+                return
+            else:
+                result = item
+    else:
+        for index, utterance in enumerate(result.utterances):
+            yield "utterance", {"index": index, "text": utterance}
+
+    response = ExampleResponse.model_construct(
+        **dict(result), multi_channel=data.multi_channel
+    )
+    yield "result", response.model_dump(mode="json", exclude={"utterances"})
+
+
+async def stream_response(
+    audio: str,
+    data: ExampleRequest,
+    media_type: str,
+    background_tasks: BackgroundTasks,
+) -> StreamingResponse:
+    """
+    Start processing an input and stream its events.
+
+    The first event is awaited before responding, so that a failure before the first
+    utterance still returns an error status. Later failures are sent as an `error`
+    event. The job queue slot is held until the stream ends or the client leaves.
+
+    Args:
+        audio (str): Path of the audio to process.
+        data (ExampleRequest): The request parameters.
+        media_type (str): The streaming media type.
+        background_tasks (BackgroundTasks): The tasks run once the response is sent.
+
+    Returns:
+        StreamingResponse: The response streaming the events.
+    """
+    stack = AsyncExitStack()
+    await stack.enter_async_context(job_queue.admit())
+
+    try:
+        key = result_cache.make_key(await file_digest(audio), data)
+        events = stream_events(audio, data, key)
+        stack.push_async_callback(events.aclose)
+
+        event, payload = await events.__anext__()
+    except BaseException:
+        await stack.aclose()
+        raise
+
+    if event == "error":
+        await stack.aclose()
+        raise HTTPException(
+            status_code=http_status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=payload["detail"],
+        )
+    background_tasks.add_task(stack.aclose)
+
+    async def body() -> AsyncIterator[bytes]:
+        yield format_event(media_type, event, payload)
+        async for next_event, next_payload in events:
+            yield format_event(media_type, next_event, next_payload)
+
+    # Disable the proxy buffering of Nginx, which would hold the events back
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @router.post(
     "", response_model=Union[ExampleResponse, str], status_code=http_status.HTTP_200_OK
 )
 async def inference_with_audio(  # noqa: C901
+    request: Request,
     background_tasks: BackgroundTasks,
     batch_size: Union[int, None] = Form(None),  # noqa: B008
     offset_start: Union[float, None] = Form(None),  # noqa: B008
@@ -57,7 +237,14 @@ async def inference_with_audio(  # noqa: C901
     condition_on_previous_text: bool = Form(True),  # noqa: B008
     file: UploadFile = File(...),  # noqa: B008
 ) -> ExampleResponse:
-    """Inference endpoint with audio file."""
+    """
+    Inference endpoint with audio file.
+
+    With an `Accept: application/x-ndjson` or `Accept: text/event-stream` header, the
+    utterances are streamed as `utterance` events as soon as they are transcribed,
+    followed by a `result` event with the rest of the response. With an
+    `Accept: application/msgpack` header, the response is encoded with MessagePack.
+    """
 
     data = ExampleRequest(
         offset_start=offset_start,
@@ -78,24 +265,41 @@ async def inference_with_audio(  # noqa: C901
         multi_channel=multi_channel,
     )
 
+    job_queue.check_admission()
+    media_type = get_streaming_media_type(request.headers.get("accept", ""))
+
     try:
-        # something with data
-        pass
+        # The form file is closed once the endpoint returns, before a streamed body
+        # is processed, so a streamed input is always copied
+        audio = None
+        if settings.zero_copy_uploads and media_type is None:
+            audio = get_spooled_file_path(file)
+
+        if audio is None:
+            suffix = Path(file.filename).suffix
+            audio = f"audio_{shortuuid.ShortUUID().random(length=32)}{suffix}"
+            await save_file_locally(filename=audio, file=file)
+            background_tasks.add_task(io_executor.run, delete_file, filepath=audio)
 
+    except UploadTooLargeError as e:
+        raise HTTPException(  # noqa: B904
+            status_code=http_status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e),
+        )
     except Exception as e:
         raise HTTPException(  # noqa: B904
             status_code=http_status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Process failed: {e}",
         )
 
-    # background_tasks.add_task(function, param=param)
-
-    task = asyncio.create_task(
-        service.process_input()
-    )
-    result = await task
+    if media_type is not None:
+        return await stream_response(audio, data, media_type, background_tasks)
 
-    # background_tasks.add_task(function, param=param)
+    async with job_queue.admit():
+        key = result_cache.make_key(await file_digest(audio), data)
+        result = await result_cache.get_or_compute(
+            key, lambda: post_processing_stage.process(audio, data)
+        )
 
     if isinstance(result, ProcessException):
         logger.error(result.message)
@@ -104,4 +308,11 @@ async def inference_with_audio(  # noqa: C901
             detail=str(result.message),
         )
     else:
-        return ExampleResponse()
+        # Returned as a response to skip the re-validation of the `response_model`
+        response_class = negotiate_response_class(request.headers.get("accept", ""))
+        return response_class(
+            ExampleResponse.model_construct(
+                **dict(result), multi_channel=data.multi_channel
+            ),
+            headers={"Vary": "Accept"},
+        )
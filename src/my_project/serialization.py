@@ -0,0 +1,147 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Serialization of the API responses and stored results."""
+
+from typing import Any, Iterator, Type
+
+import orjson
+import pydantic_core
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# Also accept the legacy media type still sent by some clients
+MSGPACK_ACCEPTED_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+
+def _default(obj: Any) -> Any:
+    """Serialize the objects orjson does not support natively."""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize content to UTF-8 JSON bytes in a single pass.
+
+    Models are serialized by their compiled pydantic-core serializer, without building
+    an intermediate dict. Other content, like the small dicts returned by most
+    endpoints, is serialized with orjson.
+
+    Args:
+        content (Any): A pydantic model, or any content supported by orjson.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    if isinstance(content, BaseModel):
+        return pydantic_core.to_json(content)
+
+    return orjson.dumps(content, default=_default)
+
+
+def iter_json(content: Any) -> Iterator[bytes]:
+    """
+    Serialize content to UTF-8 JSON bytes, in chunks.
+
+    The fields of a model, and the items of its list fields, are serialized one at a
+    time, so that a large result is never held as a single document. The chunks add
+    up to the output of `dumps`.
+
+    Args:
+        content (Any): A pydantic model, or any content supported by orjson.
+
+    Yields:
+        bytes: The chunks of the JSON document.
+    """
+    if not isinstance(content, BaseModel) or content.model_extra:
+        yield dumps(content)
+        return
+
+    separator = b"{"
+    for name in type(content).model_fields:
+        yield separator + orjson.dumps(name) + b":"
+        separator = b","
+
+        value = getattr(content, name)
+        if not isinstance(value, list):
+            yield pydantic_core.to_json(value)
+            continue
+
+        item_separator = b"["
+        for item in value:
+            yield item_separator + pydantic_core.to_json(item)
+            item_separator = b","
+        yield b"[]" if item_separator == b"[" else b"]"
+
+    yield b"{}" if separator == b"{" else b"}"
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with `dumps`, the default response class of the API.
+
+    Endpoints returning large models should return this response with the model as
+    content: FastAPI then skips the validation and conversion of the model to a dict
+    it runs for the `response_model`, which dominate the cost of big transcripts.
+    """
+
+    def render(self, content: Any) -> bytes:
+        """Serialize the content."""
+        return dumps(content)
+
+
+class MsgPackResponse(Response):
+    """MessagePack response, for the clients sending `Accept: application/msgpack`."""
+
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        """Serialize the content."""
+        if isinstance(content, BaseModel):
+            content = content.model_dump(mode="json")
+
+        return msgpack.packb(content)
+
+
+def negotiate_response_class(accept: str) -> Type[Response]:
+    """
+    Select the response class of a model from the Accept header of the request.
+
+    MessagePack is only used when the optional `msgpack` package is installed, other
+    clients get the usual JSON response.
+
+    Args:
+        accept (str): The Accept header of the request.
+
+    Returns:
+        Type[Response]: `MsgPackResponse` or `FastJSONResponse`.
+    """
+    if msgpack is not None and any(t in accept for t in MSGPACK_ACCEPTED_TYPES):
+        return MsgPackResponse
+
+    return FastJSONResponse
@@ -0,0 +1,331 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Pre-fork server running the API in several worker processes."""
+
+import argparse
+import asyncio
+import gc
+import importlib
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from multiprocessing.sharedctypes import RawArray
+from typing import Dict, Optional
+
+import uvicorn
+from loguru import logger
+
+from my_project import dependencies
+from my_project.config import settings
+from my_project.metrics import registry
+
+# Exit code of a worker whose application failed to start, as in uvicorn
+STARTUP_FAILURE = 3
+# Number of ticks of the worker loops, of 0.1 secs each, between two metrics writes
+METRICS_WRITE_TICKS = 10
+
+
+def exit_code_of(status: int) -> int:
+    """
+    Convert a wait status to an exit code, like `os.waitstatus_to_exitcode`.
+
+    Args:
+        status (int): The status returned by `os.waitpid`.
+
+    Returns:
+        int: The exit code of the process, or minus the signal that killed it.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+
+    return os.WEXITSTATUS(status)
+
+
+class WorkerServer(uvicorn.Server):
+    """
+    Uvicorn server reporting a heartbeat to the master on each tick of its loop.
+
+    The loop only ticks once the application started, so no heartbeat is reported
+    during the startup. Every `METRICS_WRITE_TICKS` ticks, the metrics of the worker
+    are written for the other workers to aggregate.
+    """
+
+    def __init__(
+        self, config: uvicorn.Config, heartbeats: RawArray, index: int
+    ) -> None:
+        """
+        Initialize the worker server.
+
+        Args:
+            config (uvicorn.Config): The uvicorn configuration.
+            heartbeats (RawArray): The heartbeats shared with the master.
+            index (int): The slot of this worker in the heartbeats.
+        """
+        super().__init__(config)
+        self.heartbeats = heartbeats
+        self.index = index
+
+    async def on_tick(self, counter: int) -> bool:
+        """Record the heartbeat, then run the uvicorn housekeeping."""
+        self.heartbeats[self.index] = time.monotonic()
+        if counter % METRICS_WRITE_TICKS == 0:
+            registry.write()
+
+        return await super().on_tick(counter)
+
+
+class PreforkServer:
+    """
+    Load the service once in a master process, then fork the workers serving the API.
+
+    The master warms the service up and recovers the job store before forking, then
+    freezes the garbage collector so that the objects it created are never touched
+    again and their memory pages stay shared copy-on-write with the workers. Each
+    worker runs its own event loop, so the queues and caches are per worker. The
+    metrics are aggregated across the workers through a temporary directory.
+
+    The master restarts the workers that exit, and kills the workers whose event loop
+    stopped ticking for `heartbeat_timeout` seconds, or that did not finish starting
+    within `startup_timeout` seconds. The jobs left unfinished by a dead worker are
+    flagged as failed before it is replaced.
+
+    The service must be fork-safe: a model loaded on a GPU cannot be shared this way,
+    since CUDA contexts do not survive a fork.
+    """
+
+    def __init__(
+        self,
+        config: uvicorn.Config,
+        workers: int,
+        heartbeat_timeout: float,
+        startup_timeout: float,
+    ) -> None:
+        """
+        Initialize the pre-fork server.
+
+        Args:
+            config (uvicorn.Config): The uvicorn configuration of the workers.
+            workers (int): The number of worker processes.
+            heartbeat_timeout (float): Time in seconds after which a worker without
+                heartbeat is considered stuck.
+            startup_timeout (float): Time in seconds after which a worker that did
+                not finish starting is considered stuck.
+        """
+        self.config = config
+        self.workers = workers
+        self.heartbeat_timeout = heartbeat_timeout
+        self.startup_timeout = startup_timeout
+
+        # The last heartbeat of each worker, 0 until it finished starting
+        self.heartbeats = RawArray("d", workers)
+        self.spawned_at: Dict[int, float] = {}
+        self.pids: Dict[int, int] = {}
+        self.should_exit = False
+        self.sock: Optional[socket.socket] = None
+
+    def run(self) -> int:
+        """
+        Preload the service, start the workers and supervise them until a shutdown.
+
+        Returns:
+            int: The exit code of the master.
+        """
+        self.sock = self.config.bind_socket()
+        registry.share(tempfile.mkdtemp(prefix="my_project-metrics-"))
+
+        asyncio.run(self.preload())
+        dependencies.preloaded = True
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGINT, self.handle_exit)
+        signal.signal(signal.SIGTERM, self.handle_exit)
+
+        logger.info(f"Starting {self.workers} workers [master pid {os.getpid()}]")
+        for index in range(self.workers):
+            self.spawn(index)
+
+        exit_code = 0
+        while not self.should_exit:
+            time.sleep(0.5)
+            if not self.reap():
+                exit_code = STARTUP_FAILURE
+                break
+            self.check_heartbeats()
+
+        self.shutdown()
+        self.sock.close()
+        shutil.rmtree(registry.directory, ignore_errors=True)
+
+        return exit_code
+
+    async def preload(self) -> None:
+        """Run the one-time startup steps shared by all the workers."""
+        await dependencies.job_store.start()
+        await dependencies.job_store.recover()
+        await dependencies.job_store.close()
+
+        logger.info("Warmup initialization...")
+        # The workers inherit the warmup state, so they report ready right away
+        await dependencies.warmup.run()
+
+        # The SDKs of the enabled services are imported on first use, import them
+        # once here so that the workers share them instead of each paying for it
+        if settings.aws_storage_bucket_name:
+            importlib.import_module("boto3")
+        if dependencies.webhook_service.enabled:
+            importlib.import_module("svix.api")
+
+    async def recover(self, pid: int) -> None:
+        """Flag the jobs left unfinished by a dead worker as failed."""
+        await dependencies.job_store.start()
+        await dependencies.job_store.recover(worker_pid=pid)
+        await dependencies.job_store.close()
+
+    def handle_exit(self, sig: int, frame: object) -> None:
+        """Stop the supervision loop on SIGINT or SIGTERM."""
+        self.should_exit = True
+
+    def spawn(self, index: int) -> None:
+        """Fork a worker in the given slot."""
+        self.heartbeats[index] = 0.0
+        self.spawned_at[index] = time.monotonic()
+
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+            exit_code = 0
+            try:
+                registry.reset()
+                server = WorkerServer(self.config, self.heartbeats, index)
+                server.run(sockets=[self.sock])
+                registry.write()
+                if not server.started:
+                    exit_code = STARTUP_FAILURE
+            except BaseException as e:
+                logger.error(f"Worker {os.getpid()} crashed: {e}")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        self.pids[index] = pid
+        logger.info(f"Started worker {pid}")
+
+    def reap(self) -> bool:
+        """
+        Collect the exited workers and restart them.
+
+        Returns:
+            bool: False if a worker failed to start, in which case none is restarted.
+        """
+        while self.pids:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+
+            index = next((i for i, p in self.pids.items() if p == pid), None)
+            if index is None:
+                continue
+            del self.pids[index]
+
+            exit_code = exit_code_of(status)
+            if exit_code == STARTUP_FAILURE:
+                logger.error(f"Worker {pid} failed to start, shutting down.")
+                return False
+
+            logger.warning(f"Worker {pid} exited with code {exit_code}, restarting.")
+            registry.retire(pid)
+            try:
+                asyncio.run(self.recover(pid))
+            except Exception as e:
+                logger.error(f"Failed to recover the jobs of worker {pid}: {e}")
+            self.spawn(index)
+
+        return True
+
+    def check_heartbeats(self) -> None:
+        """Kill the workers whose event loop is stuck, they restart once reaped."""
+        now = time.monotonic()
+        for index, pid in self.pids.items():
+            if self.heartbeats[index] == 0.0:
+                timeout, last_report = self.startup_timeout, self.spawned_at[index]
+            else:
+                timeout, last_report = self.heartbeat_timeout, self.heartbeats[index]
+
+            if now - last_report > timeout:
+                logger.error(
+                    f"Worker {pid} did not report for {timeout} secs, killing it."
+                )
+                self.heartbeats[index] = now
+                os.kill(pid, signal.SIGKILL)
+
+    def shutdown(self) -> None:
+        """Ask the workers to shut down gracefully, and kill the ones that hang."""
+        for pid in self.pids.values():
+            os.kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.heartbeat_timeout
+        remaining = set(self.pids.values())
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                    remaining.discard(pid)
+            time.sleep(0.1)
+
+        for pid in remaining:
+            logger.error(f"Worker {pid} did not shut down in time, killing it.")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.pids.clear()
+
+
+def main() -> None:
+    """Parse the command line and run the pre-fork server."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1", help="The host to bind to.")
+    parser.add_argument("--port", type=int, default=5001, help="The port to bind to.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.workers,
+        help="The number of worker processes.",
+    )
+    args = parser.parse_args()
+
+    from my_project.main import app
+
+    config = uvicorn.Config(app, host=args.host, port=args.port, lifespan="on")
+    server = PreforkServer(
+        config,
+        workers=args.workers,
+        heartbeat_timeout=settings.worker_heartbeat_timeout,
+        startup_timeout=settings.worker_startup_timeout,
+    )
+
+    raise SystemExit(server.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -20,11 +20,14 @@
 """Example service."""
 
 from enum import Enum
-from typing import List
+from typing import TYPE_CHECKING, AsyncIterator, List, Tuple, Union
 from pydantic import BaseModel
 
 from my_project.config import settings
-from my_project.models import Example
+from my_project.models import Example, ExampleRequest, StreamingUtterance
+
+if TYPE_CHECKING:
+    import numpy as np
 
 
 class ExceptionSource(str, Enum):
@@ -45,6 +48,48 @@ class ProcessException(BaseModel):
     message: str
 
 
+class StreamingSession:
+    """
+    Incremental processing of an audio stream.
+
+    Partial utterances can still change as more audio is received, while final ones
+    are settled. The example session only counts the received audio.
+    """
+
+    def __init__(self, data: ExampleRequest) -> None:
+        """
+        Initialize the streaming session.
+
+        Args:
+            data (ExampleRequest): The request parameters.
+        """
+        self.data = data
+        self.received = 0
+
+    async def feed(self, chunk: bytes) -> List[StreamingUtterance]:
+        """
+        Process the next chunk of audio.
+
+        Args:
+            chunk (bytes): The audio chunk.
+
+        Returns:
+            List[StreamingUtterance]: The utterances updated by this chunk.
+        """
+        self.received += len(chunk)
+
+        return []
+
+    async def finish(self) -> List[StreamingUtterance]:
+        """
+        Process the end of the stream.
+
+        Returns:
+            List[StreamingUtterance]: The remaining utterances, all final.
+        """
+        return []
+
+
 class ExampleService:
     """Example Service."""
 
@@ -56,9 +101,80 @@ class ExampleService:
         """Warmup the GPU."""
         pass
 
-    async def process_input(self) -> None:
-        """Process input."""
-        pass
+    async def process_input(
+        self, audio: Union[str, "np.ndarray"], data: ExampleRequest
+    ) -> Union[Example, ProcessException]:
+        """
+        Process a single input.
+
+        Args:
+            audio (Union[str, np.ndarray]): Path or url of the audio to process, or
+                its 16 kHz float samples.
+            data (ExampleRequest): The request parameters.
+
+        Returns:
+            Union[Example, ProcessException]: The result or the exception raised.
+        """
+        results = await self.process_batch([(audio, data)])
+
+        return results[0]
+
+    def create_session(self, data: ExampleRequest) -> StreamingSession:
+        """
+        Create a session processing an audio stream incrementally.
+
+        Args:
+            data (ExampleRequest): The request parameters.
+
+        Returns:
+            StreamingSession: The streaming session.
+        """
+        return StreamingSession(data)
+
+    async def stream_input(
+        self, audio: str, data: ExampleRequest
+    ) -> AsyncIterator[Union[str, Example, ProcessException]]:
+        """
+        Process a single input, yielding each utterance as soon as it is available.
+
+        Engines able to transcribe segment by segment should override this method. By
+        default, the utterances are yielded once the whole input is processed.
+
+        Args:
+            audio (str): Path or url of the audio to process.
+            data (ExampleRequest): The request parameters.
+
+        Yields:
+            Union[str, Example, ProcessException]: The utterances, in order, then the
+                complete result. Or the exception raised, as the last item.
+        """
+        result = await self.process_input(audio, data)
+        if isinstance(result, Example):
+            for utterance in result.utterances:
+                yield utterance
+
+        yield result
+
+    async def process_batch(
+        self, batch: List[Tuple[Union[str, "np.ndarray"], ExampleRequest]]
+    ) -> List[Union[Example, ProcessException]]:
+        """
+        Process a batch of inputs with compatible parameters in a single call.
+
+        Inputs are paths or urls of audio files, or the 16 kHz float samples of a
+        channel, which can be a strided view.
+
+        Args:
+            batch (List[Tuple[Union[str, np.ndarray], ExampleRequest]]): The
+                (audio, data) pairs to process.
+
+        Returns:
+            List[Union[Example, ProcessException]]: One result per input, in order.
+        """
+        return [
+            Example(utterances=[], audio_duration=0.0, **data.model_dump())
+            for _, data in batch
+        ]
 
     def example_function(self) -> List[str]:
         """Example function."""
@@ -0,0 +1,365 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Job store recording the state, timing and result of the background jobs."""
+
+import asyncio
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    job_name TEXT,
+    task_token TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT,
+    result BLOB,
+    worker_pid INTEGER
+)
+"""
+
+
+class JobStatus(str, Enum):
+    """Job status enum."""
+
+    queued = "queued"
+    processing = "processing"
+    finished = "finished"
+    error = "error"
+
+
+class Job(BaseModel):
+    """Job model."""
+
+    job_id: str
+    status: JobStatus = JobStatus.queued
+    job_name: Optional[str] = None
+    task_token: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        """Whether the job reached a final state."""
+        return self.status in {JobStatus.finished, JobStatus.error}
+
+
+class JobStore(ABC):
+    """Interface of the job stores."""
+
+    async def start(self) -> None:
+        """Open the store."""
+
+    async def recover(self, worker_pid: Optional[int] = None) -> None:
+        """Flag the jobs left unfinished by a previous run or worker as failed."""
+
+    async def close(self) -> None:
+        """Flush the pending writes and close the store."""
+
+    @abstractmethod
+    async def create(
+        self,
+        job_id: str,
+        job_name: Optional[str] = None,
+        task_token: Optional[str] = None,
+    ) -> Job:
+        """Record a new queued job."""
+
+    @abstractmethod
+    async def mark_processing(self, job_id: str) -> None:
+        """Record that a job started processing."""
+
+    @abstractmethod
+    async def mark_finished(self, job_id: str, result: bytes) -> None:
+        """Record that a job finished, along with its JSON encoded result."""
+
+    @abstractmethod
+    async def mark_error(self, job_id: str, error: str) -> None:
+        """Record that a job failed."""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Get a job, or None if it does not exist."""
+
+    @abstractmethod
+    async def get_result(self, job_id: str) -> Optional[bytes]:
+        """Get the JSON encoded result of a finished job, or None."""
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store backed by a local SQLite database in WAL mode.
+
+    The jobs that are not finished are kept in memory, so polling them never touches
+    the database. New jobs are written before `create` returns, so that a job whose
+    id was returned to a client survives the death of its worker. The later state
+    transitions are buffered and written in a single transaction every
+    `flush_interval` seconds, from a dedicated thread.
+    """
+
+    def __init__(self, path: str, flush_interval: float) -> None:
+        """
+        Initialize the SQLite job store.
+
+        Args:
+            path (str): Path to the SQLite database file.
+            flush_interval (float): Interval in seconds between two batched writes.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self._active: Dict[str, Job] = {}
+        self._dirty: Dict[str, Job] = {}
+        self._results: Dict[str, bytes] = {}
+
+    async def _run(self, func: Callable, *args: Any) -> Any:
+        """Run a database operation on the dedicated thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> None:
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(CREATE_TABLE)
+        columns = {
+            row["name"] for row in self._connection.execute("PRAGMA table_info(jobs)")
+        }
+        if "worker_pid" not in columns:
+            self._connection.execute("ALTER TABLE jobs ADD COLUMN worker_pid INTEGER")
+        self._connection.commit()
+
+    def _recover(self, worker_pid: Optional[int]) -> int:
+        query = (
+            "UPDATE jobs SET status = ?, finished_at = ?, error = ?"
+            " WHERE status IN (?, ?)"
+        )
+        parameters = [
+            JobStatus.error.value,
+            time.time(),
+            "The job was interrupted by a restart.",
+            JobStatus.queued.value,
+            JobStatus.processing.value,
+        ]
+        if worker_pid is not None:
+            query += " AND worker_pid = ?"
+            parameters.append(worker_pid)
+
+        interrupted = self._connection.execute(query, parameters).rowcount
+        self._connection.commit()
+
+        return interrupted
+
+    def _write(self, jobs: Dict[str, Job], results: Dict[str, bytes]) -> None:
+        # The jobs are processed by the worker that created them, whose pid is kept
+        # to recover them if it dies
+        worker_pid = os.getpid()
+        with self._connection:
+            self._connection.executemany(
+                """
+                INSERT INTO jobs (
+                    job_id, status, job_name, task_token, created_at, started_at,
+                    finished_at, error, result, worker_pid
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (job_id) DO UPDATE SET
+                    status = excluded.status,
+                    started_at = excluded.started_at,
+                    finished_at = excluded.finished_at,
+                    error = excluded.error,
+                    result = COALESCE(excluded.result, jobs.result)
+                """,
+                [
+                    (
+                        job.job_id,
+                        job.status.value,
+                        job.job_name,
+                        job.task_token,
+                        job.created_at,
+                        job.started_at,
+                        job.finished_at,
+                        job.error,
+                        results.get(job.job_id),
+                        worker_pid,
+                    )
+                    for job in jobs.values()
+                ],
+            )
+
+    def _read(self, job_id: str) -> Optional[Job]:
+        row = self._connection.execute(
+            "SELECT job_id, status, job_name, task_token, created_at, started_at,"
+            " finished_at, error FROM jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+
+        return Job(**dict(row)) if row is not None else None
+
+    def _read_result(self, job_id: str) -> Optional[bytes]:
+        row = self._connection.execute(
+            "SELECT result FROM jobs WHERE job_id = ? AND status = ?",
+            (job_id, JobStatus.finished.value),
+        ).fetchone()
+
+        return row[0] if row else None
+
+    async def start(self) -> None:
+        """Open the database and start the periodic flush."""
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="job_store"
+        )
+        await self._run(self._open)
+        self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def recover(self, worker_pid: Optional[int] = None) -> None:
+        """
+        Flag the jobs left unfinished by a previous run or worker as failed.
+
+        Without `worker_pid`, must run once per host before the workers accept jobs,
+        since the jobs of the other running workers would be flagged as well.
+
+        Args:
+            worker_pid (Optional[int]): Only flag the jobs of this dead worker.
+        """
+        interrupted = await self._run(self._recover, worker_pid)
+        if interrupted and worker_pid is not None:
+            logger.warning(
+                f"{interrupted} jobs were interrupted by worker {worker_pid}."
+            )
+        elif interrupted:
+            logger.warning(f"{interrupted} jobs were interrupted by the last restart.")
+
+    async def close(self) -> None:
+        """Flush the pending writes and close the database."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+
+        if self._connection is not None:
+            await self.flush()
+            await self._run(self._connection.close)
+            self._connection = None
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def flush(self) -> None:
+        """Write the buffered state transitions in a single transaction."""
+        if not self._dirty:
+            return
+
+        jobs, self._dirty = self._dirty, {}
+        results, self._results = self._results, {}
+
+        try:
+            await self._run(self._write, jobs, results)
+        except Exception as e:
+            logger.error(f"Failed to write {len(jobs)} jobs to the job store: {e}")
+            # Keep the failed writes for the next flush, unless they were superseded
+            self._dirty = {**jobs, **self._dirty}
+            self._results = {**results, **self._results}
+            return
+
+        for job_id, job in jobs.items():
+            if job.done and job_id not in self._dirty:
+                self._active.pop(job_id, None)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        job = self._active.get(job_id)
+        if job is None:
+            logger.warning(f"Job {job_id} is not active, cannot update it.")
+            return
+
+        job = job.model_copy(update=fields)
+        self._active[job_id] = job
+        self._dirty[job_id] = job
+
+    async def create(
+        self,
+        job_id: str,
+        job_name: Optional[str] = None,
+        task_token: Optional[str] = None,
+    ) -> Job:
+        """Record a new queued job, written to the database before returning."""
+        job = Job(
+            job_id=job_id,
+            job_name=job_name,
+            task_token=task_token,
+            created_at=time.time(),
+        )
+        await self._run(self._write, {job_id: job}, {})
+        self._active[job_id] = job
+
+        return job
+
+    async def mark_processing(self, job_id: str) -> None:
+        """Record that a job started processing."""
+        self._update(job_id, status=JobStatus.processing, started_at=time.time())
+
+    async def mark_finished(self, job_id: str, result: bytes) -> None:
+        """Record that a job finished, along with its JSON encoded result."""
+        self._results[job_id] = result
+        self._update(job_id, status=JobStatus.finished, finished_at=time.time())
+
+    async def mark_error(self, job_id: str, error: str) -> None:
+        """Record that a job failed."""
+        self._update(
+            job_id, status=JobStatus.error, finished_at=time.time(), error=error
+        )
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Get a job, from memory if it is still active."""
+        job = self._active.get(job_id)
+        if job is not None:
+            return job
+
+        return await self._run(self._read, job_id)
+
+    async def get_result(self, job_id: str) -> Optional[bytes]:
+        """Get the JSON encoded result of a finished job."""
+        result = self._results.get(job_id)
+        if result is not None:
+            return result
+
+        return await self._run(self._read_result, job_id)
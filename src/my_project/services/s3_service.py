@@ -0,0 +1,326 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""S3 service to deliver results without blocking the event loop."""
+
+import asyncio
+import io
+from typing import Dict, Iterable, List, Optional, Union
+
+from loguru import logger
+from pydantic import BaseModel
+
+from my_project.compression import COMPRESSORS
+from my_project.executors import io_executor
+from my_project.serialization import iter_json
+from my_project.utils import get_s3_client
+
+# Minimum size of the parts of a multipart upload, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+# Size of the blocks of the payload compressed at once when streaming
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+
+class _PartReader(io.RawIOBase):
+    """
+    Seekable file reading a part of a payload, without copying the part.
+
+    botocore only accepts bytes or file-like bodies, and slicing the payload in bytes
+    would copy every part.
+    """
+
+    def __init__(self, view: memoryview) -> None:
+        """Initialize the reader over a view of the part."""
+        super().__init__()
+        self._view = view
+        self._position = 0
+
+    def readable(self) -> bool:
+        """The part can be read."""
+        return True
+
+    def seekable(self) -> bool:
+        """The part can be read again, e.g. when botocore retries the request."""
+        return True
+
+    def readinto(self, buffer) -> int:
+        """Read the part into a buffer, from the current position."""
+        size = min(len(buffer), len(self._view) - self._position)
+        buffer[:size] = self._view[self._position : self._position + size]
+        self._position += size
+
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """Move the current position."""
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = min(max(offset, 0), len(self._view))
+
+        return self._position
+
+    def tell(self) -> int:
+        """The current position."""
+        return self._position
+
+
+class S3Service:
+    """
+    Upload results to S3 from the I/O executor, with a single pooled client.
+
+    Results are serialized and optionally compressed, with the matching
+    `Content-Encoding`, as they are uploaded: the parts of the upload are filled as
+    the serialized and compressed blocks come, so no full copy of the payload is
+    made. Small payloads are sent with a single `put_object`, while payloads bigger
+    than the multipart threshold are sent in the parts of a multipart upload.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        max_concurrency: int,
+        multipart_threshold: int,
+        part_size: int,
+        content_encoding: str = "",
+    ) -> None:
+        """
+        Initialize the S3 service.
+
+        Args:
+            bucket (str): The bucket to upload the results to.
+            max_concurrency (int): Maximum number of concurrent uploads.
+            multipart_threshold (int): Size in bytes above which a multipart upload is
+                used.
+            part_size (int): Size in bytes of each part of a multipart upload, at
+                least the 5 MiB allowed by S3.
+            content_encoding (str): Compression of the objects, `gzip` or `zstd`.
+                Empty to upload them uncompressed.
+
+        Raises:
+            ValueError: If the part size or the content encoding is not supported.
+        """
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(
+                f"S3 part size of {part_size} bytes is below the minimum of"
+                f" {MIN_PART_SIZE} bytes allowed by S3."
+            )
+        if content_encoding and content_encoding not in COMPRESSORS:
+            raise ValueError(
+                f"Unsupported S3 content encoding `{content_encoding}`, expected one"
+                f" of: {', '.join(COMPRESSORS)}. zstd requires the `zstandard` package."
+            )
+
+        self.bucket = bucket
+        self.content_encoding = content_encoding
+        self.max_concurrency = max_concurrency
+        self.multipart_threshold = max(multipart_threshold, part_size)
+        self.part_size = part_size
+
+        self.client = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def start(self) -> None:
+        """Create the pooled S3 client."""
+        self.client = get_s3_client(max_pool_connections=self.max_concurrency)
+
+    def close(self) -> None:
+        """Release the S3 client and its connection pool."""
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    async def upload_json(
+        self, result: Union[BaseModel, bytes], object_name: str
+    ) -> bool:
+        """
+        Upload a result as JSON, off the event loop.
+
+        Models are serialized in the I/O executor, while the object is uploaded.
+
+        Args:
+            result (Union[BaseModel, bytes]): The result to upload, or its JSON
+                encoding when it was already serialized.
+            object_name (str): The key of the object in the bucket.
+
+        Returns:
+            bool: Whether the upload succeeded.
+        """
+        if self.client is None:
+            logger.error("The S3 client is not initialized, cannot upload results.")
+            return False
+
+        async with self._semaphore:
+            try:
+                await io_executor.run(self._upload, result, object_name)
+            except Exception as e:
+                logger.error(f"Exception while uploading results to S3: {e}")
+                return False
+
+        return True
+
+    def _upload(self, result: Union[BaseModel, bytes], object_name: str) -> None:
+        """Serialize, compress and upload a result, in parts above the threshold."""
+        metadata = {"ContentType": "application/json"}
+        if self.content_encoding:
+            metadata["ContentEncoding"] = self.content_encoding
+
+        if not isinstance(result, bytes):
+            chunks = iter_json(result)
+        elif self.content_encoding:
+            view = memoryview(result)
+            chunks = (
+                view[offset : offset + STREAM_BLOCK_SIZE]
+                for offset in range(0, len(view), STREAM_BLOCK_SIZE)
+            )
+        else:
+            # Already serialized and uncompressed, the parts are views of the payload
+            if len(result) >= self.multipart_threshold:
+                self._multipart_upload(result, object_name, metadata)
+            else:
+                self.client.put_object(
+                    Body=result, Bucket=self.bucket, Key=object_name, **metadata
+                )
+            return
+
+        self._streaming_upload(self._encode(chunks), object_name, metadata)
+
+    def _encode(self, chunks: Iterable[bytes]) -> Iterable[bytes]:
+        """Group the chunks of a payload in blocks, compressed if needed."""
+        compressor = (
+            COMPRESSORS[self.content_encoding]() if self.content_encoding else None
+        )
+        block = bytearray()
+
+        for chunk in chunks:
+            block += chunk
+            if len(block) >= STREAM_BLOCK_SIZE:
+                yield compressor.compress(block) if compressor else bytes(block)
+                block.clear()
+
+        if compressor is not None:
+            yield compressor.finish(block)
+        elif block:
+            yield bytes(block)
+
+    def _streaming_upload(
+        self, blocks: Iterable[bytes], object_name: str, metadata: Dict[str, str]
+    ) -> None:
+        """
+        Upload a payload as it is produced.
+
+        The blocks are buffered until the multipart threshold, then sent in parts of
+        `part_size` bytes, so at most a threshold of the payload is held in memory.
+        Payloads ending below the threshold are sent with `put_object`.
+        """
+        buffer = bytearray()
+        upload_id: Optional[str] = None
+        parts: List[dict] = []
+
+        try:
+            for block in blocks:
+                buffer += block
+                if upload_id is None and len(buffer) < self.multipart_threshold:
+                    continue
+
+                if upload_id is None:
+                    upload_id = self.client.create_multipart_upload(
+                        Bucket=self.bucket, Key=object_name, **metadata
+                    )["UploadId"]
+                while len(buffer) >= self.part_size:
+                    self._upload_part(
+                        buffer, self.part_size, object_name, upload_id, parts
+                    )
+                    del buffer[: self.part_size]
+
+            if upload_id is None:
+                self.client.put_object(
+                    Body=bytes(buffer), Bucket=self.bucket, Key=object_name, **metadata
+                )
+                return
+
+            if buffer or not parts:
+                self._upload_part(buffer, len(buffer), object_name, upload_id, parts)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=object_name,
+                MultipartUpload={"Parts": parts},
+                UploadId=upload_id,
+            )
+        except Exception:
+            if upload_id is not None:
+                self.client.abort_multipart_upload(
+                    Bucket=self.bucket, Key=object_name, UploadId=upload_id
+                )
+            raise
+
+    def _upload_part(
+        self,
+        buffer: bytearray,
+        size: int,
+        object_name: str,
+        upload_id: str,
+        parts: List[dict],
+    ) -> None:
+        """Upload the first `size` bytes of a buffer as the next part of an upload."""
+        part_number = len(parts) + 1
+        with memoryview(buffer) as view:
+            response = self.client.upload_part(
+                Body=_PartReader(view[:size]),
+                Bucket=self.bucket,
+                Key=object_name,
+                PartNumber=part_number,
+                UploadId=upload_id,
+            )
+        parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def _multipart_upload(
+        self, payload: bytes, object_name: str, metadata: Dict[str, str]
+    ) -> None:
+        """Upload a payload as a multipart upload."""
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=object_name, **metadata
+        )["UploadId"]
+        parts: List[dict] = []
+        view = memoryview(payload)
+
+        try:
+            for offset in range(0, len(payload), self.part_size):
+                part_number = len(parts) + 1
+                response = self.client.upload_part(
+                    Body=_PartReader(view[offset : offset + self.part_size]),
+                    Bucket=self.bucket,
+                    Key=object_name,
+                    PartNumber=part_number,
+                    UploadId=upload_id,
+                )
+                parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=object_name,
+                MultipartUpload={"Parts": parts},
+                UploadId=upload_id,
+            )
+        except Exception:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=object_name, UploadId=upload_id
+            )
+            raise
@@ -0,0 +1,192 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Webhook service to dispatch the job status updates to Svix."""
+
+import asyncio
+import random
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from svix.api import MessageIn, SvixAsync
+
+
+class WebhookService:
+    """
+    Dispatch the job status updates from background workers, with a single Svix client.
+
+    Updates are queued and sent by a fixed number of workers, retried with a jittered
+    exponential backoff. An update that is still waiting in the queue is replaced by a
+    newer update of the same job, so only the latest status gets sent. The updates of
+    a job are sent one at a time, in order: an update queued while the previous one is
+    being sent waits for it to finish.
+
+    The Svix SDK is slow to import, so it is only loaded once the service is started
+    with credentials.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        app_id: str,
+        max_concurrency: int,
+        max_retries: int,
+        retry_base_delay: float,
+        payload_retention_period: int = 5,
+    ) -> None:
+        """
+        Initialize the webhook service.
+
+        Args:
+            api_key (str): The Svix API key.
+            app_id (str): The Svix application ID.
+            max_concurrency (int): Number of workers sending the updates.
+            max_retries (int): Maximum number of retries of a failed update.
+            retry_base_delay (float): Base delay in seconds of the retry backoff.
+            payload_retention_period (int): The payload retention period, in days.
+        """
+        self.api_key = api_key
+        self.app_id = app_id
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.payload_retention_period = payload_retention_period
+
+        self.client: Optional["SvixAsync"] = None
+        self._pending: Dict[str, "MessageIn"] = {}
+        self._sending: Set[str] = set()
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the Svix credentials are set."""
+        return bool(self.api_key and self.app_id)
+
+    def start(self) -> None:
+        """Create the Svix client and start the workers."""
+        if not self.enabled:
+            logger.warning(
+                "Svix API key and app ID are not set. Status updates will not be sent"
+                " to Svix."
+            )
+            return
+
+        from svix.api import SvixAsync
+
+        self.client = SvixAsync(self.api_key)
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)
+        ]
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """
+        Send the queued updates, then stop the workers.
+
+        Args:
+            timeout (float): Maximum time in seconds to wait for the queue to drain.
+        """
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"{len(self._pending)} webhook updates were dropped on shutdown."
+                )
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self.client = None
+
+    def send(self, job_id: str, status: str, payload: dict) -> None:
+        """
+        Queue a status update. Returns immediately.
+
+        Args:
+            job_id (str): The id of the job. Unlike the job names, which are optional
+                and chosen by the clients, it is unique to the job.
+            status (str): The status of the job.
+            payload (dict): The payload to send.
+        """
+        if self.client is None:
+            logger.warning(
+                "Svix API key and app ID are not set. Cannot send the status update to"
+                " Svix."
+            )
+            return
+
+        from svix.api import MessageIn
+
+        timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S_%f")
+        message = MessageIn(
+            event_type=f"async_job.wordcab_transcribe.{status}",
+            event_id=f"wordcab_transcribe_{status}_{job_id}_{timestamp}",
+            payload_retention_period=self.payload_retention_period,
+            payload=payload,
+        )
+
+        # A job being sent is queued again by its worker once the send is done
+        if job_id not in self._pending and job_id not in self._sending:
+            self._queue.put_nowait(job_id)
+        self._pending[job_id] = message
+
+    async def _worker(self) -> None:
+        """Send the queued updates until cancelled."""
+        while True:
+            job_id = await self._queue.get()
+            try:
+                message = self._pending.pop(job_id, None)
+                if message is not None:
+                    self._sending.add(job_id)
+                    try:
+                        await self._send_with_retry(job_id, message)
+                    finally:
+                        self._sending.discard(job_id)
+                        if job_id in self._pending:
+                            self._queue.put_nowait(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _send_with_retry(self, job_id: str, message: "MessageIn") -> None:
+        """Send an update, retrying with a jittered exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.client.message.create(self.app_id, message)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(
+                        f"Failed to send the status update of {job_id} to Svix after"
+                        f" {attempt + 1} attempts: {e}"
+                    )
+                    return
+
+                delay = random.uniform(  # noqa: S311
+                    0, self.retry_base_delay * 2**attempt
+                )
+                logger.warning(
+                    f"Failed to send the status update of {job_id} to Svix: {e}."
+                    f" Retrying in {delay:.2f} secs."
+                )
+                await asyncio.sleep(delay)
@@ -18,24 +18,41 @@
 # See the License for the specific language governing permissions
 # and limitations under the License.
 """Utils module."""
+import os
 import re
+import hashlib
 import sys
+import time
 import asyncio
 import aiofiles
 import subprocess  # noqa: S404
+import wave
 from pathlib import Path
-from datetime import datetime
 from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 
-import boto3
 from my_project.config import settings
+from my_project.executors import cpu_executor, io_executor, subprocess_executor
 
 from loguru import logger
-from svix.api import MessageIn, SvixAsync
 
 if TYPE_CHECKING:
     from fastapi import UploadFile
 
+# Punctuation that ends a formatted text
+_FINAL_PUNCT = frozenset(".?!:;,")
+# Space before a punctuation mark, removed in a single pass
+_SPACED_PUNCT_PATTERN = re.compile(r" ([?!.,:;])")
+_LONE_I_PATTERN = re.compile(r"\bi\b")
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an input file exceeds the maximum allowed size."""
+
+    def __init__(self, max_size: int) -> None:
+        """Initialize the exception."""
+        self.max_size = max_size
+        super().__init__(f"The file exceeds the maximum size of {max_size} bytes.")
+
 
 # pragma: no cover
 async def async_run_subprocess(command: List[str]) -> tuple:
@@ -75,6 +92,48 @@ def run_subprocess(command: List[str]) -> tuple:
     return process.returncode, stdout, stderr
 
 
+def _audio_duration(filepath: str) -> float:
+    """Read the duration of a WAV file from its header, or probe it with ffprobe."""
+    try:
+        with wave.open(filepath, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError):
+        pass
+
+    returncode, stdout, stderr = run_subprocess(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration",
+            "-of",
+            "default=noprint_wrappers=1:nokey=1",
+            filepath,
+        ]
+    )
+    if returncode != 0:
+        raise RuntimeError(f"ffprobe failed on {filepath}: {stderr.decode().strip()}")
+
+    return float(stdout)
+
+
+async def get_audio_duration(filepath: str) -> float:
+    """
+    Get the duration of an audio file, in the subprocess executor.
+
+    Args:
+        filepath (str): Path to the audio file.
+
+    Raises:
+        RuntimeError: If the duration could not be probed.
+
+    Returns:
+        float: The duration in seconds.
+    """
+    return await subprocess_executor.run(_audio_duration, filepath)
+
+
 def delete_file(filepath: Union[str, Tuple[str, Optional[str]]]) -> None:
     """
     Delete a file or a list of files.
@@ -100,11 +159,7 @@ def is_empty_string(text: str):
     Returns:
         bool: True if the string is empty, False otherwise.
     """
-    text = text.replace(".", "")
-    text = re.sub(r"\s+", "", text)
-    if text.strip():
-        return False
-    return True
+    return not text.replace(".", "").strip()
 
 
 def format_punct(text: str):
@@ -121,20 +176,51 @@ def format_punct(text: str):
 
     if text[0].islower():
         text = text[0].upper() + text[1:]
-    if text[-1] not in [".", "?", "!", ":", ";", ","]:
+    if text[-1] not in _FINAL_PUNCT:
         text += "."
 
-    text = text.replace("...", "")
-    text = text.replace(" ?", "?")
-    text = text.replace(" !", "!")
-    text = text.replace(" .", ".")
-    text = text.replace(" ,", ",")
-    text = text.replace(" :", ":")
-    text = text.replace(" ;", ";")
-    text = re.sub(r"\s+", " ", text)
-    text = re.sub(r"\bi\b", "I", text)
+    # The ellipses are removed first, since they can leave a space before a mark
+    text = _SPACED_PUNCT_PATTERN.sub(r"\1", text.replace("...", ""))
+    # Collapses the whitespace runs and strips the text, like `\s+` does
+    text = " ".join(text.split())
+
+    return _LONE_I_PATTERN.sub("I", text)
+
+
+def format_utterances(texts: List[str]) -> List[Optional[str]]:
+    """
+    Format a batch of utterance texts with `format_punct`.
+
+    Args:
+        texts (List[str]): The texts to format.
+
+    Returns:
+        List[Optional[str]]: The formatted texts, None for the empty ones according
+            to `is_empty_string`.
+    """
+    return [
+        None if is_empty_string(text) else format_punct(text) for text in texts
+    ]
+
+
+async def async_format_utterances(texts: List[str]) -> List[Optional[str]]:
+    """
+    Format a batch of utterance texts, in the CPU executor for the big batches.
+
+    Batches of at least `postprocess_offload_threshold` texts are sent to the CPU
+    executor so that long transcripts do not stall the event loop, while smaller ones
+    are cheaper to format inline than to send to another process.
 
-    return text.strip()
+    Args:
+        texts (List[str]): The texts to format.
+
+    Returns:
+        List[Optional[str]]: The formatted texts, None for the empty ones.
+    """
+    if len(texts) < settings.postprocess_offload_threshold:
+        return format_utterances(texts)
+
+    return await cpu_executor.run(format_utterances, texts)
 
 
 def remove_words_for_svix(dict_payload: dict) -> dict:
@@ -163,87 +249,217 @@ def retrieve_user_platform() -> str:
     return sys.platform
 
 
+def _max_upload_size() -> int:
+    """Return the maximum size of an input file in bytes, 0 meaning no limit."""
+    return settings.max_upload_size_mb * 1024 * 1024
+
+
+async def _stream_to_file(filename: str, chunks, max_size: int) -> int:
+    """
+    Write an async iterator of byte chunks to a file, enforcing a size cap.
+
+    Args:
+        filename (str): The filename to write to.
+        chunks (AsyncIterator[bytes]): The chunks to write.
+        max_size (int): The maximum number of bytes to write, 0 meaning no limit.
+
+    Raises:
+        UploadTooLargeError: If the stream exceeds the maximum size. The partial file
+            is deleted.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    start_time = time.perf_counter()
+    written = 0
+
+    try:
+        async with aiofiles.open(filename, "wb") as f:
+            async for chunk in chunks:
+                written += len(chunk)
+                if max_size and written > max_size:
+                    raise UploadTooLargeError(max_size)
+
+                await f.write(chunk)
+    except BaseException:
+        delete_file(filename)
+        raise
+
+    process_time = time.perf_counter() - start_time
+    logger.debug(
+        f"Saved {written} bytes to {filename} in {process_time:.4f} secs"
+        f" ({written / max(process_time, 1e-9) / 1024 / 1024:.2f} MB/s)"
+    )
+
+    return written
+
+
 async def save_file_locally(filename: str, file: "UploadFile") -> bool:
     """
-    Save a file locally from an UploadFile object.
+    Save a file locally from an UploadFile object, in fixed-size chunks.
 
     Args:
         filename (str): The filename to save the file as.
         file (UploadFile): The UploadFile object.
 
+    Raises:
+        UploadTooLargeError: If the file exceeds the maximum upload size.
+
     Returns:
         bool: Whether the file was saved successfully.
     """
-    async with aiofiles.open(filename, "wb") as f:
-        audio_bytes = await file.read()
-        await f.write(audio_bytes)
+    max_size = _max_upload_size()
+    if max_size and file.size is not None and file.size > max_size:
+        raise UploadTooLargeError(max_size)
+
+    async def _chunks():
+        while chunk := await file.read(settings.upload_chunk_size):
+            yield chunk
+
+    await _stream_to_file(filename, _chunks(), max_size)
 
     return True
 
 
-def get_s3_client():
+async def download_file_locally(url: str, filename: str) -> bool:
+    """
+    Download a file from an url and save it locally, in fixed-size chunks.
+
+    Args:
+        url (str): The url of the file to download.
+        filename (str): The filename to save the file as.
+
+    Raises:
+        UploadTooLargeError: If the file exceeds the maximum upload size.
+        aiohttp.ClientResponseError: If the download failed.
+
+    Returns:
+        bool: Whether the file was downloaded successfully.
+    """
+    import aiohttp
+
+    max_size = _max_upload_size()
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            response.raise_for_status()
+
+            if max_size and (response.content_length or 0) > max_size:
+                raise UploadTooLargeError(max_size)
+
+            await _stream_to_file(
+                filename,
+                response.content.iter_chunked(settings.upload_chunk_size),
+                max_size,
+            )
+
+    return True
+
+
+def _file_digest(filename: str, chunk_size: int) -> str:
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+async def file_digest(filename: str) -> str:
+    """
+    Compute the SHA-256 digest of a file, in the I/O executor.
+
+    Args:
+        filename (str): The file to hash.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    return await io_executor.run(_file_digest, filename, settings.upload_chunk_size)
+
+
+async def get_url_etag(url: str) -> Optional[str]:
+    """
+    Get the ETag of an url with a HEAD request.
+
+    Args:
+        url (str): The url to check.
+
+    Returns:
+        Optional[str]: The ETag of the url, or None if it is not available.
+    """
+    import aiohttp
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.head(url, allow_redirects=True) as response:
+                if response.status >= 400:
+                    return None
+                return response.headers.get("ETag")
+    except aiohttp.ClientError:
+        return None
+
+
+def get_spooled_file_path(file: "UploadFile") -> Optional[str]:
+    """
+    Get a path to the temporary file backing an UploadFile, if it was spooled to disk.
+
+    The path points to the open file descriptor of the current process, so it stays
+    valid for subprocesses (e.g. ffmpeg) as long as the UploadFile is not closed.
+
+    Args:
+        file (UploadFile): The UploadFile object.
+
+    Raises:
+        UploadTooLargeError: If the file exceeds the maximum upload size.
+
+    Returns:
+        Optional[str]: The path to the spooled file, or None if the file is still in
+            memory or the platform does not expose file descriptors as paths.
+    """
+    if retrieve_user_platform() != "linux" or not getattr(file.file, "_rolled", False):
+        return None
+
+    max_size = _max_upload_size()
+    if max_size and file.size is not None and file.size > max_size:
+        raise UploadTooLargeError(max_size)
+
+    return f"/proc/{os.getpid()}/fd/{file.file.fileno()}"
+
+
+def get_s3_client(max_pool_connections: int = 10):
+    """
+    Create an S3 client from the settings.
+
+    boto3 clients are thread-safe, so a single client can be shared by every upload
+    running in the executor. boto3 is imported here rather than at module load, so
+    the processes that never talk to S3 do not pay for it.
+
+    Args:
+        max_pool_connections (int): The size of the client connection pool.
+
+    Returns:
+        botocore.client.S3: The S3 client.
+    """
+    import boto3
+    from botocore.config import Config
+
     def _retrieve_service(service, aws_creds):
         return boto3.client(
             service,
             aws_access_key_id=aws_creds.get("aws_access_key_id"),
             aws_secret_access_key=aws_creds.get("aws_secret_access_key"),
             region_name=aws_creds.get("region_name"),
+            config=Config(max_pool_connections=max_pool_connections),
         )
 
     s3_client = _retrieve_service(
         "s3",
         {
-            "aws_access_key_id": settings.aws_access_key_id,
-            "aws_secret_access_key": settings.aws_secret_access_key,
-            "region_name": settings.aws_region_name,
+            "aws_access_key_id": settings.aws_access_key_id or None,
+            "aws_secret_access_key": settings.aws_secret_access_key or None,
+            "region_name": settings.aws_region_name or None,
         },
     )
 
     return s3_client
-
-
-def upload_file(s3_client, file, bucket, object_name):
-    try:
-        s3_client.put_object(
-            Body=file,
-            Bucket=bucket,
-            Key=object_name,
-        )
-    except Exception as e:
-        logger.error(f"Exception while uploading results to S3: {e}")
-        return False
-    return True
-
-
-async def send_update_with_svix(
-    job_name: str,
-    status: str,
-    payload: dict,
-    payload_retention_period: Optional[int] = 5,
-) -> None:
-    """
-    Send the status update to Svix.
-
-    Args:
-        job_name (str): The name of the job.
-        status (str): The status of the job.
-        payload (dict): The payload to send.
-        payload_retention_period (Optional[int], optional): The payload retention period. Defaults to 5.
-    """
-    if settings.svix_api_key and settings.svix_app_id:
-        svix = SvixAsync(settings.svix_api_key)
-        await svix.message.create(
-            settings.svix_app_id,
-            MessageIn(
-                event_type=f"async_job.wordcab_transcribe.{status}",
-                event_id=f"wordcab_transcribe_{status}_{job_name}_{datetime.now().strftime('%Y_%m_%d_%H_%M_%S_%f')}",
-                payload_retention_period=payload_retention_period,
-                payload=payload,
-            ),
-        )
-    else:
-        logger.warning(
-            "Svix API key and app ID are not set. Cannot send the status update to"
-            " Svix."
-        )
-
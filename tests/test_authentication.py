@@ -0,0 +1,174 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the authentication dependencies."""
+
+import asyncio
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+
+import pytest
+from fastapi import HTTPException, Request
+
+from my_project.config import settings
+from my_project.metrics import Counter
+from my_project.router import authentication
+from my_project.router.authentication import (
+    TokenCache,
+    create_access_token,
+    get_current_user,
+    get_tenant,
+)
+
+
+@pytest.fixture
+def decodes(monkeypatch) -> list:
+    """Use an empty token cache, and record the tokens decoded by `jwt.decode`."""
+    decoded = []
+    decode = authentication.jwt.decode
+
+    def record(token, *args, **kwargs):
+        decoded.append(token)
+        return decode(token, *args, **kwargs)
+
+    monkeypatch.setattr(authentication.jwt, "decode", record)
+    monkeypatch.setattr(authentication, "token_cache", TokenCache(max_size=16))
+
+    return decoded
+
+
+def values(counter: Counter) -> Dict[str, float]:
+    """The values of a counter, by label set."""
+    return {labels: value for _, labels, value in counter.samples()}
+
+
+def make_request(principal: Optional[str] = None) -> Request:
+    """A request, authenticated as `principal` if set."""
+    request = Request({"type": "http", "headers": []})
+    if principal is not None:
+        request.state.principal = principal
+
+    return request
+
+
+def test_cached_token_is_not_decoded_again() -> None:
+    """A hit returns the subject without verifying the token again."""
+    lookups = Counter("lookups", "Lookups.", ("result",))
+    cache = TokenCache(max_size=4, lookups=lookups)
+
+    assert cache.get("token") is None
+    cache.set("token", "user", time.time() + 60)
+
+    assert cache.get("token") == "user"
+    assert values(lookups) == {'{result="miss"}': 1.0, '{result="hit"}': 1.0}
+
+
+def test_expired_token_is_evicted() -> None:
+    """A token is not served past its expiration, and is dropped from the cache."""
+    cache = TokenCache(max_size=4)
+    cache.set("token", "user", time.time() - 1)
+
+    assert cache.get("token") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_token_is_evicted() -> None:
+    """The cache keeps at most `max_size` tokens, evicting the least recent one."""
+    evictions = Counter("evictions", "Evictions.")
+    cache = TokenCache(max_size=2, evictions=evictions)
+    expires_at = time.time() + 60
+
+    cache.set("a", "user", expires_at)
+    cache.set("b", "user", expires_at)
+    cache.get("a")
+    cache.set("c", "user", expires_at)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == cache.get("c") == "user"
+    assert values(evictions) == {"": 1.0}
+
+
+def test_disabled_cache_keeps_nothing() -> None:
+    """A cache of size 0 never stores a token."""
+    cache = TokenCache(max_size=0)
+    cache.set("token", "user", time.time() + 60)
+
+    assert cache.get("token") is None
+
+
+def test_current_user_is_verified_once(decodes: list) -> None:
+    """A valid token authenticates its user, and is only decoded the first time."""
+    token = create_access_token({"sub": settings.username})
+    requests = [make_request(), make_request()]
+
+    users = [
+        asyncio.run(get_current_user(request, token, settings.username))
+        for request in requests
+    ]
+
+    assert users == [settings.username] * 2
+    assert [request.state.principal for request in requests] == users
+    assert decodes == [token]
+
+
+@pytest.mark.parametrize(
+    "subject, expires_delta",
+    [
+        ("someone-else", None),
+        (None, None),
+        (settings.username, timedelta(minutes=-1)),
+    ],
+)
+def test_invalid_token_is_rejected(
+    decodes: list, subject: Optional[str], expires_delta: Optional[timedelta]
+) -> None:
+    """Tokens of another user, without subject or expired are rejected."""
+    claims = {} if subject is None else {"sub": subject}
+    token = create_access_token(claims, expires_delta)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_current_user(make_request(), token, settings.username))
+
+    assert error.value.status_code == 401
+
+
+def test_tenant_is_the_authenticated_user() -> None:
+    """Authenticated clients cannot pick their tenant with the header."""
+    tenants = {
+        asyncio.run(get_tenant(make_request("user"), x_tenant_id=tenant))
+        for tenant in ("a", "b", None)
+    }
+
+    assert tenants == {"user"}
+
+
+def test_tenant_header_is_used_without_authentication() -> None:
+    """Without authentication, the tenant is the header, or the default one."""
+    assert asyncio.run(get_tenant(make_request(), x_tenant_id="acme")) == "acme"
+    assert asyncio.run(get_tenant(make_request(), x_tenant_id=None)) == "default"
+
+
+def test_invalid_tenant_header_is_rejected() -> None:
+    """Tenant ids are used as metric labels, so they are validated."""
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_tenant(make_request(), x_tenant_id="a b"))
+
+    assert error.value.status_code == 400
@@ -0,0 +1,145 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the dynamic micro-batching engine."""
+
+import asyncio
+from typing import Any, List, Tuple
+
+import pytest
+
+from my_project.engines.batching import BatchingEngine, batch_key
+from my_project.models import ExampleRequest
+
+
+class Backend:
+    """Fake batch function recording the batches, optionally slow or failing."""
+
+    def __init__(self, delay: float = 0.0, error: Exception = None) -> None:
+        """Initialize the fake backend."""
+        self.delay = delay
+        self.error = error
+        self.batches: List[List[Any]] = []
+
+    async def __call__(self, items: List[Tuple[Any, ExampleRequest]]) -> List[Any]:
+        """Record the batch and return the inputs in uppercase."""
+        self.batches.append([audio for audio, _ in items])
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+        return [audio.upper() for audio, _ in items]
+
+
+def test_batch_key_ignores_unrelated_fields() -> None:
+    """Requests differing only by fields outside of the key share a batch."""
+    assert batch_key(ExampleRequest(job_name="a")) == batch_key(
+        ExampleRequest(job_name="b")
+    )
+    assert batch_key(ExampleRequest()) != batch_key(ExampleRequest(source_lang="fr"))
+
+
+def test_idle_engine_dispatches_right_away() -> None:
+    """Without any batch running, an input does not wait for `max_wait_time`."""
+    backend = Backend()
+    engine = BatchingEngine(backend, max_batch_size=8, max_wait_time=10.0)
+
+    async def main():
+        return await asyncio.wait_for(engine.submit("a", ExampleRequest()), 1.0)
+
+    assert asyncio.run(main()) == "A"
+    assert backend.batches == [["a"]]
+
+
+def test_inputs_accumulate_while_busy() -> None:
+    """Inputs submitted during a batch are dispatched together, up to the size."""
+    backend = Backend(delay=0.1)
+    engine = BatchingEngine(backend, max_batch_size=3, max_wait_time=1.0)
+
+    async def main():
+        first = asyncio.ensure_future(engine.submit("a", ExampleRequest()))
+        await asyncio.sleep(0.01)
+        others = [engine.submit(audio, ExampleRequest()) for audio in "bcdef"]
+        return await asyncio.gather(first, *others)
+
+    assert asyncio.run(main()) == ["A", "B", "C", "D", "E", "F"]
+    assert backend.batches == [["a"], ["b", "c", "d"], ["e", "f"]]
+
+
+def test_incompatible_inputs_are_not_batched_together() -> None:
+    """Inputs with different batch keys go to different batches."""
+    backend = Backend(delay=0.05)
+    engine = BatchingEngine(backend, max_batch_size=8, max_wait_time=0.1)
+
+    async def main():
+        return await asyncio.gather(
+            engine.submit("en", ExampleRequest()),
+            engine.submit("fr", ExampleRequest(source_lang="fr")),
+        )
+
+    assert asyncio.run(main()) == ["EN", "FR"]
+    assert sorted(backend.batches) == [["en"], ["fr"]]
+
+
+def test_failed_batch_fails_all_its_inputs() -> None:
+    """The exception of the batch function is raised to every caller."""
+    backend = Backend(error=ValueError("out of memory"))
+    engine = BatchingEngine(backend, max_batch_size=8, max_wait_time=0.1)
+
+    async def main():
+        return await asyncio.gather(
+            engine.submit("a", ExampleRequest()),
+            engine.submit("b", ExampleRequest()),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_wrong_number_of_results_is_an_error() -> None:
+    """A batch function must return one result per input."""
+
+    async def batch_fn(items):
+        return []
+
+    engine = BatchingEngine(batch_fn, max_batch_size=8, max_wait_time=0.1)
+
+    with pytest.raises(RuntimeError, match="0 results for 1 inputs"):
+        asyncio.run(engine.submit("a", ExampleRequest()))
+
+
+def test_close_fails_pending_inputs() -> None:
+    """Inputs still waiting when the engine is closed fail."""
+    backend = Backend(delay=10.0)
+    engine = BatchingEngine(backend, max_batch_size=1, max_wait_time=0.1)
+
+    async def main():
+        running = asyncio.ensure_future(engine.submit("a", ExampleRequest()))
+        pending = asyncio.ensure_future(engine.submit("b", ExampleRequest()))
+        await asyncio.sleep(0.01)
+        await engine.close()
+        return await asyncio.gather(running, pending, return_exceptions=True)
+
+    running, pending = asyncio.run(main())
+
+    assert isinstance(running, asyncio.CancelledError)
+    assert isinstance(pending, RuntimeError)
+    assert engine.pending == 0
@@ -0,0 +1,122 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the chunked processing of long inputs."""
+
+import asyncio
+import wave
+
+import pytest
+
+from my_project.engines.chunking import ChunkingStage, merge_utterances, split_windows
+from my_project.models import Example, ExampleRequest
+from my_project.services.example_service import ProcessException
+
+
+def write_silence(path: str, duration: int) -> None:
+    """Write a mono WAV file of `duration` seconds of silence, at 1 kHz."""
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(1000)
+        f.writeframes(b"\0\0" * 1000 * duration)
+
+
+async def transcribe_window(audio: str, data: ExampleRequest) -> Example:
+    """Fake processing returning one word per second of the window."""
+    words = [
+        str(second) for second in range(int(data.offset_start), int(data.offset_end))
+    ]
+    fields = data.model_dump(include=set(Example.model_fields))
+
+    return Example(**{**fields, "utterances": [" ".join(words)], "audio_duration": 0.0})
+
+
+def test_windows_cover_the_range_with_overlap() -> None:
+    """Windows start every `chunk_duration` seconds and overlap the next one."""
+    windows = split_windows(0.0, 25.0, chunk_duration=10.0, overlap=2.0)
+
+    assert windows == [(0.0, 12.0), (10.0, 22.0), (20.0, 25.0)]
+
+
+def test_short_range_is_a_single_window() -> None:
+    """A range shorter than a window is not split."""
+    assert split_windows(5.0, 9.0, chunk_duration=10.0, overlap=2.0) == [(5.0, 9.0)]
+
+
+@pytest.mark.parametrize(
+    "chunks, expected",
+    [
+        # The overlap is transcribed by both windows, and kept once
+        (
+            [["hello there", "how are you"], ["how are you", "fine thanks"]],
+            ["hello there", "how are you", "fine thanks"],
+        ),
+        # An utterance cut by the end of a window is completed by the next one
+        (
+            [["the quick brown"], ["quick brown fox jumps"]],
+            ["the quick brown fox jumps"],
+        ),
+        # The garbled word at the cut is dropped, and the punctuation is ignored
+        (
+            [["one two three fo"], ["Two, three four five."]],
+            ["one two three four five."],
+        ),
+        # Windows sharing no words are concatenated
+        ([["first window"], ["second window"]], ["first window", "second window"]),
+    ],
+)
+def test_overlapping_windows_are_merged(chunks, expected) -> None:
+    """The words transcribed in the overlap of two windows are kept once."""
+    assert merge_utterances(chunks) == expected
+
+
+def test_merge_of_a_single_window_is_unchanged() -> None:
+    """A single window is returned as is."""
+    assert merge_utterances([["a b c", "d e"]]) == ["a b c", "d e"]
+
+
+def test_stage_processes_long_inputs_in_windows(tmp_path) -> None:
+    """Long inputs are processed in windows, whose results are merged."""
+    audio = str(tmp_path / "long.wav")
+    write_silence(audio, 25)
+    stage = ChunkingStage(transcribe_window, chunk_duration=10.0, overlap=3.0)
+
+    result = asyncio.run(stage.process(audio, ExampleRequest()))
+
+    assert result.utterances == [" ".join(str(second) for second in range(25))]
+    assert result.audio_duration == 25.0
+    assert result.offset_start is None and result.offset_end is None
+
+
+def test_stage_returns_the_first_failure(tmp_path) -> None:
+    """A window that fails fails the whole input."""
+    audio = str(tmp_path / "long.wav")
+    write_silence(audio, 25)
+
+    async def process(audio, data):
+        if data.offset_start > 0:
+            return ProcessException(source="post_processing", message="failed")
+        return await transcribe_window(audio, data)
+
+    stage = ChunkingStage(process, chunk_duration=10.0, overlap=3.0)
+
+    assert isinstance(
+        asyncio.run(stage.process(audio, ExampleRequest())), ProcessException
+    )
@@ -0,0 +1,160 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the audio decoder, against fake ffmpeg and ffprobe executables."""
+
+import asyncio
+import os
+import stat
+import sys
+
+import numpy as np
+import pytest
+
+from my_project.engines.decoder import AudioDecoder
+
+# Outputs `FAKE_FRAMES` frames whose samples count up from 0, after `FAKE_SLEEP` secs
+FAKE_FFMPEG = """\
+import os, sys, time
+import numpy as np
+
+if os.environ.get("FAKE_FAIL"):
+    sys.stderr.write("Invalid data found when processing input\\n")
+    sys.exit(1)
+if os.environ.get("FAKE_PID_FILE"):
+    with open(os.environ["FAKE_PID_FILE"], "w") as f:
+        f.write(str(os.getpid()))
+    time.sleep(60)
+
+started = time.time()
+time.sleep(float(os.environ.get("FAKE_SLEEP", 0)))
+channels = int(sys.argv[sys.argv.index("-ac") + 1])
+frames = int(os.environ.get("FAKE_FRAMES", 16000))
+sys.stdout.buffer.write(np.arange(frames * channels, dtype="<f4").tobytes())
+sys.stdout.flush()
+if os.environ.get("FAKE_LOG"):
+    with open(os.environ["FAKE_LOG"], "a") as f:
+        f.write(f"{started} {time.time()}\\n")
+"""
+# Reports 2 channels, and a duration of `FAKE_DURATION` secs if set
+FAKE_FFPROBE = """\
+import json, os
+
+duration = os.environ.get("FAKE_DURATION")
+print(json.dumps({
+    "streams": [{"channels": 2}],
+    "format": {} if duration is None else {"duration": duration},
+}))
+"""
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch) -> str:
+    """A file that is not a WAV file, with fake ffmpeg and ffprobe on the path."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, code in (("ffmpeg", FAKE_FFMPEG), ("ffprobe", FAKE_FFPROBE)):
+        path = bin_dir / name
+        path.write_text(f"#!{sys.executable}\n{code}")
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    path = tmp_path / "audio.mp3"
+    path.write_bytes(b"not a wav file")
+
+    return str(path)
+
+
+def expected_samples(frames: int) -> np.ndarray:
+    """The samples output by the fake ffmpeg, in 2 channels."""
+    return np.arange(frames * 2, dtype=np.float32).reshape(frames, 2)
+
+
+def test_decoded_samples_fill_the_probed_buffer(source: str, monkeypatch) -> None:
+    """The samples of every channel are decoded into a buffer of the duration."""
+    monkeypatch.setenv("FAKE_DURATION", "1.0")
+    decoder = AudioDecoder(asyncio.Semaphore(1))
+
+    samples = asyncio.run(decoder.decode(source))
+
+    np.testing.assert_array_equal(samples, expected_samples(16000))
+
+
+def test_buffer_grows_beyond_the_probed_duration(source: str, monkeypatch) -> None:
+    """Audio longer than probed grows the buffer, in several reads."""
+    monkeypatch.setenv("FAKE_DURATION", "0.01")
+    monkeypatch.setenv("FAKE_FRAMES", "300000")
+    decoder = AudioDecoder(asyncio.Semaphore(1))
+
+    samples = asyncio.run(decoder.decode(source))
+
+    np.testing.assert_array_equal(samples, expected_samples(300000))
+
+
+def test_failed_decoding_raises_the_error_of_ffmpeg(source: str, monkeypatch) -> None:
+    """The stderr of a failed ffmpeg is in the exception."""
+    monkeypatch.setenv("FAKE_FAIL", "1")
+    decoder = AudioDecoder(asyncio.Semaphore(1))
+
+    with pytest.raises(RuntimeError, match="Invalid data found"):
+        asyncio.run(decoder.decode(source))
+
+
+def test_cancelled_decoding_kills_ffmpeg(source: str, tmp_path, monkeypatch) -> None:
+    """Cancelling a decoding kills its process, and releases its slot."""
+    pid_file = tmp_path / "ffmpeg.pid"
+    monkeypatch.setenv("FAKE_PID_FILE", str(pid_file))
+    limit = asyncio.Semaphore(1)
+    decoder = AudioDecoder(limit)
+
+    async def main():
+        task = asyncio.ensure_future(decoder.decode(source))
+        while not pid_file.exists() or not pid_file.read_text():
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return int(pid_file.read_text()), limit.locked()
+
+    pid, locked = asyncio.run(main())
+
+    assert not locked
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+def test_limit_caps_the_running_decoders(source: str, tmp_path, monkeypatch) -> None:
+    """Decodings beyond the limit wait for a running one to finish."""
+    log = tmp_path / "runs.log"
+    monkeypatch.setenv("FAKE_SLEEP", "0.2")
+    monkeypatch.setenv("FAKE_LOG", str(log))
+    decoder = AudioDecoder(asyncio.Semaphore(2))
+
+    async def main():
+        await asyncio.gather(*(decoder.decode(source) for _ in range(4)))
+
+    asyncio.run(main())
+
+    # At no time do more than 2 processes run
+    runs = [tuple(map(float, line.split())) for line in log.read_text().splitlines()]
+    assert len(runs) == 4
+    for started, _ in runs:
+        running = sum(start <= started < end for start, end in runs)
+        assert running <= 2
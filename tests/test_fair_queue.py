@@ -0,0 +1,181 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the weighted fair queue and the tenant limits of the job queue."""
+
+import asyncio
+from typing import List
+
+import pytest
+
+from my_project.engines.fair_queue import FairQueue
+from my_project.engines.job_queue import JobQueue, QueueFullError
+
+
+async def drain(queue: FairQueue, count: int) -> List[str]:
+    """Serve `count` items one at a time, return their tenants in order."""
+    served = []
+    for _ in range(count):
+        tenant, _ = await queue.get()
+        served.append(tenant)
+        queue.task_done(tenant)
+
+    return served
+
+
+def test_tenants_are_served_in_turn() -> None:
+    """A bulk submission does not delay the items of another tenant."""
+    queue = FairQueue()
+    for index in range(4):
+        queue.put_nowait("bulk", index)
+    queue.put_nowait("other", 0)
+
+    served = asyncio.run(drain(queue, 5))
+
+    assert served[:2] == ["bulk", "other"]
+
+
+def test_weights_set_the_shares() -> None:
+    """A tenant of weight 2 is served twice as often while both are backlogged."""
+    queue = FairQueue(weights={"gold": 2.0})
+    for index in range(6):
+        queue.put_nowait("gold", index)
+        queue.put_nowait("silver", index)
+
+    served = asyncio.run(drain(queue, 6))
+
+    assert served.count("gold") == 4
+    assert served.count("silver") == 2
+
+
+def test_default_weight_applies_to_unlisted_tenants() -> None:
+    """The `*` weight applies to the tenants that are not listed."""
+    queue = FairQueue(weights={"*": 3.0, "slow": 1.0})
+    for index in range(4):
+        queue.put_nowait("slow", index)
+        queue.put_nowait("any", index)
+
+    served = asyncio.run(drain(queue, 4))
+
+    assert served.count("any") == 3
+
+
+def test_items_of_a_tenant_keep_their_order() -> None:
+    """The items of a single tenant are served first in, first out."""
+    queue = FairQueue()
+    for index in range(3):
+        queue.put_nowait("tenant", index)
+
+    async def main():
+        items = []
+        for _ in range(3):
+            _, item = await queue.get()
+            items.append(item)
+            queue.task_done("tenant")
+        return items
+
+    assert asyncio.run(main()) == [0, 1, 2]
+
+
+def test_concurrency_cap_skips_busy_tenant() -> None:
+    """A tenant running as many items as its cap waits for one to be done."""
+    queue = FairQueue(max_concurrency={"capped": 1})
+    queue.put_nowait("capped", 0)
+    queue.put_nowait("capped", 1)
+    queue.put_nowait("other", 0)
+
+    async def main():
+        first, _ = await queue.get()
+        second, _ = await queue.get()
+        blocked = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        queue.task_done(first)
+        third, _ = await asyncio.wait_for(blocked, 1.0)
+        return [first, second, third]
+
+    assert asyncio.run(main()) == ["capped", "other", "capped"]
+
+
+def test_virtual_time_does_not_go_back() -> None:
+    """A new tenant is not favored once a capped tenant serves an older item."""
+    queue = FairQueue(max_concurrency={"capped": 1})
+    for index in range(2):
+        queue.put_nowait("capped", index)
+    for index in range(4):
+        queue.put_nowait("other", index)
+
+    async def main():
+        first, _ = await queue.get()
+        # The capped tenant is skipped while the other one advances the virtual time
+        served = [(await queue.get())[0] for _ in range(3)]
+        queue.task_done(first)
+        served.append((await queue.get())[0])
+
+        queue.put_nowait("new", 0)
+        queue.put_nowait("new", 1)
+        served += [(await queue.get())[0] for _ in range(3)]
+        return [first] + served
+
+    assert asyncio.run(main()) == [
+        "capped",
+        "other",
+        "other",
+        "other",
+        "capped",
+        "new",
+        "other",
+        "new",
+    ]
+
+
+def test_join_waits_for_the_items_to_be_done() -> None:
+    """`join` returns once every item returned by `get` is marked as done."""
+    queue = FairQueue()
+    queue.put_nowait("tenant", 0)
+
+    async def main():
+        tenant, _ = await queue.get()
+        joined = asyncio.ensure_future(queue.join())
+        await asyncio.sleep(0.01)
+        assert not joined.done()
+
+        queue.task_done(tenant)
+        await asyncio.wait_for(joined, 1.0)
+        return queue.depths()
+
+    assert asyncio.run(main()) == {}
+
+
+def test_tenant_capacity_is_enforced() -> None:
+    """A tenant cannot queue more jobs than its share of the job queue."""
+
+    async def job():
+        pass
+
+    queue = JobQueue(capacity=10, num_workers=1, tenant_capacity=2)
+    queue.submit(job, tenant="bulk")
+    queue.submit(job, tenant="bulk")
+
+    with pytest.raises(QueueFullError):
+        queue.submit(job, tenant="bulk")
+    queue.submit(job, tenant="other")
+
+    assert queue.tenant_depths() == {"bulk": 2, "other": 1}
@@ -0,0 +1,198 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the bounded job queue and its admission control."""
+
+import asyncio
+import time
+
+import pytest
+
+from my_project.engines import job_queue
+from my_project.engines.job_queue import DEFAULT_RETRY_AFTER, JobQueue, QueueFullError
+
+
+class FailingHistogram:
+    """Histogram whose first `failures` observations raise, killing the worker."""
+
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+
+    def observe(self, value: float, *labels: str) -> None:
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("broken")
+
+
+def test_jobs_are_processed_by_the_workers() -> None:
+    """Queued jobs run in the workers, and closing waits for them."""
+    done = []
+
+    async def main():
+        queue = JobQueue(capacity=10, num_workers=2)
+        queue.start()
+        for index in range(5):
+
+            async def job(index=index):
+                await asyncio.sleep(0.01)
+                done.append(index)
+
+            queue.submit(job)
+        await queue.close()
+
+    asyncio.run(main())
+
+    assert sorted(done) == [0, 1, 2, 3, 4]
+
+
+def test_failing_job_does_not_stop_the_worker() -> None:
+    """The exception of a job is logged, and the worker keeps going."""
+    done = []
+
+    async def fail():
+        raise ValueError("failed")
+
+    async def succeed():
+        done.append(None)
+
+    async def main():
+        queue = JobQueue(capacity=10, num_workers=1)
+        queue.start()
+        queue.submit(fail)
+        queue.submit(succeed)
+        await queue.close()
+
+    asyncio.run(main())
+
+    assert done == [None]
+
+
+def test_dead_worker_is_restarted_after_a_backoff(monkeypatch) -> None:
+    """A worker that died is replaced, after a delay doubled at each restart."""
+    monkeypatch.setattr(job_queue, "RESTART_BASE_DELAY", 0.05)
+    done = []
+
+    async def job():
+        done.append(time.monotonic())
+
+    async def main():
+        queue = JobQueue(capacity=10, num_workers=1, wait_time=FailingHistogram(2))
+        queue.start()
+        start = time.monotonic()
+        for _ in range(3):
+            queue.submit(job)
+        while not done:
+            await asyncio.sleep(0.01)
+        return start
+
+    start = asyncio.run(main())
+
+    # The first two jobs killed the worker, restarted after 0.05 then 0.1 secs
+    assert len(done) == 1
+    assert done[0] - start >= 0.15
+
+
+def test_worker_is_not_restarted_beyond_the_limit(monkeypatch) -> None:
+    """Once the workers died too often, the dead ones are not replaced."""
+    monkeypatch.setattr(job_queue, "RESTART_BASE_DELAY", 0.01)
+
+    async def job():
+        pass
+
+    async def main():
+        queue = JobQueue(
+            capacity=10,
+            num_workers=1,
+            wait_time=FailingHistogram(10),
+            max_restarts=2,
+        )
+        queue.start()
+        for _ in range(5):
+            queue.submit(job)
+        await asyncio.sleep(0.2)
+        return queue
+
+    queue = asyncio.run(main())
+
+    # Three jobs were taken by the initial worker and its two replacements
+    assert queue._workers == []
+    assert queue.depth == 2
+
+
+def test_full_queue_rejects_jobs() -> None:
+    """Jobs beyond the capacity are rejected with a retry delay."""
+
+    async def job():
+        pass
+
+    queue = JobQueue(capacity=2, num_workers=1)
+    queue.submit(job)
+    queue.submit(job)
+
+    assert queue.full
+    with pytest.raises(QueueFullError) as error:
+        queue.submit(job)
+    assert error.value.retry_after == DEFAULT_RETRY_AFTER
+
+
+def test_admitted_requests_count_against_the_capacity() -> None:
+    """Sync requests hold a slot of the capacity while they run."""
+    queue = JobQueue(capacity=1, num_workers=1)
+
+    async def main():
+        async with queue.admit():
+            assert queue.admitted == 1
+            with pytest.raises(QueueFullError):
+                async with queue.admit():
+                    pass
+        assert queue.admitted == 0
+
+    asyncio.run(main())
+
+
+def test_retry_after_follows_the_drain_rate() -> None:
+    """The retry delay is the time needed to drain the backlog at the observed rate."""
+
+    async def job():
+        pass
+
+    queue = JobQueue(capacity=10, num_workers=1)
+    # Two completions per second
+    queue._completions.extend([0.0, 0.5, 1.0, 1.5, 2.0])
+    for _ in range(5):
+        queue.submit(job)
+
+    assert queue.drain_rate == 2.0
+    assert queue.retry_after() == 3
+
+
+def test_closing_queue_rejects_jobs() -> None:
+    """No job is accepted once the queue is closing."""
+
+    async def job():
+        pass
+
+    async def main():
+        queue = JobQueue(capacity=10, num_workers=1)
+        queue.start()
+        await queue.close()
+        queue.submit(job)
+
+    with pytest.raises(QueueFullError):
+        asyncio.run(main())
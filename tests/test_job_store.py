@@ -0,0 +1,180 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the SQLite job store."""
+
+import asyncio
+import os
+
+from my_project.services.job_store import JobStatus, SQLiteJobStore
+
+
+async def open_store(path: str) -> SQLiteJobStore:
+    """Open a store whose writes are only flushed explicitly."""
+    store = SQLiteJobStore(path, flush_interval=3600)
+    await store.start()
+
+    return store
+
+
+def test_job_lifecycle(tmp_path) -> None:
+    """A job goes through its states, and its result is kept once flushed."""
+    path = str(tmp_path / "jobs.db")
+
+    async def main():
+        store = await open_store(path)
+        await store.create("job", job_name="name", task_token="token")
+        assert (await store.get("job")).status == JobStatus.queued
+
+        await store.mark_processing("job")
+        assert (await store.get("job")).started_at is not None
+
+        await store.mark_finished("job", b'{"utterances": []}')
+        await store.close()
+
+        store = await open_store(path)
+        job = await store.get("job")
+        result = await store.get_result("job")
+        await store.close()
+        return job, result
+
+    job, result = asyncio.run(main())
+
+    assert job.status == JobStatus.finished and job.done
+    assert job.job_name == "name" and job.task_token == "token"
+    assert result == b'{"utterances": []}'
+
+
+def test_failed_job_has_no_result(tmp_path) -> None:
+    """Failed jobs keep their error, and have no result."""
+
+    async def main():
+        store = await open_store(str(tmp_path / "jobs.db"))
+        await store.create("job")
+        await store.mark_error("job", "out of memory")
+        await store.flush()
+        job = await store.get("job")
+        result = await store.get_result("job")
+        await store.close()
+        return job, result
+
+    job, result = asyncio.run(main())
+
+    assert job.status == JobStatus.error
+    assert job.error == "out of memory"
+    assert result is None
+
+
+def test_unknown_job_is_none(tmp_path) -> None:
+    """Jobs that were never created are not found."""
+
+    async def main():
+        store = await open_store(str(tmp_path / "jobs.db"))
+        job = await store.get("missing")
+        await store.close()
+        return job
+
+    assert asyncio.run(main()) is None
+
+
+def test_unfinished_jobs_are_recovered(tmp_path) -> None:
+    """Jobs left queued or processing by a previous run are flagged as failed."""
+    path = str(tmp_path / "jobs.db")
+
+    async def main():
+        store = await open_store(path)
+        await store.create("queued")
+        await store.create("processing")
+        await store.mark_processing("processing")
+        await store.create("finished")
+        await store.mark_finished("finished", b"{}")
+        await store.close()
+
+        store = await open_store(path)
+        await store.recover()
+        jobs = {
+            job_id: await store.get(job_id)
+            for job_id in ("queued", "processing", "finished")
+        }
+        await store.close()
+        return jobs
+
+    jobs = asyncio.run(main())
+
+    assert jobs["queued"].status == JobStatus.error
+    assert jobs["processing"].status == JobStatus.error
+    assert "interrupted" in jobs["processing"].error
+    assert jobs["finished"].status == JobStatus.finished
+
+
+def test_created_jobs_are_written_immediately(tmp_path) -> None:
+    """A new job is in the database even if the store is never flushed."""
+    path = str(tmp_path / "jobs.db")
+
+    async def create():
+        store = await open_store(path)
+        await store.create("job", job_name="name")
+        # Abandon the store without flushing, like a worker that dies
+
+    pid = os.fork()
+    if pid == 0:
+        asyncio.run(create())
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    async def read():
+        store = await open_store(path)
+        job = await store.get("job")
+        await store.close()
+        return job
+
+    job = asyncio.run(read())
+
+    assert job.status == JobStatus.queued
+    assert job.job_name == "name"
+
+
+def test_only_the_jobs_of_a_dead_worker_are_recovered(tmp_path) -> None:
+    """Recovering a worker flags its own jobs only, not those of the others."""
+    path = str(tmp_path / "jobs.db")
+
+    async def create(job_id: str):
+        store = await open_store(path)
+        await store.create(job_id)
+        await store.mark_processing(job_id)
+        await store.close()
+
+    pid = os.fork()
+    if pid == 0:
+        asyncio.run(create("dead"))
+        os._exit(0)
+    os.waitpid(pid, 0)
+    asyncio.run(create("alive"))
+
+    async def recover():
+        store = await open_store(path)
+        await store.recover(worker_pid=pid)
+        jobs = {job_id: await store.get(job_id) for job_id in ("dead", "alive")}
+        await store.close()
+        return jobs
+
+    jobs = asyncio.run(recover())
+
+    assert jobs["dead"].status == JobStatus.error
+    assert jobs["alive"].status == JobStatus.processing
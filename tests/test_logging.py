@@ -0,0 +1,62 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the access log middleware."""
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from my_project.logging import LoggingMiddleware
+
+
+async def endpoint(request):
+    """Answer every request."""
+    return PlainTextResponse("ok")
+
+
+def make_client(**kwargs) -> TestClient:
+    """A test client of an application wrapped in the logging middleware."""
+    app = Starlette(routes=[Route("/{path:path}", endpoint, methods=["GET", "POST"])])
+
+    return TestClient(LoggingMiddleware(app, debug_mode=False, **kwargs))
+
+
+def test_requests_are_logged_with_their_query_string(capsys) -> None:
+    """The path and query string of a request are logged, with its status."""
+    client = make_client()
+
+    client.get("/api/v1/jobs", params={"limit": "10"})
+    client.post("/api/v1/audio")
+
+    output = capsys.readouterr().out
+    assert "GET /api/v1/jobs?limit=10" in output
+    assert "POST /api/v1/audio\n" in output
+    assert "Status: 200" in output
+
+
+def test_excluded_and_unsampled_requests_are_not_logged(capsys) -> None:
+    """The excluded paths are never logged, nor the requests left out of the sample."""
+    client = make_client(exclude_paths=["/healthz"], sample_rate=0.0)
+
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/api/v1/jobs").status_code == 200
+
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,136 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the aggregation of the metrics across the pre-forked workers."""
+
+import os
+import signal
+import statistics
+from types import SimpleNamespace
+from typing import Dict
+
+import pytest
+
+from my_project.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def metrics(tmp_path) -> SimpleNamespace:
+    """A registry shared through a temporary directory, and its metrics."""
+    registry = MetricsRegistry()
+    registry.callback_gauge("queue_depth", "Queue depth.", lambda: 2.0)
+    registry.share(str(tmp_path))
+
+    return SimpleNamespace(
+        registry=registry,
+        requests=registry.counter("requests_total", "Requests.", ("route",)),
+        latency=registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0)),
+        in_flight=registry.gauge("in_flight", "In-flight requests."),
+        utilization=registry.gauge(
+            "utilization", "Utilization.", aggregate=statistics.fmean
+        ),
+    )
+
+
+def start_worker(metrics: SimpleNamespace, requests: int, utilization: float) -> int:
+    """Fork a worker that records its metrics, writes them, then waits to be killed."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            metrics.registry.reset()
+            for _ in range(requests):
+                metrics.requests.inc("/v1/example")
+                metrics.latency.observe(0.5)
+            metrics.in_flight.inc()
+            metrics.utilization.set(utilization)
+            metrics.registry.write()
+
+            os.write(write_fd, b"x")
+            signal.pause()
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    os.read(read_fd, 1)
+    os.close(read_fd)
+
+    return pid
+
+
+def stop(pid: int) -> None:
+    """Kill a worker and reap it."""
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+
+
+def parse(text: str) -> Dict[str, float]:
+    """Parse the samples of a scrape."""
+    return {
+        sample: float(value)
+        for sample, value in (
+            line.rsplit(" ", 1) for line in text.splitlines() if line[0] != "#"
+        )
+    }
+
+
+def test_scrape_aggregates_the_metrics_of_the_workers(metrics) -> None:
+    """A scrape merges the metrics of two workers with its own."""
+    # Recorded before the fork, so only counted by the scraped process
+    metrics.requests.inc("/v1/example")
+    pids = [start_worker(metrics, 3, 0.2), start_worker(metrics, 5, 0.6)]
+    try:
+        samples = parse(metrics.registry.render())
+    finally:
+        for pid in pids:
+            stop(pid)
+
+    assert samples['requests_total{route="/v1/example"}'] == 9
+    assert samples['latency_seconds_bucket{le="0.1"}'] == 0
+    assert samples['latency_seconds_bucket{le="1.0"}'] == 8
+    assert samples["latency_seconds_count"] == 8
+    assert samples["latency_seconds_sum"] == 4.0
+    assert samples["in_flight"] == 2
+    assert samples["utilization"] == pytest.approx((0.2 + 0.6 + 0.0) / 3)
+    assert samples["queue_depth"] == 6
+
+
+def test_exited_workers_keep_their_counters_only(metrics) -> None:
+    """The counters of a retired worker are still reported, not its gauges."""
+    pid = start_worker(metrics, 3, 0.5)
+    stop(pid)
+    metrics.registry.retire(pid)
+
+    samples = parse(metrics.registry.render())
+
+    assert samples['requests_total{route="/v1/example"}'] == 3
+    assert samples["latency_seconds_count"] == 3
+    assert samples["in_flight"] == 0
+    assert samples["utilization"] == 0
+    assert samples["queue_depth"] == 2
+
+
+def test_unshared_registry_reports_its_own_metrics() -> None:
+    """Without a directory, a scrape only reports the metrics of the process."""
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests.").inc(amount=2)
+    registry.write()
+
+    assert parse(registry.render()) == {"requests_total": 2}
@@ -0,0 +1,147 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the multi-channel processing."""
+
+import asyncio
+import wave
+
+import numpy as np
+
+from my_project.engines.decoder import SAMPLE_RATE, AudioDecoder
+from my_project.engines.multi_channel import (
+    MultiChannelStage,
+    interleave_utterances,
+    speech_segments,
+)
+from my_project.models import Example, ExampleRequest
+
+
+def tone(duration: float, amplitude: float = 0.5) -> np.ndarray:
+    """A 440 Hz tone of `duration` seconds."""
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+
+def silence(duration: float) -> np.ndarray:
+    """`duration` seconds of silence."""
+    return np.zeros(int(duration * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_speech_is_separated_by_silence() -> None:
+    """Speech separated by enough silence gives separate segments."""
+    samples = np.concatenate([silence(1), tone(1), silence(1), tone(0.5)])
+
+    segments = speech_segments(samples, -40, min_silence=0.5)
+
+    assert len(segments) == 2
+    (first_start, first_end), (second_start, second_end) = segments
+    assert abs(first_start / SAMPLE_RATE - 1.0) < 0.05
+    assert abs(first_end / SAMPLE_RATE - 2.0) < 0.05
+    assert abs(second_start / SAMPLE_RATE - 3.0) < 0.05
+    assert second_end == len(samples) - len(samples) % int(0.03 * SAMPLE_RATE)
+
+
+def test_short_pauses_and_clicks_are_ignored() -> None:
+    """Pauses shorter than `min_silence` are merged, and clicks are dropped."""
+    samples = np.concatenate(
+        [tone(1), silence(0.2), tone(1), silence(1), tone(0.03), silence(1)]
+    )
+
+    segments = speech_segments(samples, -40, min_silence=0.5)
+
+    assert len(segments) == 1
+    assert abs(segments[0][1] / SAMPLE_RATE - 2.2) < 0.05
+
+
+def test_quiet_audio_has_no_segment() -> None:
+    """Audio under the silence threshold has no speech."""
+    assert speech_segments(tone(1, amplitude=0.001), -40, min_silence=0.5) == []
+
+
+def test_strided_channel_view_is_segmented() -> None:
+    """A column of an interleaved buffer gives the same segments as a copy."""
+    left = np.concatenate([tone(1), silence(1)])
+    right = np.concatenate([silence(1), tone(1)])
+    buffer = np.stack([left, right], axis=1)
+
+    assert speech_segments(buffer[:, 1], -40, 0.5) == speech_segments(right, -40, 0.5)
+
+
+def test_utterances_are_interleaved_by_start_time() -> None:
+    """Utterances of every channel are merged by the start time of their segment."""
+    channels = [
+        [(0.0, ["hello", "how are you"]), (5.0, ["great"])],
+        [(2.0, ["fine thanks"]), (7.0, ["bye"])],
+    ]
+
+    assert list(interleave_utterances(channels)) == [
+        (0.0, 0, "hello"),
+        (0.0, 0, "how are you"),
+        (2.0, 1, "fine thanks"),
+        (5.0, 0, "great"),
+        (7.0, 1, "bye"),
+    ]
+
+
+def write_wav(path: str, buffer: np.ndarray) -> None:
+    """Write a 16-bit WAV file of interleaved float samples."""
+    with wave.open(path, "wb") as f:
+        f.setnchannels(buffer.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((buffer * 32767).astype("<i2").tobytes())
+
+
+async def transcribe_segment(samples, data: ExampleRequest) -> Example:
+    """Fake processing returning the duration of the segment, in seconds."""
+    fields = data.model_dump(include=set(Example.model_fields))
+    duration = round(len(samples) / SAMPLE_RATE)
+
+    return Example(
+        **{**fields, "utterances": [f"{duration}s"], "audio_duration": duration}
+    )
+
+
+async def single_channel(audio: str, data: ExampleRequest) -> str:
+    """Fake processing of the inputs not processed by channel."""
+    return "single"
+
+
+def test_stage_processes_each_channel(tmp_path) -> None:
+    """Each channel is processed by speech segment, with its channel as speaker."""
+    audio = str(tmp_path / "call.wav")
+    left = np.concatenate([tone(1), silence(3), tone(2), silence(1)])
+    right = np.concatenate([silence(2), tone(1), silence(4)])
+    write_wav(audio, np.stack([left, right], axis=1))
+
+    stage = MultiChannelStage(
+        AudioDecoder(asyncio.Semaphore(1)),
+        transcribe_segment,
+        single_channel,
+        silence_threshold_db=-40,
+        min_silence=0.5,
+    )
+
+    result = asyncio.run(stage.process(audio, ExampleRequest(multi_channel=True)))
+
+    assert result.utterances == ["1s", "1s", "2s"]
+    assert result.speakers == [0, 1, 0]
+    assert result.audio_duration == 7.0
+    assert asyncio.run(stage.process(audio, ExampleRequest())) == "single"
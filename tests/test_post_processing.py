@@ -0,0 +1,77 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the formatting of the results."""
+
+import asyncio
+
+from my_project.engines.post_processing import PostProcessingStage
+from my_project.models import Example, ExampleRequest
+from my_project.services.example_service import ExceptionSource, ProcessException
+
+
+def make_stage(utterances, speakers=None) -> PostProcessingStage:
+    """A stage formatting a fixed result."""
+
+    async def process(audio: str, data: ExampleRequest) -> Example:
+        fields = data.model_dump(include=set(Example.model_fields))
+        return Example(
+            **{
+                **fields,
+                "utterances": utterances,
+                "speakers": speakers,
+                "audio_duration": 1.0,
+            }
+        )
+
+    return PostProcessingStage(process)
+
+
+def test_utterances_are_formatted() -> None:
+    """The utterances are formatted, and the empty ones dropped."""
+    stage = make_stage(["hello , i am here", " ... ", "is it ok ?"])
+
+    result = asyncio.run(stage.process("audio.wav", ExampleRequest()))
+
+    assert result.utterances == ["Hello, I am here.", "Is it ok?"]
+    assert result.audio_duration == 1.0
+
+
+def test_speakers_follow_the_kept_utterances() -> None:
+    """The speaker of a dropped utterance is dropped too."""
+    stage = make_stage(["one", ".", "two"], speakers=[0, 1, 0])
+
+    result = asyncio.run(stage.process("audio.wav", ExampleRequest()))
+
+    assert result.utterances == ["One.", "Two."]
+    assert result.speakers == [0, 0]
+
+
+def test_exceptions_are_returned_unchanged() -> None:
+    """A failed processing is not formatted."""
+    exception = ProcessException(
+        source=ExceptionSource.post_processing, message="failed"
+    )
+
+    async def process(audio: str, data: ExampleRequest) -> ProcessException:
+        return exception
+
+    stage = PostProcessingStage(process)
+
+    assert asyncio.run(stage.process("audio.wav", ExampleRequest())) is exception
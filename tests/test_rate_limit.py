@@ -0,0 +1,195 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the token-bucket rate limiting."""
+
+import os
+import time
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from my_project.config import settings
+from my_project.rate_limit import (
+    Limit,
+    MemoryBucketStore,
+    RateLimiter,
+    RateLimitMiddleware,
+    SharedBucketStore,
+)
+from my_project.router.authentication import create_access_token, get_rate_limit_key
+
+
+@pytest.fixture(params=[MemoryBucketStore, SharedBucketStore])
+def store(request):
+    """Each bucket store, with a small table for the shared one."""
+    if request.param is SharedBucketStore:
+        return SharedBucketStore(slots=64)
+
+    return MemoryBucketStore()
+
+
+def test_limit_is_parsed() -> None:
+    """Limits are written as `count/period`."""
+    limit = Limit.parse("120/60")
+
+    assert limit == Limit(120, 60.0)
+    assert limit.refill_rate == 2.0
+
+
+def test_bucket_allows_its_capacity(store) -> None:
+    """A full bucket allows `capacity` requests, then rejects with a retry delay."""
+    limit = Limit(3, 3.0)
+
+    results = [store.take("client", limit, now=0.0) for _ in range(4)]
+
+    assert [result.allowed for result in results] == [True, True, True, False]
+    assert [result.remaining for result in results[:3]] == [2, 1, 0]
+    assert results[3].retry_after == pytest.approx(1.0)
+    assert results[3].headers()["Retry-After"] == "1"
+
+
+def test_bucket_is_refilled_over_time(store) -> None:
+    """Tokens are added back at the refill rate, up to the capacity."""
+    limit = Limit(2, 2.0)
+    store.take("client", limit, now=0.0)
+    store.take("client", limit, now=0.0)
+
+    assert not store.take("client", limit, now=0.5).allowed
+    assert store.take("client", limit, now=1.5).allowed
+    assert store.take("client", limit, now=100.0).remaining == 1
+
+
+def test_buckets_are_per_key(store) -> None:
+    """The buckets of two keys are independent."""
+    limit = Limit(1, 60.0)
+
+    assert store.take("a", limit, now=0.0).allowed
+    assert store.take("b", limit, now=0.0).allowed
+    assert not store.take("a", limit, now=0.0).allowed
+
+
+def test_refund_gives_back_a_token(store) -> None:
+    """A refunded token can be taken again, without exceeding the capacity."""
+    limit = Limit(1, 60.0)
+    store.take("client", limit, now=0.0)
+    store.refund("client", limit)
+    store.refund("client", limit)
+
+    assert store.take("client", limit, now=0.0).allowed
+    assert not store.take("client", limit, now=0.0).allowed
+
+
+def test_memory_store_is_bounded() -> None:
+    """The least recently used buckets are dropped above `max_keys`."""
+    store = MemoryBucketStore(max_keys=2)
+    limit = Limit(1, 60.0)
+    for key in ("a", "b", "c"):
+        store.take(key, limit, now=0.0)
+
+    # The bucket of `a` was dropped, so it is full again
+    assert store.take("a", limit, now=0.0).allowed
+    assert not store.take("c", limit, now=0.0).allowed
+
+
+def test_shared_store_holds_across_processes() -> None:
+    """The tokens taken by a forked worker are taken for the others as well."""
+    store = SharedBucketStore(slots=64)
+    limit = Limit(2, 60.0)
+
+    pid = os.fork()
+    if pid == 0:
+        store.take("client", limit, now=0.0)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert store.take("client", limit, now=0.0).remaining == 0
+
+
+def test_route_token_is_refunded_when_the_client_rejects() -> None:
+    """A request rejected by the client bucket does not spend a route token."""
+    store = MemoryBucketStore()
+    limiter = RateLimiter(store, Limit(1, 60.0), {"/v1/slow": Limit(2, 60.0)})
+
+    bucket, result = limiter.check("client", "/v1/fast")
+    assert bucket == "client" and result.allowed
+
+    bucket, result = limiter.check("client", "/v1/slow")
+    assert bucket == "client" and not result.allowed
+    route = store.take("client\n/v1/slow", Limit(2, 60.0), now=time.monotonic())
+    assert route.remaining == 1
+
+
+def test_most_restrictive_bucket_is_reported() -> None:
+    """The bucket with the fewest tokens left is reported in the headers."""
+    limiter = RateLimiter(
+        MemoryBucketStore(), Limit(10, 60.0), {"/v1/slow": Limit(2, 60.0)}
+    )
+
+    bucket, result = limiter.check("client", "/v1/slow")
+
+    assert bucket == "route"
+    assert result.remaining == 1
+    assert limiter.check("client", "/healthz")[0] == "client"
+
+
+def test_middleware_rejects_above_the_limit() -> None:
+    """Requests above the limit get a 429 with the `RateLimit-*` headers."""
+
+    async def endpoint(request):
+        return PlainTextResponse("ok")
+
+    app = RateLimitMiddleware(
+        Starlette(routes=[Route("/v1/route", endpoint), Route("/healthz", endpoint)]),
+        RateLimiter(MemoryBucketStore(), Limit(1, 60.0)),
+        identify=lambda scope: "client",
+        path_prefix="/v1",
+    )
+    client = TestClient(app)
+
+    allowed = client.get("/v1/route")
+    rejected = client.get("/v1/route")
+
+    assert allowed.status_code == 200
+    assert allowed.headers["RateLimit-Remaining"] == "0"
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "60"
+    assert client.get("/healthz").status_code == 200
+
+
+def test_rate_limit_key_ignores_the_tenant_header() -> None:
+    """Authenticated clients are keyed on their user, whatever their tenant."""
+    token = create_access_token({"sub": settings.username})
+
+    def scope(*headers):
+        return {"type": "http", "headers": list(headers), "client": ("10.0.0.1", 1)}
+
+    authorization = (b"authorization", f"Bearer {token}".encode())
+    keys = {
+        get_rate_limit_key(scope(authorization, (b"x-tenant-id", tenant)))
+        for tenant in (b"a", b"b")
+    }
+
+    assert keys == {f"user:{settings.username}"}
+    assert get_rate_limit_key(scope((b"authorization", b"Bearer bad"))) == (
+        "ip:10.0.0.1"
+    )
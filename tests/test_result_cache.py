@@ -0,0 +1,126 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the result cache."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import BaseModel
+
+from my_project.engines.result_cache import ResultCache
+
+
+class Result(BaseModel):
+    """Result model of the tests."""
+
+    text: str
+
+
+def test_concurrent_lookups_are_coalesced() -> None:
+    """Identical concurrent lookups compute the result once."""
+    cache = ResultCache(Result, memory_size=8)
+    calls = []
+
+    async def compute() -> Result:
+        calls.append(None)
+        await asyncio.sleep(0.05)
+        return Result(text="hello")
+
+    async def main():
+        return await asyncio.gather(
+            *(cache.get_or_compute("key", compute) for _ in range(5))
+        )
+
+    results = asyncio.run(main())
+
+    assert results == [Result(text="hello")] * 5
+    assert len(calls) == 1
+    assert cache.misses == 1
+    assert cache.coalesced == 4
+
+
+def test_exceptions_are_not_cached() -> None:
+    """Results that are not instances of the model are passed through uncached."""
+    cache = ResultCache(Result, memory_size=8)
+
+    async def compute():
+        return ValueError("failed")
+
+    async def main():
+        first = await cache.get_or_compute("key", compute)
+        second = await cache.get_or_compute("key", compute)
+        return first, second
+
+    first, second = asyncio.run(main())
+
+    assert isinstance(first, ValueError) and isinstance(second, ValueError)
+    assert cache.misses == 2
+
+
+def test_disk_tier_is_shared(tmp_path) -> None:
+    """A result written by a cache is read from the disk by another one."""
+    writer = ResultCache(
+        Result, memory_size=0, disk_path=str(tmp_path), disk_max_bytes=1024
+    )
+    reader = ResultCache(
+        Result, memory_size=0, disk_path=str(tmp_path), disk_max_bytes=1024
+    )
+
+    async def main():
+        await writer.start()
+        await writer.put("key", Result(text="hello"))
+        return await reader.get("key")
+
+    assert asyncio.run(main()) == Result(text="hello")
+    assert reader.disk_hits == 1
+
+
+def test_concurrent_disk_writes_are_counted(tmp_path) -> None:
+    """Concurrent writes of the same key from several threads are all counted."""
+    cache = ResultCache(
+        Result, memory_size=0, disk_path=str(tmp_path), disk_max_bytes=1 << 30
+    )
+    cache._disk_scan()
+    payload = Result(text="x" * 100).model_dump_json().encode()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for future in [
+            executor.submit(cache._disk_write, "key", payload) for _ in range(200)
+        ]:
+            future.result()
+
+    assert cache._disk_bytes == 200 * len(payload)
+    assert [path.name for path in tmp_path.glob("*/*")] == ["key.json"]
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path) -> None:
+    """Writes beyond the size limit evict the oldest entries."""
+    payload = Result(text="x" * 100).model_dump_json().encode()
+    cache = ResultCache(
+        Result, memory_size=0, disk_path=str(tmp_path), disk_max_bytes=len(payload) * 4
+    )
+    cache._disk_scan()
+
+    for index in range(10):
+        cache._disk_write(f"{index:02d}", payload)
+
+    assert cache._disk_bytes <= len(payload) * 4
+    assert cache._disk_read("09") == payload
+    assert cache._disk_read("00") is None
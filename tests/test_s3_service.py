@@ -0,0 +1,188 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the S3 service, against a mocked S3."""
+
+import asyncio
+import gzip
+import os
+from typing import List
+
+import boto3
+import pytest
+from moto import mock_aws
+from pydantic import BaseModel
+
+from my_project.serialization import dumps
+from my_project.services.s3_service import S3Service
+
+BUCKET = "results"
+MIB = 1024 * 1024
+
+
+@pytest.fixture
+def s3_client():
+    """An S3 client of a mocked S3, with an empty bucket."""
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def make_service(client, **kwargs) -> S3Service:
+    """Create an S3 service using the mocked client."""
+    options = {
+        "bucket": BUCKET,
+        "max_concurrency": 2,
+        "multipart_threshold": 5 * MIB,
+        "part_size": 5 * MIB,
+    }
+    options.update(kwargs)
+    service = S3Service(**options)
+    service.client = client
+
+    return service
+
+
+def test_small_payload_is_put_in_a_single_request(s3_client) -> None:
+    """Payloads below the threshold are sent with put_object."""
+    service = make_service(s3_client)
+
+    assert asyncio.run(service.upload_json(b'{"utterances": []}', "small.json"))
+
+    obj = s3_client.get_object(Bucket=BUCKET, Key="small.json")
+    assert obj["Body"].read() == b'{"utterances": []}'
+    assert obj["ContentType"] == "application/json"
+    assert "-" not in obj["ETag"]
+    assert not s3_client.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+
+
+def test_compressed_payload_has_content_encoding(s3_client) -> None:
+    """Compressed payloads carry the matching Content-Encoding."""
+    service = make_service(s3_client, content_encoding="gzip")
+
+    assert asyncio.run(service.upload_json(b'{"utterances": []}', "gzip.json"))
+
+    obj = s3_client.get_object(Bucket=BUCKET, Key="gzip.json")
+    assert obj["ContentEncoding"] == "gzip"
+    assert gzip.decompress(obj["Body"].read()) == b'{"utterances": []}'
+
+
+class Result(BaseModel):
+    """Result model of the tests."""
+
+    job_name: str
+    utterances: List[str]
+
+
+def large_result(size: int) -> Result:
+    """A result of about `size` bytes, that compresses to about half of it."""
+    return Result(
+        job_name="large",
+        utterances=[os.urandom(512).hex() for _ in range(size // 1024)],
+    )
+
+
+def test_model_is_streamed_in_parts(s3_client) -> None:
+    """A large model is serialized into the parts of a multipart upload."""
+    service = make_service(s3_client)
+    result = large_result(12 * MIB)
+
+    assert asyncio.run(service.upload_json(result, "model.json"))
+
+    obj = s3_client.get_object(Bucket=BUCKET, Key="model.json")
+    assert obj["Body"].read() == dumps(result)
+    assert obj["ETag"].strip('"').endswith("-3")
+
+
+def test_compressed_payload_is_streamed_in_parts(s3_client) -> None:
+    """A large payload is compressed into the parts of a multipart upload."""
+    service = make_service(s3_client, content_encoding="gzip")
+    payload = dumps(large_result(16 * MIB))
+
+    assert asyncio.run(service.upload_json(payload, "gzip-large.json"))
+
+    obj = s3_client.get_object(Bucket=BUCKET, Key="gzip-large.json")
+    assert gzip.decompress(obj["Body"].read()) == payload
+    assert obj["ETag"].strip('"').endswith("-2")
+
+
+def test_small_model_is_put_in_a_single_request(s3_client) -> None:
+    """A model below the threshold is sent with put_object."""
+    service = make_service(s3_client, content_encoding="gzip")
+    result = Result(job_name="small", utterances=["hello"])
+
+    assert asyncio.run(service.upload_json(result, "small-model.json"))
+
+    obj = s3_client.get_object(Bucket=BUCKET, Key="small-model.json")
+    assert gzip.decompress(obj["Body"].read()) == dumps(result)
+    assert "-" not in obj["ETag"]
+
+
+def test_part_size_below_the_s3_minimum_is_rejected() -> None:
+    """Parts smaller than 5 MiB would fail the completion of the uploads."""
+    with pytest.raises(ValueError, match="minimum"):
+        S3Service(BUCKET, 1, 5 * MIB, 4 * MIB)
+
+
+def test_unsupported_content_encoding_is_rejected() -> None:
+    """Unknown encodings fail when the service is created."""
+    with pytest.raises(ValueError, match="br"):
+        S3Service(BUCKET, 1, 5 * MIB, 5 * MIB, content_encoding="br")
+
+
+def test_large_payload_is_sent_in_parts(s3_client) -> None:
+    """Payloads above the threshold are sent in parts of `part_size` bytes."""
+    service = make_service(s3_client)
+    payload = bytes(range(256)) * (12 * MIB // 256)
+
+    assert asyncio.run(service.upload_json(payload, "large.json"))
+
+    obj = s3_client.get_object(Bucket=BUCKET, Key="large.json")
+    assert obj["Body"].read() == payload
+    assert obj["ContentType"] == "application/json"
+    # The ETag of a multipart object ends with its number of parts
+    assert obj["ETag"].strip('"').endswith("-3")
+    assert not s3_client.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+
+
+@pytest.mark.parametrize("content_encoding", ["", "gzip"])
+def test_failed_multipart_upload_is_aborted(
+    s3_client, monkeypatch, content_encoding
+) -> None:
+    """A failed multipart upload is aborted, so no part is left behind."""
+    service = make_service(s3_client, content_encoding=content_encoding)
+    payload = dumps(large_result(12 * MIB))
+
+    def fail(**kwargs):
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(s3_client, "complete_multipart_upload", fail)
+
+    assert not asyncio.run(service.upload_json(payload, "failed.json"))
+
+    assert not s3_client.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=BUCKET)
+
+
+def test_upload_without_client_fails() -> None:
+    """Uploads fail, without raising, until the service is started."""
+    service = S3Service(BUCKET, 1, 5 * MIB, 5 * MIB)
+
+    assert not asyncio.run(service.upload_json(b"{}", "result.json"))
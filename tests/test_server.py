@@ -0,0 +1,163 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the supervision of the workers by the pre-fork server."""
+
+import os
+import signal
+import time
+from typing import List
+
+import pytest
+
+from my_project.server import STARTUP_FAILURE, PreforkServer, exit_code_of
+
+
+class Supervisor(PreforkServer):
+    """Server whose workers are plain child processes, recording its actions."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            config=None, workers=2, heartbeat_timeout=0.2, startup_timeout=60.0
+        )
+        self.spawned: List[int] = []
+        self.recovered: List[int] = []
+
+    def start_child(self, index: int, exit_code: int = 0, delay: float = 0.0) -> int:
+        """Fork a child in a slot, exiting with `exit_code` after `delay` secs."""
+        self.heartbeats[index] = 0.0
+        self.spawned_at[index] = time.monotonic()
+
+        pid = os.fork()
+        if pid == 0:
+            time.sleep(delay)
+            os._exit(exit_code)
+        self.pids[index] = pid
+
+        return pid
+
+    def spawn(self, index: int) -> None:
+        self.spawned.append(index)
+
+    async def recover(self, pid: int) -> None:
+        self.recovered.append(pid)
+
+
+def wait_exit(pid: int) -> None:
+    """Wait for a child without reaping it."""
+    os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+
+
+@pytest.fixture
+def supervisor():
+    """A supervisor whose remaining children are killed at the end of the test."""
+    server = Supervisor()
+    yield server
+
+    for pid in server.pids.values():
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def test_exited_worker_is_recovered_and_restarted(supervisor) -> None:
+    """A worker that exits has its jobs recovered, then is replaced in its slot."""
+    pid = supervisor.start_child(1, exit_code=1)
+    wait_exit(pid)
+
+    assert supervisor.reap()
+    assert supervisor.recovered == [pid]
+    assert supervisor.spawned == [1]
+    assert 1 not in supervisor.pids
+
+
+def test_startup_failure_stops_the_restarts(supervisor) -> None:
+    """A worker that failed to start is not restarted, and the server stops."""
+    pid = supervisor.start_child(0, exit_code=STARTUP_FAILURE)
+    wait_exit(pid)
+
+    assert not supervisor.reap()
+    assert supervisor.spawned == []
+
+
+def test_running_workers_are_not_reaped(supervisor) -> None:
+    """Reaping leaves the workers that are still running alone."""
+    supervisor.start_child(0, delay=60)
+
+    assert supervisor.reap()
+    assert supervisor.spawned == []
+    assert 0 in supervisor.pids
+
+
+def test_starting_worker_is_not_killed_before_the_startup_timeout(supervisor) -> None:
+    """A worker without heartbeat yet is given the startup timeout, not the other."""
+    pid = supervisor.start_child(0, delay=60)
+    time.sleep(0.3)
+
+    supervisor.check_heartbeats()
+
+    assert os.waitpid(pid, os.WNOHANG) == (0, 0)
+
+
+def test_stuck_workers_are_killed(supervisor) -> None:
+    """Workers silent for longer than their timeout are killed, then restarted."""
+    supervisor.startup_timeout = 0.2
+    starting = supervisor.start_child(0, delay=60)
+    running = supervisor.start_child(1, delay=60)
+    supervisor.heartbeats[1] = time.monotonic()
+    time.sleep(0.3)
+
+    supervisor.check_heartbeats()
+    wait_exit(starting)
+    wait_exit(running)
+
+    assert supervisor.reap()
+    assert sorted(supervisor.recovered) == sorted([starting, running])
+    assert sorted(supervisor.spawned) == [0, 1]
+
+
+def test_heartbeat_keeps_a_worker_alive(supervisor) -> None:
+    """A worker reporting within the heartbeat timeout is not killed."""
+    pid = supervisor.start_child(0, delay=60)
+    time.sleep(0.3)
+    supervisor.heartbeats[0] = time.monotonic()
+
+    supervisor.check_heartbeats()
+
+    assert os.waitpid(pid, os.WNOHANG) == (0, 0)
+
+
+@pytest.mark.parametrize("exit_code", [0, 1, STARTUP_FAILURE])
+def test_exit_code_of_an_exited_process(exit_code: int) -> None:
+    """The exit code of a process is its exit status."""
+    pid = os.fork()
+    if pid == 0:
+        os._exit(exit_code)
+
+    assert exit_code_of(os.waitpid(pid, 0)[1]) == exit_code
+
+
+def test_exit_code_of_a_killed_process() -> None:
+    """The exit code of a killed process is minus the signal."""
+    pid = os.fork()
+    if pid == 0:
+        time.sleep(60)
+        os._exit(0)
+    os.kill(pid, signal.SIGKILL)
+
+    assert exit_code_of(os.waitpid(pid, 0)[1]) == -signal.SIGKILL
@@ -0,0 +1,209 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the WebSocket streaming endpoint."""
+
+import asyncio
+import time
+from typing import Callable, List
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from my_project.metrics import STREAM_SESSIONS
+from my_project.models import ExampleRequest, StreamingUtterance
+from my_project.router.v1 import stream_endpoint
+
+
+class EchoSession:
+    """Session returning a partial utterance per chunk, and a final one at the end."""
+
+    def __init__(self, data: ExampleRequest) -> None:
+        self.data = data
+        self.chunks: List[bytes] = []
+        self.cancelled = False
+
+    async def feed(self, chunk: bytes) -> List[StreamingUtterance]:
+        self.chunks.append(chunk)
+        return [StreamingUtterance(text=chunk.decode(), final=False)]
+
+    async def finish(self) -> List[StreamingUtterance]:
+        return [StreamingUtterance(text=self.data.source_lang, final=True)]
+
+
+class BlockedSession(EchoSession):
+    """Session whose processing never completes, until it is cancelled."""
+
+    async def feed(self, chunk: bytes) -> List[StreamingUtterance]:
+        self.chunks.append(chunk)
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+class FakeService:
+    """Service creating sessions of a given class, kept for inspection."""
+
+    def __init__(self, session_class: type) -> None:
+        self.session_class = session_class
+        self.sessions: List[EchoSession] = []
+
+    def create_session(self, data: ExampleRequest) -> EchoSession:
+        self.sessions.append(self.session_class(data))
+        return self.sessions[-1]
+
+
+def make_client(monkeypatch, session_class: type = EchoSession) -> TestClient:
+    """A client of the streaming endpoint, with a fake service."""
+    monkeypatch.setattr(stream_endpoint, "service", FakeService(session_class))
+    monkeypatch.setattr(stream_endpoint, "stream_session_limit", asyncio.Semaphore(1))
+
+    app = FastAPI()
+    app.include_router(stream_endpoint.router, prefix="/stream")
+
+    return TestClient(app)
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    """Wait until a condition on the server side holds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out."
+        time.sleep(0.01)
+
+
+def sessions_gauge() -> float:
+    """The current value of the open sessions gauge."""
+    return next(value for _, _, value in STREAM_SESSIONS.samples())
+
+
+def test_utterances_are_pushed_as_the_audio_is_processed(monkeypatch) -> None:
+    """Each frame gets its partial utterances, and the end its final ones."""
+    client = make_client(monkeypatch)
+
+    with client.websocket_connect("/stream") as websocket:
+        websocket.send_json({"type": "config", "source_lang": "fr"})
+        websocket.send_bytes(b"one")
+        assert websocket.receive_json() == {"type": "partial", "text": "one"}
+        websocket.send_bytes(b"two")
+        assert websocket.receive_json() == {"type": "partial", "text": "two"}
+        websocket.send_json({"type": "end"})
+
+        assert websocket.receive_json() == {"type": "final", "text": "fr"}
+        assert websocket.receive_json() == {"type": "end"}
+        assert websocket.receive() == {
+            "type": "websocket.close",
+            "code": 1000,
+            "reason": "",
+        }
+
+
+def test_config_message_is_optional(monkeypatch) -> None:
+    """Audio sent without a config message uses the default parameters."""
+    client = make_client(monkeypatch)
+
+    with client.websocket_connect("/stream") as websocket:
+        websocket.send_bytes(b"one")
+        websocket.send_json({"type": "end"})
+        messages = [websocket.receive_json() for _ in range(3)]
+
+    assert messages == [
+        {"type": "partial", "text": "one"},
+        {"type": "final", "text": "en"},
+        {"type": "end"},
+    ]
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "not json",
+        "[1, 2]",
+        '{"type": "unknown"}',
+        '{"type": "config", "batch_size": "x"}',
+    ],
+)
+def test_invalid_message_closes_with_a_policy_violation(monkeypatch, message) -> None:
+    """Messages that are not audio, config or end close the connection with 1008."""
+    client = make_client(monkeypatch)
+
+    with client.websocket_connect("/stream") as websocket:
+        websocket.send_text(message)
+        closed = websocket.receive()
+
+    assert closed["type"] == "websocket.close"
+    assert closed["code"] == 1008
+
+
+def test_sessions_above_the_limit_are_rejected(monkeypatch) -> None:
+    """Connections above the session limit are closed with 1013."""
+    client = make_client(monkeypatch)
+    monkeypatch.setattr(stream_endpoint, "stream_session_limit", asyncio.Semaphore(0))
+
+    with client.websocket_connect("/stream") as websocket:
+        closed = websocket.receive()
+
+    assert closed["code"] == 1013
+    assert stream_endpoint.service.sessions == []
+
+
+def test_disconnect_cancels_the_processing(monkeypatch) -> None:
+    """A client leaving mid-stream cancels its session and frees its slot."""
+    client = make_client(monkeypatch, BlockedSession)
+
+    with client.websocket_connect("/stream") as websocket:
+        websocket.send_bytes(b"one")
+        sessions = stream_endpoint.service.sessions
+        wait_for(lambda: sessions and sessions[0].chunks)
+        assert sessions_gauge() == 1
+
+    assert sessions[0].cancelled
+    assert sessions_gauge() == 0
+    assert not stream_endpoint.stream_session_limit.locked()
+
+
+def test_full_queue_stops_reading_the_socket() -> None:
+    """While the chunk queue is full, no more frames are read from the client."""
+
+    class Socket:
+        def __init__(self) -> None:
+            self.reads = 0
+
+        async def receive(self) -> dict:
+            self.reads += 1
+            return {"type": "websocket.receive", "bytes": b"chunk"}
+
+    async def main():
+        socket = Socket()
+        chunks = asyncio.Queue(maxsize=2)
+        receiver = asyncio.ensure_future(stream_endpoint.receive_audio(socket, chunks))
+        await asyncio.sleep(0.05)
+        reads = socket.reads
+
+        # Each chunk taken lets a single new frame in
+        await chunks.get()
+        await asyncio.sleep(0.05)
+        receiver.cancel()
+        return reads, socket.reads
+
+    # Two queued chunks, and a third one waiting for room in the queue
+    assert asyncio.run(main()) == (3, 4)
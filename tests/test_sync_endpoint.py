@@ -0,0 +1,150 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the sync endpoint and its streaming mode."""
+
+import json
+from typing import AsyncIterator, List, Union
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from my_project.engines.result_cache import ResultCache
+from my_project.models import Example, ExampleRequest
+from my_project.router.v1 import sync_endpoint
+
+AUDIO = b"RIFF fake audio"
+
+
+def make_result(data: ExampleRequest, utterances: List[str]) -> Example:
+    """A result of the request, with the given utterances."""
+    fields = data.model_dump(include=set(Example.model_fields))
+
+    return Example(**{**fields, "utterances": utterances, "audio_duration": 1.0})
+
+
+class FakeService:
+    """Service streaming the raw utterances of the input."""
+
+    async def stream_input(
+        self, audio: str, data: ExampleRequest
+    ) -> AsyncIterator[Union[str, Example]]:
+        yield "hello  world"
+        yield " ... "
+        yield make_result(data, ["hello  world", " ... "])
+
+
+class FakeStage:
+    """Stages returning formatted results, with a speaker per channel."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def process(self, audio: str, data: ExampleRequest) -> Example:
+        self.calls += 1
+        result = make_result(data, ["Hello world.", "Bye."])
+        if data.multi_channel:
+            result.speakers = [0, 1]
+
+        return result
+
+
+@pytest.fixture
+def stage(monkeypatch, tmp_path) -> FakeStage:
+    """Fake the service and stages, with an empty result cache."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sync_endpoint, "service", FakeService())
+    monkeypatch.setattr(sync_endpoint, "post_processing_stage", FakeStage())
+    monkeypatch.setattr(
+        sync_endpoint, "result_cache", ResultCache(Example, memory_size=16)
+    )
+
+    return sync_endpoint.post_processing_stage
+
+
+@pytest.fixture
+def client(stage) -> TestClient:
+    """A client of the sync endpoint."""
+    app = FastAPI()
+    app.include_router(sync_endpoint.router, prefix="/audio")
+
+    return TestClient(app)
+
+
+def post(client: TestClient, stream: bool = False, **form) -> List[dict]:
+    """Post the audio, return the response or the streamed events."""
+    form.setdefault("batch_size", 1)
+    response = client.post(
+        "/audio",
+        files={"file": ("audio.wav", AUDIO, "audio/wav")},
+        data={key: str(value).lower() for key, value in form.items()},
+        headers={"Accept": "application/x-ndjson"} if stream else {},
+    )
+    assert response.status_code == 200
+
+    if not stream:
+        return response.json()
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_streamed_utterances_are_formatted(client) -> None:
+    """The streamed utterances are formatted like those of the results."""
+    events = post(client, stream=True)
+
+    assert events[0] == {
+        "event": "utterance",
+        "data": {"index": 0, "text": "Hello world."},
+    }
+    assert [event["event"] for event in events] == ["utterance", "result"]
+
+
+def test_streamed_result_is_not_cached(client, stage) -> None:
+    """A stream does not cache its result in place of the one of the stages."""
+    post(client, stream=True)
+    response = post(client)
+
+    assert stage.calls == 1
+    assert response["utterances"] == ["Hello world.", "Bye."]
+
+
+def test_cached_result_is_replayed_as_a_stream(client, stage) -> None:
+    """A stream of an input already processed replays its cached result."""
+    post(client)
+    events = post(client, stream=True)
+
+    assert stage.calls == 1
+    assert [event["data"].get("text") for event in events[:2]] == [
+        "Hello world.",
+        "Bye.",
+    ]
+
+
+def test_multi_channel_stream_is_processed_by_channel(client, stage) -> None:
+    """A multi-channel stream gets the utterances and speakers of the stages."""
+    events = post(client, stream=True, multi_channel=True)
+    response = post(client, multi_channel=True)
+
+    assert stage.calls == 1
+    assert [event["data"].get("text") for event in events[:2]] == [
+        "Hello world.",
+        "Bye.",
+    ]
+    assert events[2]["event"] == "result"
+    assert events[2]["data"]["speakers"] == response["speakers"] == [0, 1]
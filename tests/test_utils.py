@@ -0,0 +1,126 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the utterance text post-processing."""
+
+import random
+import re
+from typing import Callable, List, Optional
+
+import pytest
+
+from my_project.utils import format_punct, format_utterances, is_empty_string
+
+# Fragments mixing the patterns handled by the functions with unicode edge cases
+ALPHABET = list(" \t\n\u00a0\u2003.?!,:;iIaxX\u00df\u00e9\u0130\u0131") + [
+    "...",
+    " i ",
+    "i.",
+    "i'm",
+]
+CASES = 5000
+
+
+def legacy_is_empty_string(text: str):
+    """The previous implementation of `is_empty_string`."""
+    text = text.replace(".", "")
+    text = re.sub(r"\s+", "", text)
+    if text.strip():
+        return False
+    return True
+
+
+def legacy_format_punct(text: str):
+    """The previous implementation of `format_punct`."""
+    text = text.strip()
+
+    if text[0].islower():
+        text = text[0].upper() + text[1:]
+    if text[-1] not in [".", "?", "!", ":", ";", ","]:
+        text += "."
+
+    text = text.replace("...", "")
+    text = text.replace(" ?", "?")
+    text = text.replace(" !", "!")
+    text = text.replace(" .", ".")
+    text = text.replace(" ,", ",")
+    text = text.replace(" :", ":")
+    text = text.replace(" ;", ";")
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\bi\b", "I", text)
+
+    return text.strip()
+
+
+def legacy_format_utterances(texts: List[str]) -> List[Optional[str]]:
+    """Format a transcript one utterance at a time with the previous functions."""
+    return [
+        None if legacy_is_empty_string(text) else legacy_format_punct(text)
+        for text in texts
+    ]
+
+
+def random_texts(seed: int, count: int = CASES) -> List[str]:
+    """Generate texts of 0 to 16 fragments of the alphabet."""
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 16)))
+        for _ in range(count)
+    ]
+
+
+def outcome(func: Callable, text: str) -> object:
+    """Return the result of a function, or the type of the exception it raised."""
+    try:
+        return func(text)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize(
+    "current, legacy",
+    [
+        (is_empty_string, legacy_is_empty_string),
+        (format_punct, legacy_format_punct),
+    ],
+)
+def test_matches_legacy_implementation(
+    current: Callable, legacy: Callable, seed: int
+) -> None:
+    """The functions return, or raise, exactly what they previously did."""
+    for text in random_texts(seed):
+        assert outcome(current, text) == outcome(legacy, text), repr(text)
+
+
+@pytest.mark.parametrize("text", ["", " ", "\t\n", "\u00a0\u2003"])
+def test_format_punct_of_blank_text_raises_index_error(text: str) -> None:
+    """Blank texts still raise an IndexError, like the previous implementation."""
+    with pytest.raises(IndexError):
+        legacy_format_punct(text)
+    with pytest.raises(IndexError):
+        format_punct(text)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_format_utterances_matches_legacy_implementation(seed: int) -> None:
+    """Batches are formatted like their utterances one at a time."""
+    texts = [text for text in random_texts(seed) if text.strip()] + ["", " . ", "..."]
+
+    assert format_utterances(texts) == legacy_format_utterances(texts)
@@ -0,0 +1,104 @@
+# Copyright 2024 The Wordcab Team. All rights reserved.
+#
+# Licensed under the MIT License (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://github.com/Wordcab/wordcab-transcribe/blob/main/LICENSE
+#
+# Except as expressly provided otherwise herein, and to the fullest
+# extent permitted by law, Licensor provides the Software (and each
+# Contributor provides its Contributions) AS IS, and Licensor
+# disclaims all warranties or guarantees of any kind, express or
+# implied, whether arising under any law or from any usage in trade,
+# or otherwise including but not limited to the implied warranties
+# of merchantability, non-infringement, quiet enjoyment, fitness
+# for a particular purpose, or otherwise.
+#
+# See the License for the specific language governing permissions
+# and limitations under the License.
+"""Tests of the webhook service, against a fake Svix client."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import List
+
+from my_project.services.webhook_service import WebhookService
+
+
+class FakeMessages:
+    """Fake Svix message API recording the sent events and the overlapping sends."""
+
+    def __init__(self, delay: float) -> None:
+        """Initialize the fake API."""
+        self.delay = delay
+        self.sent: List[str] = []
+        self.in_flight = set()
+        self.overlaps = 0
+
+    async def create(self, app_id: str, message) -> None:
+        """Record an event after a delay."""
+        job_id = message.payload["job_id"]
+        if job_id in self.in_flight:
+            self.overlaps += 1
+        self.in_flight.add(job_id)
+        await asyncio.sleep(self.delay)
+        self.in_flight.discard(job_id)
+        self.sent.append(f"{job_id}:{message.payload['status']}")
+
+
+async def run_service(updates, delay: float = 0.05, between: float = 0.0):
+    """Send the (job_id, status) updates with a fake client, return the fake."""
+    service = WebhookService("key", "app", 4, 0, 0.0)
+    service.start()
+    messages = FakeMessages(delay)
+    service.client = SimpleNamespace(message=messages)
+
+    for job_id, status in updates:
+        payload = {"job_id": job_id, "job_name": None, "status": status}
+        service.send(job_id, status, payload)
+        if between:
+            await asyncio.sleep(between)
+    await service.close()
+
+    return messages
+
+
+def test_updates_of_a_job_are_sent_in_order() -> None:
+    """An update queued while the previous one is sent waits for it."""
+    updates = [("job", "processing"), ("job", "finished")]
+
+    messages = asyncio.run(run_service(updates, between=0.01))
+
+    assert messages.sent == ["job:processing", "job:finished"]
+    assert messages.overlaps == 0
+
+
+def test_queued_update_is_replaced_by_newer_one() -> None:
+    """Only the latest of the updates waiting in the queue is sent."""
+    updates = [("job", "queued"), ("job", "processing"), ("job", "finished")]
+
+    messages = asyncio.run(run_service(updates))
+
+    assert messages.sent == ["job:finished"]
+
+
+def test_jobs_are_sent_concurrently() -> None:
+    """The updates of different jobs are sent by different workers."""
+    updates = [(f"job-{i}", "finished") for i in range(4)]
+
+    started = time.monotonic()
+    messages = asyncio.run(run_service(updates, delay=0.2))
+
+    assert time.monotonic() - started < 0.6
+    assert sorted(messages.sent) == [f"job-{i}:finished" for i in range(4)]
+
+
+def test_unnamed_jobs_are_not_merged() -> None:
+    """Jobs without a name each get their update, even when queued together."""
+    updates = [("job-1", "finished"), ("job-2", "finished")]
+
+    messages = asyncio.run(run_service(updates))
+
+    assert sorted(messages.sent) == ["job-1:finished", "job-2:finished"]